@@ -16,6 +16,8 @@ from routes.chatbot import chatbot_bp
 from routes.notifications import notifications_bp
 from routes.packs import packs_bp
 from routes.kyc import kyc_bp
+from tasks.analytics_task import start_analytics_worker
+from tasks.chat_history_task import start_chat_history_writer
 from flask_jwt_extended import JWTManager
 from flask_mail import Mail
 
@@ -38,6 +40,9 @@ def create_app():
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
     
+    # Configure cold storage for archived transaction periods
+    ARCHIVE_FOLDER = os.environ.get('ARCHIVE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archive'))
+    
     # Configure the app
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'your-secret-key')
     app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///bank.db')
@@ -46,6 +51,7 @@ def create_app():
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=1)
     app.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(days=30)
     app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    app.config['ARCHIVE_FOLDER'] = ARCHIVE_FOLDER
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
     app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', 'smtp.gmail.com')
     app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', 587))
@@ -79,6 +85,12 @@ def create_app():
     with app.app_context():
         db.create_all()
 
+    # Recompute user analytics in the background as transactions land
+    start_analytics_worker(app)
+
+    # Batch chatbot history inserts off the request path
+    start_chat_history_writer(app)
+
     @app.errorhandler(500)
     def handle_500_error(e):
         logger.error(f"500 error: {str(e)}")
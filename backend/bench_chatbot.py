@@ -0,0 +1,359 @@
+"""Chatbot micro-benchmarks.
+
+Run from the backend directory:
+    python bench_chatbot.py matcher [--iterations 20000]
+    python bench_chatbot.py contexts [--contexts 2000]
+    python bench_chatbot.py sentiment [--iterations 5000]
+    python bench_chatbot.py retrieval [--iterations 20000]
+    python bench_chatbot.py stream [--sessions 16] [--messages 25] [--sentiment textblob]
+    python bench_chatbot.py load [--mode direct|http] [--concurrency 8] [--messages 20000]
+                                 [--users 5000] [--max-p95-ms N]
+
+`load` is the regression harness: it replays the onboarding and paraphrase
+corpora through get_response (direct) or POST /api/chatbot/chat (http) and
+exits with status 1 when --max-p95-ms is exceeded.
+"""
+import argparse
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+import routes.chatbot as chatbot
+from routes.chatbot import FRENCH_KNOWLEDGE_BASE, FRENCH_MATCHER, ONBOARDING_KNOWLEDGE_BASE, KB_RETRIEVER
+from knowledge_base.matcher import normalize_text
+from knowledge_base.retrieval import KnowledgeBaseRetriever
+from knowledge_base.sentiment import get_sentiment_analyzer, LexiconSentimentAnalyzer, TextBlobSentimentAnalyzer
+from services.chat_context_store import MemoryContextStore, MAX_HISTORY
+
+# French onboarding questions as customers actually type them: accents or
+# not, capitalised or not, with or without punctuation.
+ONBOARDING_CORPUS = [
+    "bonjour",
+    "Salut",
+    "Je veux ouvrir un compte",
+    "comment creer un compte en ligne ?",
+    "Quel mot de passe choisir ?",
+    "je n'ai pas reçu le code sms",
+    "Je n'ai pas recu le code de verification",
+    "à quoi servent les questions de sécurité",
+    "Quelles informations personnelles dois-je remplir ?",
+    "je dois mettre le nom de mon père ?",
+    "Adresse de résidence",
+    "Je suis salarié, quel secteur choisir ?",
+    "ma date d'embauche",
+    "Comment envoyer ma pièce d'identité ?",
+    "je dois prendre un selfie ?",
+    "ma photo a été refusée",
+    "La qualité de la photo est mauvaise",
+    "Je dois accepter les conditions générales ?",
+    "c'est terminé ?",
+    "J'ai un problème, je suis bloqué",
+    "Quel est le numéro du support ?",
+    "Merci beaucoup",
+    "Combien coûte la carte CIB ?",
+    "Est-ce que je peux ouvrir un compte en devise",
+    "wach nkder n7el compte",
+    "je veux parler a un conseiller",
+]
+
+def legacy_match(text, knowledge_base):
+    """The pre-compilation matcher: one uncompiled re.search per category."""
+    for category, data in knowledge_base.items():
+        if re.search(data['pattern'], text.lower()):
+            return category
+    return 'fallback'
+
+def _throughput(match, messages):
+    start = time.perf_counter()
+    for message in messages:
+        match(message)
+    return len(messages) / (time.perf_counter() - start)
+
+def bench_matcher(args):
+    messages = (ONBOARDING_CORPUS * (args.iterations // len(ONBOARDING_CORPUS) + 1))[:args.iterations]
+
+    # re's internal cache is warm for the legacy path too, which flatters it
+    before = _throughput(lambda message: legacy_match(message, FRENCH_KNOWLEDGE_BASE), messages)
+    # "uncached" bypasses the memo so every message pays normalization and matching
+    uncached = _throughput(lambda message: FRENCH_MATCHER._match_uncached(normalize_text(message)), messages)
+    FRENCH_MATCHER._match_normalized.cache_clear()
+    cached = _throughput(FRENCH_MATCHER.match, messages)
+
+    print(f"legacy loop              : {before:12,.0f} messages/s")
+    print(f"compiled matcher         : {uncached:12,.0f} messages/s  ({uncached / before:.1f}x)")
+    print(f"compiled matcher + memo  : {cached:12,.0f} messages/s  ({cached / before:.1f}x)")
+
+    changed = [
+        (message, legacy_match(message, FRENCH_KNOWLEDGE_BASE), FRENCH_MATCHER.match(message))
+        for message in ONBOARDING_CORPUS
+        if legacy_match(message, FRENCH_KNOWLEDGE_BASE) != FRENCH_MATCHER.match(message)
+    ]
+    print(f"{len(ONBOARDING_CORPUS) - len(changed)}/{len(ONBOARDING_CORPUS)} corpus messages match the same category")
+    for message, old, new in changed:
+        print(f"  {message!r}: {old} -> {new}")
+
+def _fill_context(store, user_id, turns):
+    """Replay what get_response appends for each turn (sentiment and matching stubbed)."""
+    context = store.get(user_id)
+    for turn in range(turns):
+        message = ONBOARDING_CORPUS[turn % len(ONBOARDING_CORPUS)]
+        category, response = FRENCH_MATCHER.respond(message)
+        sentiment = {'polarity': 0.0, 'subjectivity': 0.0, 'mood': 'neutral'}
+        context['sentiment_history'].append({
+            'text': message,
+            'sentiment': sentiment,
+            'timestamp': datetime.now().isoformat()
+        })
+        context['conversation_history'].append({
+            'user_input': message,
+            'bot_response': response,
+            'category': category,
+            'sentiment': sentiment,
+            'timestamp': datetime.now().isoformat()
+        })
+        store.save(user_id, context)
+
+def bench_contexts(args):
+    for label, turns in (('fresh', 0), ('1 turn', 1), (f'{MAX_HISTORY} turns (full)', MAX_HISTORY),
+                         (f'{MAX_HISTORY * 4} turns (capped)', MAX_HISTORY * 4)):
+        store = MemoryContextStore(max_contexts=args.contexts)
+        tracemalloc.start()
+        baseline = tracemalloc.get_traced_memory()[0]
+        for user_id in range(args.contexts):
+            _fill_context(store, f'visitor-{user_id}', turns)
+        used = tracemalloc.get_traced_memory()[0] - baseline
+        tracemalloc.stop()
+        print(f"{label:<22}: {used / args.contexts / 1024:8.1f} KB per context")
+
+    store = MemoryContextStore(max_contexts=args.contexts // 2)
+    for user_id in range(args.contexts):
+        _fill_context(store, f'visitor-{user_id}', 1)
+    print(f"LRU bound {args.contexts // 2}: {len(store)} contexts kept after {args.contexts} visitors")
+
+def _latencies(score, messages):
+    latencies = []
+    for message in messages:
+        start = time.perf_counter()
+        score(message)
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return len(messages) / sum(latencies), latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)]
+
+def bench_sentiment(args):
+    messages = (ONBOARDING_CORPUS * (args.iterations // len(ONBOARDING_CORPUS) + 1))[:args.iterations]
+    textblob = TextBlobSentimentAnalyzer()
+    lexicon = LexiconSentimentAnalyzer()
+    uncached = LexiconSentimentAnalyzer(cache_size=0)
+
+    results = [
+        ('textblob', _latencies(textblob.score, messages)),
+        ('lexicon (no cache)', _latencies(uncached.score, messages)),
+        ('lexicon (cached)', _latencies(lexicon.score, messages)),
+    ]
+    for label, (throughput, p50, p99) in results:
+        print(f"{label:<20}: {throughput:12,.0f} messages/s   p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+    start = time.perf_counter()
+    LexiconSentimentAnalyzer().score_batch(messages)
+    print(f"{'lexicon batch':<20}: {len(messages) / (time.perf_counter() - start):12,.0f} messages/s")
+
+# Questions no intent pattern matches
+PARAPHRASE_CORPUS = [
+    "quels papiers faut-il fournir",
+    "je veux un compte courant",
+    "qui contacter",
+    "champs masques obligatoires",
+    "mon selfie ne passe pas",
+    "ou est ce que je mets mon employeur",
+    "les caracteres autorises dans le mot",
+    "comment contacter un conseiller",
+    "quel temps fait-il a oran",
+    "je cherche un appartement",
+]
+
+def bench_retrieval(args):
+    knowledge_bases = {'chatbot': FRENCH_KNOWLEDGE_BASE, 'onboarding': ONBOARDING_KNOWLEDGE_BASE}
+    start = time.perf_counter()
+    KnowledgeBaseRetriever(knowledge_bases)
+    print(f"index build      : {(time.perf_counter() - start) * 1e3:8.1f} ms  ({len(KB_RETRIEVER.idf)} terms, "
+          f"{len(KB_RETRIEVER.entries)} entries)")
+
+    messages = (PARAPHRASE_CORPUS * (args.iterations // len(PARAPHRASE_CORPUS) + 1))[:args.iterations]
+    throughput, p50, p99 = _latencies(KB_RETRIEVER.lookup, messages)
+    print(f"lookup           : {throughput:12,.0f} messages/s   p50 {p50 * 1e6:8.1f} us   p99 {p99 * 1e6:8.1f} us")
+
+    for message in PARAPHRASE_CORPUS:
+        retrieved = KB_RETRIEVER.lookup(message)
+        answer = f"{retrieved[0]} ({retrieved[2]:.2f})" if retrieved else 'fallback'
+        print(f"  {message!r}: {answer}")
+
+def create_bench_app():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'bench-chatbot-only-not-a-real-secret'
+    JWTManager(app)
+    app.register_blueprint(chatbot.chatbot_bp, url_prefix='/api/chatbot')
+    return app
+
+@lru_cache(maxsize=None)
+def _auth_headers(app, user_id):
+    """The chat endpoints key conversations by the JWT identity."""
+    with app.app_context():
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def _timed_request(client, endpoint, user_id, message):
+    """Return (time to first body chunk, time to last chunk) for one POST."""
+    start = time.perf_counter()
+    response = client.post(endpoint, json={'message': message}, headers=_auth_headers(client.application, user_id),
+                           buffered=False)
+    chunks = iter(response.response)
+    next(chunks)
+    first = time.perf_counter() - start
+    for _ in chunks:
+        pass
+    response.close()
+    return first, time.perf_counter() - start
+
+def bench_stream(args):
+    chatbot.SENTIMENT_ANALYZER = get_sentiment_analyzer(args.sentiment)
+    chatbot.analyze_sentiment(ONBOARDING_CORPUS[0])  # TextBlob loads its lexicon on first use
+    app = create_bench_app()
+
+    for endpoint in ('/api/chatbot/chat', '/api/chatbot/chat/stream'):
+        timings = []
+        timings_lock = threading.Lock()
+
+        def session(number):
+            client = app.test_client()
+            local = [
+                _timed_request(client, endpoint, f'load-{number}', ONBOARDING_CORPUS[(number + turn) % len(ONBOARDING_CORPUS)])
+                for turn in range(args.messages)
+            ]
+            with timings_lock:
+                timings.extend(local)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+            list(pool.map(session, range(args.sessions)))
+        elapsed = time.perf_counter() - start
+
+        first = [timing[0] for timing in timings]
+        total = [timing[1] for timing in timings]
+        print(f"{endpoint:<26} TTFB p50 {_percentile(first, 0.5) * 1e3:7.2f} ms  p95 {_percentile(first, 0.95) * 1e3:7.2f} ms   "
+              f"complete p50 {_percentile(total, 0.5) * 1e3:7.2f} ms  p95 {_percentile(total, 0.95) * 1e3:7.2f} ms   "
+              f"{len(timings) / elapsed:8,.0f} msg/s")
+
+def _run_load(send, args):
+    """Send args.messages messages from args.concurrency threads; return per-message latencies and elapsed time."""
+    corpus = ONBOARDING_CORPUS + PARAPHRASE_CORPUS
+    per_worker = args.messages // args.concurrency
+
+    def worker(number):
+        latencies = []
+        for turn in range(per_worker):
+            index = number * per_worker + turn
+            user_id = f'load-{index % args.users}'
+            message = corpus[index % len(corpus)]
+            start = time.perf_counter()
+            send(user_id, message)
+            latencies.append(time.perf_counter() - start)
+        return latencies
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(worker, range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    return [latency for latencies in results for latency in latencies], elapsed
+
+def bench_load(args):
+    chatbot.SENTIMENT_ANALYZER = get_sentiment_analyzer(args.sentiment)
+    chatbot.analyze_sentiment(ONBOARDING_CORPUS[0])
+
+    if args.mode == 'http':
+        app = create_bench_app()
+        clients = threading.local()
+
+        def send(user_id, message):
+            if not hasattr(clients, 'client'):
+                clients.client = app.test_client()
+            response = clients.client.post('/api/chatbot/chat', json={'message': message},
+                                           headers=_auth_headers(app, user_id))
+            if response.status_code != 200:
+                raise RuntimeError(response.get_data(as_text=True))
+    else:
+        def send(user_id, message):
+            chatbot.get_response(message, user_id)
+
+    # Timing pass, then the same load again under tracemalloc for memory
+    chatbot.user_contexts = MemoryContextStore()
+    latencies, elapsed = _run_load(send, args)
+
+    chatbot.user_contexts = MemoryContextStore()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    _run_load(send, args)
+    growth = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    contexts = len(chatbot.user_contexts)
+
+    p50, p95, p99 = (_percentile(latencies, fraction) for fraction in (0.5, 0.95, 0.99))
+    print(f"mode={args.mode} concurrency={args.concurrency} messages={len(latencies)} users={args.users} "
+          f"sentiment={args.sentiment}")
+    print(f"latency      : p50 {p50 * 1e3:8.3f} ms   p95 {p95 * 1e3:8.3f} ms   p99 {p99 * 1e3:8.3f} ms")
+    print(f"throughput   : {len(latencies) / elapsed:10,.0f} messages/s")
+    print(f"memory growth: {growth / 1024 / 1024:8.2f} MB for {contexts} contexts "
+          f"({growth / max(contexts, 1) / 1024:.1f} KB per context)")
+
+    if args.max_p95_ms is not None and p95 * 1e3 > args.max_p95_ms:
+        print(f"FAIL: p95 {p95 * 1e3:.3f} ms exceeds {args.max_p95_ms} ms")
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Chatbot micro-benchmarks')
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+
+    matcher_parser = subparsers.add_parser('matcher', help='intent matching throughput')
+    matcher_parser.add_argument('--iterations', type=int, default=20000)
+    matcher_parser.set_defaults(run=bench_matcher)
+
+    contexts_parser = subparsers.add_parser('contexts', help='memory held per conversation context')
+    contexts_parser.add_argument('--contexts', type=int, default=2000)
+    contexts_parser.set_defaults(run=bench_contexts)
+
+    sentiment_parser = subparsers.add_parser('sentiment', help='sentiment scoring throughput and latency')
+    sentiment_parser.add_argument('--iterations', type=int, default=5000)
+    sentiment_parser.set_defaults(run=bench_sentiment)
+
+    retrieval_parser = subparsers.add_parser('retrieval', help='TF-IDF fallback lookup latency')
+    retrieval_parser.add_argument('--iterations', type=int, default=20000)
+    retrieval_parser.set_defaults(run=bench_retrieval)
+
+    stream_parser = subparsers.add_parser('stream', help='time to first byte of /chat vs /chat/stream under concurrent sessions')
+    stream_parser.add_argument('--sessions', type=int, default=16)
+    stream_parser.add_argument('--messages', type=int, default=25)
+    stream_parser.add_argument('--sentiment', default='textblob', choices=['textblob', 'lexicon'])
+    stream_parser.set_defaults(run=bench_stream)
+
+    load_parser = subparsers.add_parser('load', help='concurrent load on get_response or /chat with latency percentiles')
+    load_parser.add_argument('--mode', default='direct', choices=['direct', 'http'])
+    load_parser.add_argument('--concurrency', type=int, default=8)
+    load_parser.add_argument('--messages', type=int, default=20000)
+    load_parser.add_argument('--users', type=int, default=5000, help='distinct chatbot user ids')
+    load_parser.add_argument('--sentiment', default='lexicon', choices=['textblob', 'lexicon'])
+    load_parser.add_argument('--max-p95-ms', type=float, default=None, help='fail when p95 latency exceeds this')
+    load_parser.set_defaults(run=bench_load)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""Compare FacePipeline (downscaled detection, ROI encoding) with full-resolution face_encodings.
+
+Run from the backend directory:
+    python bench_face_pipeline.py [--repeat 3] [--face photo.jpg] [--images a.jpg b.jpg ...]
+
+By default a portrait (matplotlib's Grace Hopper sample, or --face) is
+composed into a 4000x3000 selfie and into an ID card lying on a desk, as a
+phone would shoot them. --images times real photos instead. For each image:
+latency of both paths (best of --repeat), the distance between their two
+encodings, and, for the synthetic scenes, each path's distance to the
+encoding of the source portrait (face_recognition matches below 0.6).
+"""
+import argparse
+import os
+import time
+import cv2
+import face_recognition
+import matplotlib
+import numpy as np
+from services.face_pipeline import FacePipeline
+
+def legacy_encode(data):
+    """register_face / verify_face / KYCChecker before FacePipeline."""
+    import io
+    encodings = face_recognition.face_encodings(face_recognition.load_image_file(io.BytesIO(data)))
+    return encodings[0] if encodings else None
+
+def compose_scenes(face_path):
+    face = cv2.imread(face_path)
+    scenes = {}
+
+    # Selfie: the face fills a good part of a 3000x4000 portrait frame
+    selfie = cv2.resize(face, (3000, int(3000 * face.shape[0] / face.shape[1])), interpolation=cv2.INTER_CUBIC)
+    canvas = np.full((4000, 3000, 3), 180, np.uint8)
+    top = (4000 - selfie.shape[0]) // 2
+    canvas[max(0, top):max(0, top) + min(4000, selfie.shape[0])] = selfie[:4000]
+    scenes['selfie 3000x4000'] = canvas
+
+    # ID card: a light card on a desk with the portrait on its left, ~400 px wide
+    desk = np.full((3000, 4000, 3), (95, 105, 115), np.uint8)
+    cv2.rectangle(desk, (500, 600), (3500, 2500), (222, 226, 230), -1)
+    portrait = cv2.resize(face, (520, int(520 * face.shape[0] / face.shape[1])), interpolation=cv2.INTER_AREA)
+    desk[900:900 + portrait.shape[0], 700:700 + portrait.shape[1]] = portrait
+    for line in range(6):
+        cv2.putText(desk, 'REPUBLIQUE ALGERIENNE 19/04/1990', (1500, 1000 + 220 * line),
+                    cv2.FONT_HERSHEY_SIMPLEX, 2.5, (30, 30, 30), 5)
+    scenes['id card 4000x3000'] = desk
+    return scenes
+
+def best_time(encode, data, repeat):
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = encode(data)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def distance(a, b):
+    if a is None or b is None:
+        return float('nan')
+    return float(np.linalg.norm(np.asarray(a, np.float64) - np.asarray(b, np.float64)))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--face', default=os.path.join(matplotlib.get_data_path(), 'sample_data', 'grace_hopper.jpg'))
+    parser.add_argument('--images', nargs='*', help='real photos to time instead of the synthetic scenes')
+    args = parser.parse_args()
+
+    if args.images:
+        inputs = {os.path.basename(path): open(path, 'rb').read() for path in args.images}
+        reference = None
+    else:
+        inputs = {
+            name: cv2.imencode('.jpg', scene, [cv2.IMWRITE_JPEG_QUALITY, 92])[1].tobytes()
+            for name, scene in compose_scenes(args.face).items()
+        }
+        reference = legacy_encode(open(args.face, 'rb').read())
+
+    print(f"{'image':<20} {'full-res ms':>11} {'pipeline ms':>11} {'speedup':>8} "
+          f"{'full vs pipe':>12} {'full vs ref':>11} {'pipe vs ref':>11}")
+    for name, data in inputs.items():
+        legacy_time, legacy = best_time(legacy_encode, data, args.repeat)
+        pipeline_time, (encoding, _) = best_time(FacePipeline.encode, data, args.repeat)
+        print(f"{name:<20} {legacy_time * 1e3:11.0f} {pipeline_time * 1e3:11.0f} {legacy_time / pipeline_time:7.1f}x "
+              f"{distance(legacy, encoding):12.3f} {distance(legacy, reference):11.3f} {distance(encoding, reference):11.3f}")
+
+if __name__ == '__main__':
+    main()
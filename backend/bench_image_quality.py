@@ -0,0 +1,108 @@
+"""Compare the tiered ImageQualityService with the previous fastNlMeansDenoising check.
+
+Run from the backend directory:
+    python bench_image_quality.py [--size 4000x3000] [--repeat 3]
+
+A synthetic ID-card photo is rendered and degraded (blur, noise, exposure,
+glare, low resolution); every variant is saved as JPEG and timed through both
+checks, best of --repeat runs.
+"""
+import argparse
+import os
+import tempfile
+import time
+import cv2
+import numpy as np
+from services.image_quality import ImageQualityService
+
+def legacy_check_image_quality(image_path):
+    """routes/verification.check_image_quality before the tiered analyzer."""
+    img = cv2.imread(image_path)
+    if img is None:
+        return False, "Invalid image file"
+    height, width = img.shape[:2]
+    if width < 800 or height < 600:
+        return False, "Image resolution too low"
+    laplacian_var = cv2.Laplacian(img, cv2.CV_64F).var()
+    if laplacian_var < 100:
+        return False, "Image is too blurry"
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    noise = cv2.fastNlMeansDenoising(gray)
+    noise_level = np.mean(np.abs(gray - noise))
+    if noise_level > 20:
+        return False, "Image has too much noise"
+    return True, "Image quality is good"
+
+def render_document(width, height):
+    """A card on a desk: mid-grey background, light card, dark text lines and a photo box."""
+    rng = np.random.default_rng(0)
+    img = np.full((height, width, 3), (95, 105, 115), np.uint8)
+    x0, y0, x1, y1 = width // 10, height // 8, width * 9 // 10, height * 7 // 8
+    cv2.rectangle(img, (x0, y0), (x1, y1), (222, 226, 230), -1)
+    cv2.rectangle(img, (x0 + width // 30, y0 + height // 12), (x0 + width // 4, y1 - height // 12), (120, 110, 100), -1)
+    scale = width / 1300
+    for line in range(8):
+        y = y0 + int((line + 1.5) * (y1 - y0) / 10)
+        cv2.putText(img, 'REPUBLIQUE ALGERIENNE 19/04/1990 ALGER', (x0 + width // 3, y),
+                    cv2.FONT_HERSHEY_SIMPLEX, scale, (30, 30, 30), max(1, int(2 * scale)))
+    # Mild sensor noise, as on any phone photo
+    noise = rng.normal(0, 2, img.shape)
+    return np.clip(img + noise, 0, 255).astype(np.uint8)
+
+def degrade(img):
+    rng = np.random.default_rng(1)
+    height, width = img.shape[:2]
+    # A soft saturated hotspot, as from a flash on a laminated card
+    mask = np.zeros((height, width), np.float32)
+    cv2.circle(mask, (width // 2, height // 2), min(width, height) // 4, 1.0, -1)
+    mask = cv2.GaussianBlur(mask, (0, 0), min(width, height) / 40)[..., None]
+    glare = (img * (1 - mask) + 255 * mask).astype(np.uint8)
+
+    def noisy(sigma):
+        return np.clip(img + rng.normal(0, sigma, img.shape), 0, 255).astype(np.uint8)
+
+    return {
+        'sharp': img,
+        'noise sigma 8': noisy(8),
+        'noise sigma 35': noisy(35),
+        'blurred': cv2.GaussianBlur(img, (0, 0), 6),
+        'dark': (img * 0.2).astype(np.uint8),
+        'overexposed': np.clip(img.astype(np.int16) + 130, 0, 255).astype(np.uint8),
+        'glare': glare,
+        'low resolution': cv2.resize(img, (640, 480), interpolation=cv2.INTER_AREA),
+    }
+
+def best_time(check, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = check(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size', default='4000x3000', help='photo size WIDTHxHEIGHT')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.size.split('x'))
+
+    with tempfile.TemporaryDirectory() as folder:
+        print(f"{'image':<16} {'legacy ms':>10} {'tiered ms':>10}  {'legacy verdict':<26} {'tiered verdict':<26} {'score':>6}")
+        legacy_total = tiered_total = 0.0
+        for name, img in degrade(render_document(width, height)).items():
+            path = os.path.join(folder, name.replace(' ', '_') + '.jpg')
+            cv2.imwrite(path, img, [cv2.IMWRITE_JPEG_QUALITY, 92])
+
+            legacy_time, (_, legacy_message) = best_time(legacy_check_image_quality, path, args.repeat)
+            tiered_time, report = best_time(ImageQualityService.analyze, path, args.repeat)
+            legacy_total += legacy_time
+            tiered_total += tiered_time
+            print(f"{name:<16} {legacy_time * 1e3:10.1f} {tiered_time * 1e3:10.1f}  "
+                  f"{legacy_message:<26} {report['message']:<26} {report['score']:6.1f}")
+        print(f"{'total':<16} {legacy_total * 1e3:10.1f} {tiered_total * 1e3:10.1f}  "
+              f"({legacy_total / tiered_total:.0f}x faster)")
+
+if __name__ == '__main__':
+    main()
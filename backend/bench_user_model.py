@@ -0,0 +1,116 @@
+"""Measure what loading a User row costs with and without the deferred column groups.
+
+Run from the backend directory:
+    python bench_user_model.py [--users 2000] [--requests 5000]
+
+"before" forces every column to load (undefer('*')), which is what every
+User.query.get() did before the profile/biometric/activity groups were
+deferred. "after" is the default load used by login and JWT-protected routes.
+"""
+import argparse
+import pickle
+import random
+import time
+from datetime import date, datetime
+from flask import Flask
+from sqlalchemy import inspect
+from sqlalchemy.orm import undefer
+from extensions import db
+from models import User, FamilyStatusEnum, ProfessionEnum, SalaryRangeEnum
+
+def create_bench_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+def populate(count):
+    for i in range(count):
+        db.session.add(User(
+            username=f'user{i}',
+            email=f'user{i}@example.com',
+            password_hash='x' * 102,
+            first_name='Amine',
+            last_name='Benali',
+            phone='+213555000000',
+            revenue=85000.0,
+            wilaya='Alger',
+            birth_date=date(1990, 1, 1),
+            birth_place='Alger Centre',
+            family_status=FamilyStatusEnum.MARIE,
+            father_first_name='Mohamed',
+            father_last_name='Benali',
+            mother_first_name='Fatima',
+            mother_last_name='Khelifi',
+            birth_country='Algérie',
+            birth_wilaya='Alger',
+            birth_city='Alger Centre',
+            nationality='Algérienne',
+            address_street='12 rue Didouche Mourad, Résidence des Pins',
+            address_wilaya='Alger',
+            address_city='Sidi MHamed',
+            address_postal_code='16000',
+            address_country='Algérie',
+            profession=ProfessionEnum.EMPLOYE_PRIVE,
+            employer='Entreprise SPA',
+            salary_range=SalaryRangeEnum.DE_60K_100K,
+            hire_date=date(2015, 9, 1),
+            face_embedding=[random.uniform(-0.3, 0.3) for _ in range(128)],
+            last_activity=datetime.utcnow(),
+            total_transactions=42,
+            total_volume=125000.0
+        ))
+    db.session.commit()
+
+def loaded_row_size(user):
+    """Approximate bytes held by the attributes that were actually loaded."""
+    state = inspect(user)
+    size = 0
+    for key in state.mapper.column_attrs.keys():
+        if key in state.unloaded:
+            continue
+        value = state.dict.get(key)
+        if value is None:
+            continue
+        if isinstance(value, (list, dict)):
+            size += len(pickle.dumps(value))
+        else:
+            size += len(str(value).encode('utf-8'))
+    return size
+
+def measure(label, query, user_count, request_count):
+    ids = [random.randint(1, user_count) for _ in range(request_count)]
+
+    db.session.expunge_all()
+    sizes = [loaded_row_size(query.get(i)) for i in ids[:200]]
+
+    # Best of three passes, each request starting from an empty identity map
+    best = None
+    for _ in range(3):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        for user_id in ids:
+            query.get(user_id)
+            db.session.expunge_all()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{label:<8} row size: {sum(sizes) / len(sizes):8.1f} bytes   "
+          f"per-request lookup: {best / request_count * 1e6:8.1f} us")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=5000)
+    args = parser.parse_args()
+
+    app = create_bench_app()
+    with app.app_context():
+        db.create_all()
+        populate(args.users)
+        measure('before', User.query.options(undefer('*')), args.users, args.requests)
+        measure('after', User.query, args.users, args.requests)
+
+if __name__ == '__main__':
+    main()
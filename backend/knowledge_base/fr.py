@@ -1,6 +1,9 @@
+from knowledge_base.matcher import IntentMatcher
+
 FRENCH_KNOWLEDGE_BASE = {
     'greeting': {
         'pattern': r'^(bonjour|salut|hello|hi|hey|salam)$',
+        'keywords': ['bonjour', 'salut', 'hello', 'hi', 'hey', 'salam'],
         'response': '''Bonjour! Je suis l'assistant virtuel d'AGB. Je peux vous aider avec:
 
 1. Informations personnelles
@@ -13,6 +16,7 @@ Comment puis-je vous aider aujourd'hui?'''
     },
     'personal_info': {
         'pattern': r'(informations|personnelles|données|personnelles)',
+        'keywords': ['informations', 'personnelles', 'données'],
         'response': '''Pour ouvrir un compte, nous avons besoin des informations suivantes:
 
 1. Situation familiale:
@@ -47,6 +51,7 @@ Souhaitez-vous que je vous guide pour remplir ces informations?'''
     },
     'professional_info': {
         'pattern': r'(profession|travail|emploi|activité)',
+        'keywords': ['profession', 'travail', 'emploi', 'activité'],
         'response': '''Voici les informations professionnelles requises:
 
 1. Profession:
@@ -93,6 +98,7 @@ Voulez-vous que je vous explique les champs conditionnels?'''
     },
     'conditional_fields': {
         'pattern': r'(conditionnel|masqué|caché|visible)',
+        'keywords': ['conditionnel', 'masqué', 'caché', 'visible'],
         'response': '''Voici comment fonctionnent les champs conditionnels:
 
 1. Pour les salariés uniquement:
@@ -113,6 +119,7 @@ Avez-vous des questions sur un champ particulier?'''
     },
     'documents': {
         'pattern': r'(documents|papiers|justificatifs)',
+        'keywords': ['documents', 'papiers', 'justificatifs'],
         'response': '''Documents requis selon votre situation:
 
 1. Pour tous:
@@ -138,6 +145,7 @@ Avez-vous besoin d'aide pour préparer ces documents?'''
     },
     'account_opening': {
         'pattern': r'(ouvrir|créer|nouveau).*(compte)',
+        'keywords': ['compte'],
         'response': '''Pour ouvrir un compte, suivez ces étapes:
 
 1. Remplissez le formulaire en ligne avec:
@@ -167,4 +175,6 @@ Voulez-vous commencer le processus d'ouverture de compte?'''
 
 Pouvez-vous reformuler votre question?'''
     }
-} 
\ No newline at end of file
+} 
+
+FRENCH_MATCHER = IntentMatcher(FRENCH_KNOWLEDGE_BASE)
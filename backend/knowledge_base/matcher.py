@@ -0,0 +1,140 @@
+"""
+Compiled intent matcher for the chatbot knowledge bases.
+
+A knowledge base maps a category to a regex 'pattern' and a 'response', and
+the first category (in dict order) whose pattern is found in the message
+wins. An optional 'keywords' list names literal strings at least one of which
+occurs in every message the pattern matches; IntentMatcher refuses a
+knowledge base where that does not provably hold. IntentMatcher compiles the whole
+knowledge base once at load time so a message is normalized once, instead of
+being lowercased and searched with an uncompiled pattern for every category.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+
+try:
+    from re import _parser as _regex_parser  # Python 3.11+
+except ImportError:
+    import sre_parse as _regex_parser
+
+FALLBACK_CATEGORY = 'fallback'
+
+def _build_normalization_table():
+    """str.translate table folding accented Latin letters and curly apostrophes."""
+    table = {ord(quote): "'" for quote in '’‘ʼ'}
+    for code_point in range(0xC0, 0x250):
+        char = chr(code_point)
+        base = ''.join(c for c in unicodedata.normalize('NFKD', char) if not unicodedata.combining(c))
+        if base and base != char:
+            table[code_point] = base
+    return table
+
+_NORMALIZATION_TABLE = _build_normalization_table()
+
+def fold_accents(text):
+    """Unify apostrophes and strip accents (é -> e, ç -> c), leaving the case alone."""
+    return text if text.isascii() else text.translate(_NORMALIZATION_TABLE)
+
+def normalize_text(text):
+    """Lowercase, unify apostrophes and strip accents (é -> e, ç -> c)."""
+    return fold_accents(text.casefold()).strip()
+
+_PATTERN_TOKEN = re.compile(r'\\.|[^\\]+', re.DOTALL)
+
+def normalize_pattern(pattern):
+    """normalize_text for a regex source: escapes (\\S, \\W, \\B, ...) are kept as written."""
+    return ''.join(
+        token if token.startswith('\\') else fold_accents(token.casefold())
+        for token in _PATTERN_TOKEN.findall(pattern)
+    )
+
+def _keywords_cover(items, keywords):
+    """Whether every text matching a parsed regex contains one of the keywords.
+
+    Conservative: runs of consecutive literals must contain a keyword, an
+    alternation needs every branch covered, and an optional item covers
+    nothing. Zero-width assertions (^, $, \\b) do not break a literal run.
+    """
+    run = []
+    for op, av in items:
+        if op is _regex_parser.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is _regex_parser.AT:
+            continue
+        if any(keyword in ''.join(run) for keyword in keywords):
+            return True
+        run = []
+        if op is _regex_parser.SUBPATTERN:
+            covered = _keywords_cover(av[-1], keywords)
+        elif op is _regex_parser.BRANCH:
+            covered = all(_keywords_cover(branch, keywords) for branch in av[1])
+        elif op in (_regex_parser.MAX_REPEAT, _regex_parser.MIN_REPEAT):
+            covered = av[0] >= 1 and _keywords_cover(av[2], keywords)
+        else:
+            covered = False
+        if covered:
+            return True
+    return any(keyword in ''.join(run) for keyword in keywords)
+
+class IntentMatcher:
+    """Priority-preserving matcher compiled once from a knowledge base.
+
+    At load time every pattern is normalized outside its escapes (casefolding
+    \\S or \\W would turn them into different escapes) and compiled;
+    re.IGNORECASE was measured about 20% slower on the corpus. Keywords are
+    normalized like messages. Matching a message normalizes it once, then walks the
+    categories in knowledge-base order. A category with keywords only runs
+    its regex when one of them occurs in the message, which is a plain
+    substring test. First-match-wins semantics are unchanged. Results
+    are memoized on the normalized text, because customers repeat the same
+    phrasings a lot.
+
+    A single combined alternation regex (named groups, or a keyword trie
+    emitted as one regex) was measured slower than this in CPython's
+    backtracking re engine, so it is not used.
+    """
+
+    def __init__(self, knowledge_base, fallback=FALLBACK_CATEGORY, cache_size=4096):
+        self.knowledge_base = knowledge_base
+        self.fallback = fallback
+
+        # (category, required keywords or None, compiled pattern) in priority order
+        self._entries = []
+        for category, data in knowledge_base.items():
+            if category == fallback:
+                continue
+            keywords = data.get('keywords')
+            if keywords:
+                keywords = tuple(sorted({normalize_text(keyword) for keyword in keywords}, key=len))
+            pattern = normalize_pattern(data['pattern'])
+            # A keyword list out of step with its pattern would silently drop matches
+            if keywords and not _keywords_cover(_regex_parser.parse(pattern), keywords):
+                raise ValueError(
+                    f"Keywords of category '{category}' do not cover every alternative of its pattern"
+                )
+            self._entries.append((category, keywords or None, re.compile(pattern)))
+
+        self._match_normalized = lru_cache(maxsize=cache_size)(self._match_uncached)
+
+    def _match_uncached(self, normalized_text):
+        for category, keywords, pattern in self._entries:
+            if keywords is not None:
+                for keyword in keywords:
+                    if keyword in normalized_text:
+                        break
+                else:
+                    continue
+            if pattern.search(normalized_text):
+                return category
+        return self.fallback
+
+    def match(self, text, normalized=False):
+        """Return the matching category for a message, or the fallback category."""
+        return self._match_normalized(text if normalized else normalize_text(text))
+
+    def respond(self, text, normalized=False):
+        """Return (category, response) for a message."""
+        category = self.match(text, normalized)
+        return category, self.knowledge_base[category]['response']
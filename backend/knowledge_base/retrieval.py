@@ -0,0 +1,152 @@
+"""
+TF-IDF retrieval over the chatbot knowledge bases.
+
+Used when no intent pattern matches: the message is compared with every
+knowledge-base entry (category name, pattern keywords and response text)
+and the closest entry answers if its cosine similarity clears a threshold.
+
+The TF-IDF weights are fitted once with scikit-learn, then flattened into an
+inverted index (term -> postings of (entry, weight)), so a lookup is a sparse
+dot product over the handful of terms in the message, done in pure Python
+without going through the vectorizer. The fitted index can be pickled to
+CHATBOT_RETRIEVAL_INDEX and is reused as long as the knowledge bases and the
+analyzer settings are unchanged; an unreadable file is rebuilt.
+"""
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import tempfile
+from collections import defaultdict
+from sklearn.feature_extraction.text import TfidfVectorizer
+from knowledge_base.matcher import normalize_text, FALLBACK_CATEGORY
+
+DEFAULT_THRESHOLD = 0.15
+# Bump when analyze() or the index layout changes in a way the settings below do not show
+INDEX_VERSION = 1
+# Crude French stemming: contacter/contact, caracteres/caractere share a term
+STEM_LENGTH = 5
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]{2,}")
+PATTERN_SYNTAX = re.compile(r"[^\w\s']+")
+
+# Function words that would otherwise link unrelated entries
+STOP_WORDS = frozenset("""
+    au aux avec ce ces cette dans de des du elle en et il ils je la le les leur lui ma mais me mes
+    moi mon ne nos notre nous on ou par pas pour qu que qui sa se ses si son sur ta te tes toi ton
+    tu un une vos votre vous est sont ai as avez avons etre avoir fait faire peux peut puis dois
+    doit comment quoi quel quelle quels quelles ici tout tous toutes plus tres bien aussi
+    the is are to of and or in on for my your it how what do does can
+""".split())
+
+def analyze(text):
+    """Normalized, truncated unigrams and bigrams, stop words dropped."""
+    words = [word[:STEM_LENGTH] for word in TOKEN_PATTERN.findall(normalize_text(text)) if word not in STOP_WORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+def _entry_text(category, data):
+    keywords = PATTERN_SYNTAX.sub(' ', data['pattern'].replace('|', ' '))
+    return ' '.join((category.replace('_', ' '), keywords, keywords, data['response']))
+
+def _fingerprint(knowledge_bases):
+    """Hash of the knowledge bases and the analyzer settings the index was built with."""
+    settings = {
+        'version': INDEX_VERSION,
+        'stem_length': STEM_LENGTH,
+        'stop_words': sorted(STOP_WORDS),
+        'token_pattern': TOKEN_PATTERN.pattern,
+        'pattern_syntax': PATTERN_SYNTAX.pattern,
+    }
+    payload = json.dumps({'settings': settings, 'knowledge_bases': knowledge_bases}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+class KnowledgeBaseRetriever:
+    """Nearest knowledge-base entry by TF-IDF cosine similarity."""
+
+    def __init__(self, knowledge_bases, threshold=DEFAULT_THRESHOLD):
+        """knowledge_bases: {source name: knowledge base}, searched together."""
+        self.threshold = threshold
+        self.fingerprint = _fingerprint(knowledge_bases)
+
+        # (source, category, response), one per non-fallback entry
+        self.entries = []
+        documents = []
+        for source, knowledge_base in knowledge_bases.items():
+            for category, data in knowledge_base.items():
+                if category == FALLBACK_CATEGORY:
+                    continue
+                self.entries.append((source, category, data['response']))
+                documents.append(_entry_text(category, data))
+
+        vectorizer = TfidfVectorizer(analyzer=analyze, sublinear_tf=True)
+        matrix = vectorizer.fit_transform(documents).tocsc()
+
+        self.idf = {}
+        self.postings = {}
+        for term, column in vectorizer.vocabulary_.items():
+            start, end = matrix.indptr[column], matrix.indptr[column + 1]
+            self.idf[term] = float(vectorizer.idf_[column])
+            self.postings[term] = tuple(zip(matrix.indices[start:end].tolist(), matrix.data[start:end].tolist()))
+
+    def _query_weights(self, text):
+        counts = defaultdict(int)
+        for term in analyze(text):
+            if term in self.idf:
+                counts[term] += 1
+        weights = {term: (1.0 + math.log(count)) * self.idf[term] for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        return {term: weight / norm for term, weight in weights.items()} if norm else {}
+
+    def scores(self, text):
+        """Cosine similarity of the message with every entry that shares a term."""
+        scores = defaultdict(float)
+        for term, weight in self._query_weights(text).items():
+            for entry, entry_weight in self.postings[term]:
+                scores[entry] += weight * entry_weight
+        return scores
+
+    def lookup(self, text):
+        """Return (category, response, score) for the best entry, or None below the threshold."""
+        scores = self.scores(text)
+        if not scores:
+            return None
+        entry, score = max(scores.items(), key=lambda item: item[1])
+        if score < self.threshold:
+            return None
+        _, category, response = self.entries[entry]
+        return category, response, score
+
+    def save(self, path):
+        """Pickle the index through a temporary file, so a reader never sees a partial one."""
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+        except Exception:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+    @classmethod
+    def load_or_build(cls, knowledge_bases, path=None, threshold=DEFAULT_THRESHOLD):
+        """Reuse the pickled index at `path` when it was built from the same knowledge bases."""
+        if path and os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    retriever = pickle.load(f)
+            except Exception:
+                # Truncated or from an incompatible version: rebuild it below
+                retriever = None
+            if isinstance(retriever, cls) and retriever.fingerprint == _fingerprint(knowledge_bases):
+                retriever.threshold = threshold
+                return retriever
+
+        retriever = cls(knowledge_bases, threshold=threshold)
+        if path:
+            retriever.save(path)
+        return retriever
@@ -0,0 +1,167 @@
+"""
+Sentiment backends for the chatbot.
+
+Every backend exposes score(text) -> {'polarity', 'subjectivity', 'mood'}
+and score_batch(texts) -> list of the same, so get_response and analytics
+jobs do not care which one is configured (CHATBOT_SENTIMENT_BACKEND).
+
+LexiconSentimentAnalyzer is the default. It is a French / Darja (Latin
+transliteration) / basic English word list, scored on the same normalized
+text as the intent matcher and memoized per normalized message.
+TextBlobSentimentAnalyzer keeps the previous behaviour (TextBlob's English
+pattern analyzer) for comparison.
+"""
+import os
+import re
+from functools import lru_cache
+from knowledge_base.matcher import normalize_text
+
+POSITIVE_THRESHOLD = 0.3
+NEGATIVE_THRESHOLD = -0.3
+
+# Keys are normalized (lowercase, no accents); values are polarities in [-1, 1]
+LEXICON = {
+    # French
+    'merci': 0.6, 'parfait': 1.0, 'excellent': 1.0, 'super': 0.8, 'genial': 0.9,
+    'bien': 0.5, 'bon': 0.5, 'bonne': 0.5, 'satisfait': 0.8, 'satisfaite': 0.8,
+    'content': 0.7, 'contente': 0.7, 'ravi': 0.9, 'ravie': 0.9, 'top': 0.7,
+    'facile': 0.5, 'rapide': 0.4, 'clair': 0.4, 'pratique': 0.5, 'aime': 0.6,
+    'adore': 0.9, 'bravo': 0.8, 'formidable': 0.9, 'agreable': 0.6, 'efficace': 0.6,
+    'mauvais': -0.7, 'mauvaise': -0.7, 'nul': -0.8, 'nulle': -0.8, 'terrible': -0.9,
+    'horrible': -1.0, 'decu': -0.7, 'decue': -0.7, 'decevant': -0.7, 'probleme': -0.4,
+    'bloque': -0.5, 'bloquee': -0.5, 'lent': -0.5, 'lente': -0.5, 'erreur': -0.4,
+    'impossible': -0.6, 'difficile': -0.4, 'complique': -0.4, 'compliquee': -0.4,
+    'inacceptable': -0.9, 'arnaque': -1.0, 'honte': -0.8, 'marre': -0.8, 'enerve': -0.7,
+    'enervee': -0.7, 'colere': -0.8, 'inadmissible': -0.9, 'pire': -0.9, 'refuse': -0.4,
+    'refusee': -0.4, 'insatisfait': -0.8, 'insatisfaite': -0.8, 'dommage': -0.4,
+    # Darja (Latin transliteration)
+    'mli7': 0.7, 'mlih': 0.7, 'mle7': 0.7, 'mliha': 0.7, 'saha': 0.6, 'sahit': 0.7,
+    'baraka': 0.6, 'barakallah': 0.7, 'ya3tik': 0.6, 'yatik': 0.6, '3jebni': 0.8,
+    'zwin': 0.7, 'zwina': 0.7, 'hbel': 0.8, 'nadi': 0.8,
+    'khayeb': -0.7, 'khayba': -0.7, 'khayb': -0.7, 'ghalta': -0.5, 'mochkil': -0.5,
+    'mouchkil': -0.5, 'machakil': -0.5, '9alaq': -0.6, 'qalaq': -0.6, 'zaafan': -0.8,
+    'za3fan': -0.8, 'mkhalta': -0.4, 'hchouma': -0.8, 'chouma': -0.8, 'ghaleb': -0.3,
+    'ta3ebni': -0.6, 'dewekh': -0.5, 'dwakh': -0.5,
+    # English, common in mixed messages
+    'thanks': 0.6, 'thank': 0.6, 'good': 0.6, 'great': 0.8, 'perfect': 1.0,
+    'nice': 0.6, 'love': 0.8, 'bad': -0.7, 'awful': -1.0, 'worst': -1.0,
+    'problem': -0.4, 'slow': -0.5, 'wrong': -0.5, 'hate': -0.9,
+}
+
+# Flip the polarity of the next sentiment word within NEGATION_WINDOW tokens
+NEGATORS = frozenset({
+    'ne', 'n', 'pas', 'jamais', 'rien', 'aucun', 'aucune', 'sans',
+    'mach', 'machi', 'mahich', 'mech', 'mch', 'mouch',
+    'not', 'no', 'never', 'don', 'didn', 'isn',
+})
+NEGATION_WINDOW = 3
+
+# Lexicon words are always scored and never read as intensifiers, so none belongs here too
+INTENSIFIERS = {
+    'tres': 1.5, 'trop': 1.4, 'vraiment': 1.5, 'tellement': 1.5,
+    'beaucoup': 1.3, 'bezzaf': 1.5, 'bzaf': 1.5, 'bezaf': 1.5, 'ktir': 1.4,
+    'very': 1.5, 'really': 1.5, 'so': 1.3,
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+def _mood(polarity):
+    if polarity > POSITIVE_THRESHOLD:
+        return "positive"
+    if polarity < NEGATIVE_THRESHOLD:
+        return "negative"
+    return "neutral"
+
+class LexiconSentimentAnalyzer:
+    """Word-list scorer memoized on the normalized message."""
+
+    def __init__(self, lexicon=LEXICON, cache_size=8192):
+        self.lexicon = lexicon
+        self._score_normalized = lru_cache(maxsize=cache_size)(self._score_uncached)
+
+    def _score_uncached(self, normalized_text):
+        tokens = TOKEN_PATTERN.findall(normalized_text)
+        if not tokens:
+            return 0.0, 0.0
+
+        total = 0.0
+        hits = 0
+        negation = 0
+        boost = 1.0
+        for token in tokens:
+            value = self.lexicon.get(token)
+            if value is not None:
+                value *= boost
+                if negation:
+                    value = -value * 0.8
+                total += value
+                hits += 1
+                negation = 0
+                boost = 1.0
+                continue
+
+            if token in NEGATORS:
+                negation = NEGATION_WINDOW
+            else:
+                boost = INTENSIFIERS.get(token, boost)
+                if negation:
+                    negation -= 1
+
+        if not hits:
+            return 0.0, 0.0
+        polarity = max(-1.0, min(1.0, total / hits))
+        subjectivity = min(1.0, hits / len(tokens) * 2)
+        return polarity, subjectivity
+
+    def score(self, text):
+        polarity, subjectivity = self._score_normalized(normalize_text(text))
+        return {
+            'polarity': polarity,
+            'subjectivity': subjectivity,
+            'mood': _mood(polarity)
+        }
+
+    def score_batch(self, texts):
+        """Score many messages, computing each distinct normalized text once."""
+        scored = {}
+        results = []
+        for text in texts:
+            normalized = normalize_text(text)
+            if normalized not in scored:
+                scored[normalized] = self._score_normalized(normalized)
+            polarity, subjectivity = scored[normalized]
+            results.append({
+                'polarity': polarity,
+                'subjectivity': subjectivity,
+                'mood': _mood(polarity)
+            })
+        return results
+
+class TextBlobSentimentAnalyzer:
+    """The original per-message TextBlob scorer."""
+
+    def score(self, text):
+        from textblob import TextBlob
+
+        analysis = TextBlob(text)
+        polarity = analysis.sentiment.polarity
+        return {
+            'polarity': polarity,
+            'subjectivity': analysis.sentiment.subjectivity,
+            'mood': _mood(polarity)
+        }
+
+    def score_batch(self, texts):
+        return [self.score(text) for text in texts]
+
+SENTIMENT_BACKENDS = {
+    'lexicon': LexiconSentimentAnalyzer,
+    'textblob': TextBlobSentimentAnalyzer,
+}
+
+def get_sentiment_analyzer(name=None):
+    """Instantiate the backend named by `name` or CHATBOT_SENTIMENT_BACKEND (default: lexicon)."""
+    name = name or os.environ.get('CHATBOT_SENTIMENT_BACKEND', 'lexicon')
+    if name not in SENTIMENT_BACKENDS:
+        raise ValueError(f"Unknown sentiment backend: {name}")
+    return SENTIMENT_BACKENDS[name]()
@@ -0,0 +1,32 @@
+"""Precomputed user analytics
+
+Revision ID: 5c1f0e9a7b21
+Revises: 2a12e5747505
+Create Date: 2026-10-19 09:12:41.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c1f0e9a7b21'
+down_revision = '2a12e5747505'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('avg_transaction', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('recommendations', sa.JSON(), nullable=True))
+        batch_op.add_column(sa.Column('computed_at', sa.DateTime(), nullable=True))
+        batch_op.create_unique_constraint('uq_user_analytics_user_id', ['user_id'])
+
+
+def downgrade():
+    with op.batch_alter_table('user_analytics', schema=None) as batch_op:
+        batch_op.drop_constraint('uq_user_analytics_user_id', type_='unique')
+        batch_op.drop_column('computed_at')
+        batch_op.drop_column('recommendations')
+        batch_op.drop_column('avg_transaction')
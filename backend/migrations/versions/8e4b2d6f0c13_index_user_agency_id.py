@@ -0,0 +1,26 @@
+"""Index user.agency_id for grouped agency analytics
+
+Revision ID: 8e4b2d6f0c13
+Revises: 5c1f0e9a7b21
+Create Date: 2026-10-19 10:03:55.871240
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2d6f0c13'
+down_revision = '5c1f0e9a7b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_user_agency_id'), ['agency_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_agency_id'))
@@ -0,0 +1,46 @@
+"""Resumable chunked upload sessions
+
+Revision ID: a3e5c7f9b214
+Revises: f2c8d7a41b96
+Create Date: 2026-10-19 16:32:05.284117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3e5c7f9b214'
+down_revision = 'f2c8d7a41b96'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('upload_session',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('document_type', sa.String(length=50), nullable=False),
+        sa.Column('file_type', sa.String(length=10), nullable=False),
+        sa.Column('total_size', sa.Integer(), nullable=False),
+        sa.Column('received_size', sa.Integer(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('document_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['document_id'], ['document.id'], name=op.f('fk_upload_session_document_id_document')),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_upload_session_user_id_user')),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_upload_session_updated_at'), ['updated_at'], unique=False)
+        batch_op.create_index(batch_op.f('ix_upload_session_user_id'), ['user_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('upload_session', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_upload_session_user_id'))
+        batch_op.drop_index(batch_op.f('ix_upload_session_updated_at'))
+
+    op.drop_table('upload_session')
@@ -0,0 +1,30 @@
+"""Document hashed_at, so the perceptual hash index picks up backfilled hashes
+
+Revision ID: a8d2f6c4b917
+Revises: c3e8a5f1d274
+Create Date: 2026-10-19 23:05:37.902114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2f6c4b917'
+down_revision = 'c3e8a5f1d274'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('hashed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_document_hashed_at'), ['hashed_at'], unique=False)
+
+    op.execute('UPDATE document SET hashed_at = CURRENT_TIMESTAMP WHERE phash IS NOT NULL')
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_hashed_at'))
+        batch_op.drop_column('hashed_at')
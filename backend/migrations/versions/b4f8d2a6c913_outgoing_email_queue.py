@@ -0,0 +1,42 @@
+"""Outgoing email queue
+
+Revision ID: b4f8d2a6c913
+Revises: f7d1b3e9a524
+Create Date: 2026-10-19 21:02:18.447091
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4f8d2a6c913'
+down_revision = 'f7d1b3e9a524'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('outgoing_email',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('recipient', sa.String(length=120), nullable=False),
+        sa.Column('subject', sa.String(length=200), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('sent_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], name=op.f('fk_outgoing_email_user_id_user')),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('outgoing_email', schema=None) as batch_op:
+        batch_op.create_index('ix_outgoing_email_status_id', ['status', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('outgoing_email', schema=None) as batch_op:
+        batch_op.drop_index('ix_outgoing_email_status_id')
+
+    op.drop_table('outgoing_email')
@@ -0,0 +1,107 @@
+"""Monthly transaction partitioning and archive registry
+
+Revision ID: b7d3a91c4e58
+Revises: 8e4b2d6f0c13
+Create Date: 2026-10-19 11:20:07.553912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3a91c4e58'
+down_revision = '8e4b2d6f0c13'
+branch_labels = None
+depends_on = None
+
+
+def _partition_transaction_table():
+    """Convert "transaction" into a native monthly range-partitioned table (PostgreSQL only).
+
+    A partitioned table's primary key must include the partition key, so the
+    key becomes (id, created_at) and created_at becomes NOT NULL; the ORM keeps
+    mapping id alone. Rows outside every monthly partition land in the default
+    partition until ensure_partitions creates theirs.
+    """
+    op.execute('UPDATE "transaction" SET created_at = now() WHERE created_at IS NULL')
+    op.execute('ALTER SEQUENCE transaction_id_seq OWNED BY NONE')
+    op.execute('ALTER TABLE "transaction" RENAME TO transaction_unpartitioned')
+    op.execute(
+        'CREATE TABLE "transaction" (LIKE transaction_unpartitioned INCLUDING DEFAULTS) '
+        'PARTITION BY RANGE (created_at)'
+    )
+    op.execute('ALTER TABLE "transaction" ADD PRIMARY KEY (id, created_at)')
+    op.execute('ALTER TABLE "transaction" ADD FOREIGN KEY (account_id) REFERENCES account (id)')
+    op.execute('ALTER TABLE "transaction" ADD FOREIGN KEY (recipient_account_id) REFERENCES account (id)')
+    op.execute('CREATE TABLE transaction_default PARTITION OF "transaction" DEFAULT')
+    op.execute("""
+        DO $$
+        DECLARE month date;
+        BEGIN
+            FOR month IN
+                SELECT DISTINCT date_trunc('month', created_at)::date FROM transaction_unpartitioned
+                UNION
+                SELECT date_trunc('month', now())::date
+            LOOP
+                EXECUTE format(
+                    'CREATE TABLE transaction_%s PARTITION OF "transaction" FOR VALUES FROM (%L) TO (%L)',
+                    to_char(month, 'YYYY_MM'), month, (month + interval '1 month')::date
+                );
+            END LOOP;
+        END $$;
+    """)
+    op.execute('INSERT INTO "transaction" SELECT * FROM transaction_unpartitioned')
+    op.execute('DROP TABLE transaction_unpartitioned')
+    op.execute('ALTER SEQUENCE transaction_id_seq OWNED BY "transaction".id')
+
+
+def upgrade():
+    op.create_table('transaction_period',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('storage', sa.String(length=20), nullable=False),
+        sa.Column('table_name', sa.String(length=50), nullable=True),
+        sa.Column('archive_path', sa.String(length=255), nullable=True),
+        sa.Column('row_count', sa.Integer(), nullable=True),
+        sa.Column('total_volume', sa.Float(), nullable=True),
+        sa.Column('closed_at', sa.DateTime(), nullable=True),
+        sa.Column('archived_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('period')
+    )
+    op.create_table('archived_activity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('period', sa.String(length=7), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('transaction_count', sa.Integer(), nullable=True),
+        sa.Column('volume', sa.Float(), nullable=True),
+        sa.Column('last_activity', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('archived_activity', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_archived_activity_period'), ['period'], unique=False)
+        batch_op.create_index(batch_op.f('ix_archived_activity_user_id'), ['user_id'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        _partition_transaction_table()
+
+    # Indexes on a partitioned parent cascade to every partition
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_transaction_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_transaction_account_id_created_at', ['account_id', 'created_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('transaction', schema=None) as batch_op:
+        batch_op.drop_index('ix_transaction_account_id_created_at')
+        batch_op.drop_index(batch_op.f('ix_transaction_created_at'))
+
+    # Partitioned data is left in place on PostgreSQL; archived periods stay in cold storage
+    with op.batch_alter_table('archived_activity', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_archived_activity_user_id'))
+        batch_op.drop_index(batch_op.f('ix_archived_activity_period'))
+
+    op.drop_table('archived_activity')
+    op.drop_table('transaction_period')
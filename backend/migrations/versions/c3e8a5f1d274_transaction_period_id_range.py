@@ -0,0 +1,28 @@
+"""Transaction id range of each closed period
+
+Revision ID: c3e8a5f1d274
+Revises: b4f8d2a6c913
+Create Date: 2026-10-19 22:41:05.318264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3e8a5f1d274'
+down_revision = 'b4f8d2a6c913'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('transaction_period', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('min_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('max_id', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('transaction_period', schema=None) as batch_op:
+        batch_op.drop_column('max_id')
+        batch_op.drop_column('min_id')
@@ -0,0 +1,58 @@
+"""Raw float32 face embeddings
+
+Revision ID: c8f1d2e4a693
+Revises: a3e5c7f9b214
+Create Date: 2026-10-19 17:05:41.603219
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import numpy as np
+import pickle
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f1d2e4a693'
+down_revision = 'a3e5c7f9b214'
+branch_labels = None
+depends_on = None
+
+user_table = sa.table('user',
+    sa.column('id', sa.Integer()),
+    sa.column('face_embedding', sa.LargeBinary()),
+    sa.column('updated_at', sa.DateTime()),
+    sa.column('face_registered_at', sa.DateTime())
+)
+
+
+def _convert(encode):
+    # PickleType and LargeBinary share the same column type (BLOB/BYTEA): only the payload changes
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(user_table.c.id, user_table.c.face_embedding).where(user_table.c.face_embedding.isnot(None))
+    ).fetchall()
+    for user_id, payload in rows:
+        connection.execute(
+            user_table.update().where(user_table.c.id == user_id).values(face_embedding=encode(bytes(payload)))
+        )
+
+
+def upgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('face_registered_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_user_face_registered_at'), ['face_registered_at'], unique=False)
+
+    _convert(lambda payload: np.asarray(pickle.loads(payload), dtype='<f4').tobytes())
+    op.execute(
+        user_table.update()
+        .where(user_table.c.face_embedding.isnot(None))
+        .values(face_registered_at=sa.func.coalesce(user_table.c.updated_at, sa.func.current_timestamp()))
+    )
+
+
+def downgrade():
+    _convert(lambda payload: pickle.dumps(np.frombuffer(payload, dtype='<f4').astype(float).tolist()))
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_user_face_registered_at'))
+        batch_op.drop_column('face_registered_at')
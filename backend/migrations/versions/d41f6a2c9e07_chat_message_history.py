@@ -0,0 +1,40 @@
+"""Append-only chatbot history
+
+Revision ID: d41f6a2c9e07
+Revises: b7d3a91c4e58
+Create Date: 2026-10-19 14:05:32.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41f6a2c9e07'
+down_revision = 'b7d3a91c4e58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('chat_message',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_key', sa.String(length=64), nullable=False),
+        sa.Column('user_input', sa.Text(), nullable=False),
+        sa.Column('bot_response', sa.Text(), nullable=True),
+        sa.Column('category', sa.String(length=50), nullable=True),
+        sa.Column('sentiment', sa.JSON(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_chat_message_created_at'), ['created_at'], unique=False)
+        batch_op.create_index('ix_chat_message_user_key_id', ['user_key', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('chat_message', schema=None) as batch_op:
+        batch_op.drop_index('ix_chat_message_user_key_id')
+        batch_op.drop_index(batch_op.f('ix_chat_message_created_at'))
+
+    op.drop_table('chat_message')
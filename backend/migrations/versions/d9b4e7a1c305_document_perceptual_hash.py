@@ -0,0 +1,29 @@
+"""Perceptual hashes of documents
+
+Revision ID: d9b4e7a1c305
+Revises: c8f1d2e4a693
+Create Date: 2026-10-19 17:48:12.730564
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd9b4e7a1c305'
+down_revision = 'c8f1d2e4a693'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing documents are hashed by run_document_sweep.py
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('phash', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('dhash', sa.String(length=16), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_column('dhash')
+        batch_op.drop_column('phash')
@@ -0,0 +1,33 @@
+"""Storage tier of documents
+
+Revision ID: e5c2a8f0d417
+Revises: d9b4e7a1c305
+Create Date: 2026-10-19 19:06:41.218377
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5c2a8f0d417'
+down_revision = 'd9b4e7a1c305'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing documents start as uploaded; run_document_compaction.py moves the reviewed ones
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('storage_tier', sa.String(length=20), nullable=False, server_default='original'))
+        batch_op.add_column(sa.Column('storage_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('compacted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_document_storage_tier'), ['storage_tier'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_storage_tier'))
+        batch_op.drop_column('compacted_at')
+        batch_op.drop_column('storage_size')
+        batch_op.drop_column('storage_tier')
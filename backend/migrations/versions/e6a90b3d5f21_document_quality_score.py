@@ -0,0 +1,30 @@
+"""Document quality score, file type and extracted data
+
+Revision ID: e6a90b3d5f21
+Revises: d41f6a2c9e07
+Create Date: 2026-10-19 15:12:48.402771
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a90b3d5f21'
+down_revision = 'd41f6a2c9e07'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_type', sa.String(length=10), nullable=True))
+        batch_op.add_column(sa.Column('quality_score', sa.Float(), nullable=True))
+        batch_op.add_column(sa.Column('extracted_data', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_column('extracted_data')
+        batch_op.drop_column('quality_score')
+        batch_op.drop_column('file_type')
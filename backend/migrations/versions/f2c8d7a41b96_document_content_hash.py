@@ -0,0 +1,30 @@
+"""Content-addressed document storage
+
+Revision ID: f2c8d7a41b96
+Revises: e6a90b3d5f21
+Create Date: 2026-10-19 15:48:20.917345
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c8d7a41b96'
+down_revision = 'e6a90b3d5f21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('file_size', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+        batch_op.create_index(batch_op.f('ix_document_content_hash'), ['content_hash'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_document_content_hash'))
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('file_size')
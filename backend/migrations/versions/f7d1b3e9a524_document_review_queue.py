@@ -0,0 +1,63 @@
+"""Review queue order and leases on documents
+
+Revision ID: f7d1b3e9a524
+Revises: e5c2a8f0d417
+Create Date: 2026-10-19 20:14:57.603118
+
+"""
+from datetime import timedelta
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f7d1b3e9a524'
+down_revision = 'e5c2a8f0d417'
+branch_labels = None
+depends_on = None
+
+# Same head starts as ReviewQueueService.RISK_HEADSTART, by stored enum name
+RISK_HEADSTART = {'LOW': timedelta(0), 'MEDIUM': timedelta(hours=12), 'HIGH': timedelta(hours=48)}
+
+document_table = sa.table('document',
+    sa.column('id', sa.Integer()),
+    sa.column('user_id', sa.Integer()),
+    sa.column('created_at', sa.DateTime()),
+    sa.column('review_due_at', sa.DateTime())
+)
+
+user_table = sa.table('user',
+    sa.column('id', sa.Integer()),
+    sa.column('risk_level', sa.String())
+)
+
+
+def upgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('review_due_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('lease_owner_id', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('lease_expires_at', sa.DateTime(), nullable=True))
+        batch_op.create_foreign_key(op.f('fk_document_lease_owner_id_user'), 'user', ['lease_owner_id'], ['id'])
+        batch_op.create_index('ix_document_status_review_due_at', ['status', 'review_due_at'], unique=False)
+
+    # Queue position of every document already uploaded
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.select(document_table.c.id, document_table.c.created_at, user_table.c.risk_level)
+        .select_from(document_table.join(user_table, user_table.c.id == document_table.c.user_id))
+        .where(document_table.c.created_at.isnot(None))
+    ).fetchall()
+    for document_id, created_at, risk_level in rows:
+        connection.execute(
+            document_table.update().where(document_table.c.id == document_id)
+            .values(review_due_at=created_at - RISK_HEADSTART.get(risk_level, timedelta(0)))
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('document', schema=None) as batch_op:
+        batch_op.drop_index('ix_document_status_review_due_at')
+        batch_op.drop_constraint(op.f('fk_document_lease_owner_id_user'), type_='foreignkey')
+        batch_op.drop_column('lease_expires_at')
+        batch_op.drop_column('lease_owner_id')
+        batch_op.drop_column('review_due_at')
@@ -1,6 +1,7 @@
 from extensions import db
 from datetime import datetime, date
 from enum import Enum
+import numpy as np
 
 class UserRole(str, Enum):
     USER = 'user'
@@ -77,7 +78,23 @@ class AdminRole(Enum):
     AGENCY_MANAGER = 'agency_manager'
     AGENT = 'agent'
 
+class Float32Vector(db.TypeDecorator):
+    """A NumPy float32 vector stored as its raw little-endian bytes (512 bytes for a face embedding)."""
+    impl = db.LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return np.asarray(value, dtype='<f4').tobytes()
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return np.frombuffer(value, dtype='<f4')
+
 class User(db.Model):
+    # Hot columns: authentication, authorization and status, loaded with every row
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
@@ -86,51 +103,62 @@ class User(db.Model):
     first_name = db.Column(db.String(100))
     last_name = db.Column(db.String(100))
     phone = db.Column(db.String(20))
-    revenue = db.Column(db.Float)
-    wilaya = db.Column(db.String(50))
-    birth_date = db.Column(db.Date, nullable=True)
-    birth_place = db.Column(db.String(100))
-    juridic_state = db.Column(db.Enum(JuridicState, name='juridic_state_enum'))
-    agency_id = db.Column(db.Integer, db.ForeignKey('agency.id'))
+    agency_id = db.Column(db.Integer, db.ForeignKey('agency.id'), index=True)
     risk_level = db.Column(db.Enum(RiskLevel, name='risk_level_enum'), default=RiskLevel.LOW)
     fidelity_points = db.Column(db.Integer, default=0)
     two_factor_enabled = db.Column(db.Boolean, default=False)
     two_fa_method = db.Column(db.String(10), default='none')  # 'sms', 'email', 'none'
     two_factor_secret = db.Column(db.String(32))
     biometric_enabled = db.Column(db.Boolean, default=False)
-    face_embedding = db.Column(db.PickleType, nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
-    family_status = db.Column(db.Enum(FamilyStatusEnum, name='family_status_enum'), nullable=True)
-    family_status_autre = db.Column(db.String(100), nullable=True)
-    father_first_name = db.Column(db.String(100), nullable=True)
-    father_last_name = db.Column(db.String(100), nullable=True)
-    mother_first_name = db.Column(db.String(100), nullable=True)
-    mother_last_name = db.Column(db.String(100), nullable=True)
-    birth_country = db.Column(db.String(100), nullable=True)
-    birth_wilaya = db.Column(db.String(100), nullable=True)
-    birth_city = db.Column(db.String(100), nullable=True)
-    nationality = db.Column(db.String(100), nullable=True)
-    other_nationality = db.Column(db.String(100), nullable=True)
-    address_street = db.Column(db.String(200), nullable=True)
-    address_wilaya = db.Column(db.String(100), nullable=True)
-    address_city = db.Column(db.String(100), nullable=True)
-    address_postal_code = db.Column(db.String(20), nullable=True)
-    address_country = db.Column(db.String(100), nullable=True)
-    address_validated = db.Column(db.Boolean, default=False)
-    profession = db.Column(db.Enum(ProfessionEnum, name='profession_enum'), nullable=True)
-    profession_autre = db.Column(db.String(100), nullable=True)
-    secteur_activite = db.Column(db.Enum(SecteurActiviteEnum, name='secteur_activite_enum'), nullable=True)
-    secteur_activite_autre = db.Column(db.String(100), nullable=True)
-    employer = db.Column(db.String(100), nullable=True)
-    salary_range = db.Column(db.Enum(SalaryRangeEnum, name='salary_range_enum'), nullable=True)
-    hire_date = db.Column(db.Date, nullable=True)
     client_code = db.Column(db.String(20), unique=True)
     account_status = db.Column(db.String(20), default='pending')  # pending, active, suspended
     verification_score = db.Column(db.Float, default=0.0)
-    last_activity = db.Column(db.DateTime)
-    total_transactions = db.Column(db.Integer, default=0)
-    total_volume = db.Column(db.Float, default=0.0)
+    address_validated = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    # Cold columns below are deferred: each group is fetched in one SELECT the
+    # first time one of its attributes is accessed. Queries that need a group
+    # for many rows should use undefer_group('<group>').
+
+    # 'profile': civil status, family, birth, address and professional data
+    revenue = db.deferred(db.Column(db.Float), group='profile')
+    wilaya = db.deferred(db.Column(db.String(50)), group='profile')
+    birth_date = db.deferred(db.Column(db.Date, nullable=True), group='profile')
+    birth_place = db.deferred(db.Column(db.String(100)), group='profile')
+    juridic_state = db.deferred(db.Column(db.Enum(JuridicState, name='juridic_state_enum')), group='profile')
+    family_status = db.deferred(db.Column(db.Enum(FamilyStatusEnum, name='family_status_enum'), nullable=True), group='profile')
+    family_status_autre = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    father_first_name = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    father_last_name = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    mother_first_name = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    mother_last_name = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    birth_country = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    birth_wilaya = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    birth_city = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    nationality = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    other_nationality = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    address_street = db.deferred(db.Column(db.String(200), nullable=True), group='profile')
+    address_wilaya = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    address_city = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    address_postal_code = db.deferred(db.Column(db.String(20), nullable=True), group='profile')
+    address_country = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    profession = db.deferred(db.Column(db.Enum(ProfessionEnum, name='profession_enum'), nullable=True), group='profile')
+    profession_autre = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    secteur_activite = db.deferred(db.Column(db.Enum(SecteurActiviteEnum, name='secteur_activite_enum'), nullable=True), group='profile')
+    secteur_activite_autre = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    employer = db.deferred(db.Column(db.String(100), nullable=True), group='profile')
+    salary_range = db.deferred(db.Column(db.Enum(SalaryRangeEnum, name='salary_range_enum'), nullable=True), group='profile')
+    hire_date = db.deferred(db.Column(db.Date, nullable=True), group='profile')
+
+    # 'biometric': the face embedding, only needed by Face ID and services/face_index.py
+    face_embedding = db.deferred(db.Column(Float32Vector, nullable=True), group='biometric')
+    face_registered_at = db.deferred(db.Column(db.DateTime, nullable=True, index=True), group='biometric')
+
+    # 'activity': analytics counters, only needed by admin views
+    last_activity = db.deferred(db.Column(db.DateTime), group='activity')
+    total_transactions = db.deferred(db.Column(db.Integer, default=0), group='activity')
+    total_volume = db.deferred(db.Column(db.Float, default=0.0), group='activity')
 
     accounts = db.relationship('Account', backref='user', lazy=True)
     documents = db.relationship('Document', 
@@ -172,11 +200,44 @@ class Document(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     document_type = db.Column(db.String(50), nullable=False)
     file_path = db.Column(db.String(200), nullable=False)
+    file_type = db.Column(db.String(10))
+    file_size = db.Column(db.Integer)
+    content_hash = db.Column(db.String(64), index=True)  # SHA-256, see UploadStorageService
+    phash = db.Column(db.String(16))  # 64-bit perceptual hashes in hex, see services/perceptual_hash.py
+    dhash = db.Column(db.String(16))
+    hashed_at = db.Column(db.DateTime, index=True)  # when phash was set, so the hash index picks up backfilled rows
+    quality_score = db.Column(db.Float)  # 0-100, from ImageQualityService
+    storage_tier = db.Column(db.String(20), default='original', nullable=False, index=True)  # original, compacted, archived; see services/document_storage.py
+    storage_size = db.Column(db.Integer)  # bytes of the stored file once compacted or archived
+    compacted_at = db.Column(db.DateTime)
+    extracted_data = db.Column(db.JSON)
     status = db.Column(db.Enum(DocumentStatus, name='document_status_enum'), default=DocumentStatus.PENDING)
     verification_notes = db.Column(db.Text)
     verified_by = db.Column(db.Integer, db.ForeignKey('user.id'))
     verified_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Review queue, see services/review_queue.py
+    review_due_at = db.Column(db.DateTime)  # upload time minus the applicant's risk head start
+    lease_owner_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    lease_expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_document_status_review_due_at', 'status', 'review_due_at'),
+    )
+
+class UploadSession(db.Model):
+    """A resumable chunked upload; chunks are appended to a temp file until finalized."""
+    id = db.Column(db.String(32), primary_key=True)  # random hex token, also names the temp file
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    document_type = db.Column(db.String(50), nullable=False)
+    file_type = db.Column(db.String(10), nullable=False)
+    total_size = db.Column(db.Integer, nullable=False)
+    received_size = db.Column(db.Integer, default=0, nullable=False)
+    sha256 = db.Column(db.String(64))  # expected digest of the whole file, if the client sent one
+    status = db.Column(db.String(20), default='open', nullable=False)  # open, appending, finalizing, finalized, expired
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class Account(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -200,9 +261,50 @@ class Transaction(db.Model):
     transaction_type = db.Column(db.String(20), nullable=False)
     status = db.Column(db.String(20), default='pending')
     description = db.Column(db.String(200))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('ix_transaction_account_id_created_at', 'account_id', 'created_at'),
+    )
+
+class TransactionPeriod(db.Model):
+    """Registry of closed monthly transaction periods and where they live."""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), unique=True, nullable=False)  # 'YYYY-MM'
+    storage = db.Column(db.String(20), nullable=False)  # partition, table, archive
+    table_name = db.Column(db.String(50))
+    archive_path = db.Column(db.String(255))
+    row_count = db.Column(db.Integer, default=0)
+    total_volume = db.Column(db.Float, default=0.0)
+    min_id = db.Column(db.Integer)  # id range of the period's rows, so a lookup by id probes one period
+    max_id = db.Column(db.Integer)
+    closed_at = db.Column(db.DateTime, default=datetime.utcnow)
+    archived_at = db.Column(db.DateTime)
+
+class ArchivedActivity(db.Model):
+    """Per-user totals of an archived period, so counters can be reconciled without the archive."""
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(7), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    transaction_count = db.Column(db.Integer, default=0)
+    volume = db.Column(db.Float, default=0.0)
+    last_activity = db.Column(db.DateTime)
+
+class ChatMessage(db.Model):
+    """One chatbot turn. Rows are only ever inserted (in batches) and pruned by age."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_key = db.Column(db.String(64), nullable=False)  # JWT identity of the chatbot user
+    user_input = db.Column(db.Text, nullable=False)
+    bot_response = db.Column(db.Text)
+    category = db.Column(db.String(50))
+    sentiment = db.Column(db.JSON)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        db.Index('ix_chat_message_user_key_id', 'user_key', 'id'),
+    )
+
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -218,6 +320,23 @@ class Notification(db.Model):
     def __repr__(self):
         return f'<Notification {self.process_type} for user {self.user_id}>'
 
+class OutgoingEmail(db.Model):
+    """An email waiting for the delivery job (NotificationService.deliver_queued_emails)."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    recipient = db.Column(db.String(120), nullable=False)
+    subject = db.Column(db.String(200), nullable=False)
+    body = db.Column(db.Text, nullable=False)
+    status = db.Column(db.String(20), default='queued', nullable=False)  # queued, sent, failed
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_outgoing_email_status_id', 'status', 'id'),
+    )
+
 class ApplicationProgress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -264,12 +383,15 @@ class Appointment(db.Model):
 
 class UserAnalytics(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, unique=True)
     risk_level = db.Column(db.String(20), default='low')  # low, medium, high
     verification_score = db.Column(db.Float, default=0.0)
     last_activity = db.Column(db.DateTime)
     total_transactions = db.Column(db.Integer, default=0)
     total_volume = db.Column(db.Float, default=0.0)
+    avg_transaction = db.Column(db.Float, default=0.0)
+    recommendations = db.Column(db.JSON)  # precomputed by AnalyticsService.refresh_user_analytics
+    computed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
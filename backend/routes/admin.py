@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User, Account, Transaction, Document, Agency, ApplicationProgress, Admin, Appointment, UserAnalytics, ESignature
+from models import User, Account, Transaction, Document, Agency, ApplicationProgress, Admin, AdminRole, Appointment, UserAnalytics, ESignature
 from extensions import db
 from datetime import datetime, timedelta
 import pandas as pd
@@ -9,8 +9,17 @@ import seaborn as sns
 from io import BytesIO
 import base64
 from sqlalchemy import func
+from sqlalchemy.orm import undefer_group
 from functools import wraps
 from services.notification_service import NotificationService
+from services.analytics_service import AnalyticsService
+from services.face_index import get_face_index, DUPLICATE_TOLERANCE
+from tasks.face_sweep_task import sweep_duplicate_faces
+from services.perceptual_hash import get_document_hash_index
+from tasks.document_hash_task import sweep_duplicate_documents
+from services.review_queue import ReviewQueueService
+from services.transaction_partitions import TransactionPartitionService
+from tasks.analytics_task import schedule_analytics_refresh
 import json
 
 admin_bp = Blueprint('admin', __name__)
@@ -61,12 +70,12 @@ def get_dashboard_data():
         Account.is_active == True
     ).count()
     
-    # Transaction statistics
-    total_transactions = Transaction.query.join(Account).join(User).filter(agency_filter).count()
-    transaction_volume = Transaction.query.join(Account).join(User).filter(
-        agency_filter,
-        Transaction.created_at >= datetime.utcnow() - timedelta(days=30)
-    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
+    # Transaction statistics, closed and archived months included
+    user_filter = None if agency_filter is True else agency_filter
+    total_transactions, _, _ = TransactionPartitionService.summarize(user_filter)
+    _, transaction_volume, _ = TransactionPartitionService.summarize(
+        user_filter, start=datetime.utcnow() - timedelta(days=30)
+    )
     
     # Document verification statistics
     pending_documents = Document.query.join(User).filter(
@@ -126,10 +135,8 @@ def generate_report():
     start_date = request.args.get('start_date')
     end_date = request.args.get('end_date')
     
-    if start_date:
-        start_date = datetime.strptime(start_date, '%Y-%m-%d')
-    if end_date:
-        end_date = datetime.strptime(end_date, '%Y-%m-%d')
+    # [start_date, end_date) with the end day included
+    start_date, end_date = TransactionPartitionService.day_range(start_date, end_date)
     
     # Get agency-specific data if admin is not a director
     agency_filter = User.agency_id == admin.agency_id if admin.role == 'admin' else True
@@ -158,7 +165,7 @@ def generate_performance_report(agency_filter, start_date, end_date):
     if start_date:
         daily_registrations = daily_registrations.filter(User.created_at >= start_date)
     if end_date:
-        daily_registrations = daily_registrations.filter(User.created_at <= end_date)
+        daily_registrations = daily_registrations.filter(User.created_at < end_date)
     
     daily_registrations = daily_registrations.group_by('date').all()
     
@@ -167,10 +174,9 @@ def generate_performance_report(agency_filter, start_date, end_date):
         func.count(Account.id).filter(Account.is_active == True) * 100.0 / func.count(Account.id)
     ).join(User).filter(agency_filter).scalar()
     
-    # Average transaction amount
-    avg_transaction = db.session.query(
-        func.avg(Transaction.amount)
-    ).join(Account).join(User).filter(agency_filter).scalar()
+    # Average transaction amount, closed and archived months included
+    count, volume, _ = TransactionPartitionService.summarize(None if agency_filter is True else agency_filter)
+    avg_transaction = volume / count if count else None
     
     return {
         'daily_registrations': [{'date': str(r.date), 'count': r.count} for r in daily_registrations],
@@ -180,11 +186,11 @@ def generate_performance_report(agency_filter, start_date, end_date):
 
 def generate_user_report(agency_filter, start_date, end_date):
     # User demographics
-    users = User.query.filter(agency_filter)
+    users = User.query.options(undefer_group('profile')).filter(agency_filter)
     if start_date:
         users = users.filter(User.created_at >= start_date)
     if end_date:
-        users = users.filter(User.created_at <= end_date)
+        users = users.filter(User.created_at < end_date)
     
     users = users.all()
     
@@ -213,30 +219,15 @@ def generate_user_report(agency_filter, start_date, end_date):
     }
 
 def generate_transaction_report(agency_filter, start_date, end_date):
-    # Transaction statistics
-    transactions = Transaction.query.join(Account).join(User).filter(agency_filter)
-    if start_date:
-        transactions = transactions.filter(Transaction.created_at >= start_date)
-    if end_date:
-        transactions = transactions.filter(Transaction.created_at <= end_date)
-    
-    # Daily transaction volume
-    daily_volume = db.session.query(
-        func.date(Transaction.created_at).label('date'),
-        func.sum(Transaction.amount).label('amount')
-    ).join(Account).join(User).filter(agency_filter)
-    
-    if start_date:
-        daily_volume = daily_volume.filter(Transaction.created_at >= start_date)
-    if end_date:
-        daily_volume = daily_volume.filter(Transaction.created_at <= end_date)
-    
-    daily_volume = daily_volume.group_by('date').all()
+    # Transaction statistics, from whichever tiers (hot table, closed periods, archive) the range covers
+    count, volume, daily_volume = TransactionPartitionService.summarize(
+        None if agency_filter is True else agency_filter, start_date, end_date, daily=True
+    )
     
     return {
-        'total_transactions': transactions.count(),
-        'total_volume': transactions.with_entities(func.sum(Transaction.amount)).scalar() or 0,
-        'daily_volume': [{'date': str(v.date), 'amount': v.amount} for v in daily_volume]
+        'total_transactions': count,
+        'total_volume': volume,
+        'daily_volume': [{'date': date, 'amount': amount} for date, amount in daily_volume.items()]
     }
 
 @admin_bp.route('/user-progress/<int:user_id>', methods=['GET'])
@@ -304,36 +295,13 @@ def get_dashboard_analytics():
     
     # Get analytics based on admin role
     if admin.role == 'director':
-        # Director sees all data
-        users = User.query.all()
+        # Director sees all data, broken down per agency
+        analytics = AnalyticsService.get_bank_analytics()
     else:
         # Agency managers/agents see only their agency's data
-        users = User.query.filter_by(agency_id=admin.agency_id).all()
+        analytics = AnalyticsService.get_agency_analytics(admin.agency_id)
     
-    # Calculate analytics
-    total_users = len(users)
-    active_users = len([u for u in users if u.account_status == 'active'])
-    pending_users = len([u for u in users if u.account_status == 'pending'])
-    
-    # Risk level distribution
-    risk_levels = {
-        'low': len([u for u in users if u.risk_level == 'low']),
-        'medium': len([u for u in users if u.risk_level == 'medium']),
-        'high': len([u for u in users if u.risk_level == 'high'])
-    }
-    
-    # Transaction volume
-    total_volume = sum(u.total_volume for u in users)
-    avg_transaction = total_volume / total_users if total_users > 0 else 0
-    
-    return jsonify({
-        'total_users': total_users,
-        'active_users': active_users,
-        'pending_users': pending_users,
-        'risk_levels': risk_levels,
-        'total_volume': total_volume,
-        'avg_transaction': avg_transaction
-    })
+    return jsonify(analytics)
 
 @admin_bp.route('/users/track', methods=['GET'])
 @admin_required
@@ -343,10 +311,11 @@ def track_users():
     admin = Admin.query.filter_by(user_id=current_user_id).first()
     
     # Get users based on admin role
+    query = User.query.options(undefer_group('activity'))
     if admin.role == 'director':
-        users = User.query.all()
+        users = query.all()
     else:
-        users = User.query.filter_by(agency_id=admin.agency_id).all()
+        users = query.filter_by(agency_id=admin.agency_id).all()
     
     user_tracking = []
     for user in users:
@@ -371,6 +340,161 @@ def track_users():
     
     return jsonify(user_tracking)
 
+@admin_bp.route('/users/<int:user_id>/similar-faces', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_similar_faces(user_id):
+    """Registered faces closest to this user's, across all users."""
+    user = User.query.options(undefer_group('biometric')).get_or_404(user_id)
+    if user.face_embedding is None:
+        return jsonify({'error': 'Face ID not registered'}), 404
+    
+    k = min(request.args.get('k', 5, type=int), 50)
+    tolerance = request.args.get('tolerance', type=float)
+    matches = get_face_index().nearest(user.face_embedding, k=k, tolerance=tolerance, exclude_user_id=user.id)
+    
+    return jsonify([{
+        'user_id': other_id,
+        'distance': round(distance, 4),
+        'duplicate': distance <= DUPLICATE_TOLERANCE
+    } for other_id, distance in matches])
+
+@admin_bp.route('/faces/duplicates', methods=['GET'])
+@director_required
+def get_duplicate_faces():
+    """Groups of users who registered the same face (bulk sweep over every embedding)."""
+    tolerance = request.args.get('tolerance', DUPLICATE_TOLERANCE, type=float)
+    pairs, groups = sweep_duplicate_faces(tolerance)
+    
+    return jsonify({
+        'tolerance': tolerance,
+        'groups': groups,
+        'pairs': [{
+            'user_ids': [user_a, user_b],
+            'distance': round(distance, 4)
+        } for user_a, user_b, distance in pairs]
+    })
+
+@admin_bp.route('/documents/<int:document_id>/similar', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_similar_documents(document_id):
+    """Documents, of any user, whose image is the same picture as this one."""
+    document = Document.query.get_or_404(document_id)
+    if not document.phash:
+        return jsonify({'error': 'Document has no perceptual hash'}), 404
+    
+    matches = get_document_hash_index().similar(document.phash, document.dhash, exclude_document_id=document.id)
+    for match in matches:
+        match['kind'] = 'exact' if match.pop('content_hash') == document.content_hash else 'near'
+    
+    return jsonify(matches)
+
+@admin_bp.route('/documents/duplicates', methods=['GET'])
+@director_required
+def get_duplicate_documents():
+    """Document images submitted by more than one user (bulk sweep over every hashed document)."""
+    pairs, groups = sweep_duplicate_documents()
+    
+    return jsonify({
+        'groups': groups,
+        'pairs': pairs
+    })
+
+def serialize_queued_document(document, risk_level):
+    holder = ReviewQueueService.lease_holder(document)
+    return {
+        'id': document.id,
+        'user_id': document.user_id,
+        'document_type': document.document_type,
+        'risk_level': risk_level.value if risk_level else None,
+        'quality_score': document.quality_score,
+        'extracted_data': document.extracted_data,
+        'created_at': document.created_at.isoformat() if document.created_at else None,
+        'review_due_at': document.review_due_at.isoformat() if document.review_due_at else None,
+        'lease_owner_id': holder,
+        'lease_expires_at': document.lease_expires_at.isoformat() if holder else None
+    }
+
+def lease_minutes_arg(data):
+    """Optional 'lease_minutes' of a request body as an int; raises ValueError if it isn't one."""
+    value = data.get('lease_minutes')
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(value)
+    return int(value)
+
+def queue_agency(admin):
+    """Agency whose applicants an agent reviews (directors review every agency)."""
+    return None if admin.role == AdminRole.DIRECTOR else admin.agency_id
+
+@admin_bp.route('/review-queue', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_review_queue():
+    """Pending documents in review order, with who is reviewing them."""
+    current_user_id = get_jwt_identity()
+    admin = Admin.query.filter_by(user_id=current_user_id).first()
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    
+    return jsonify([
+        serialize_queued_document(document, risk_level)
+        for document, risk_level in ReviewQueueService.pending(queue_agency(admin), limit)
+    ])
+
+@admin_bp.route('/review-queue/claim', methods=['POST'])
+@jwt_required()
+@admin_required
+def claim_review():
+    """Lease the next document to review to the calling agent."""
+    current_user_id = get_jwt_identity()
+    admin = Admin.query.filter_by(user_id=current_user_id).first()
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        lease_minutes = lease_minutes_arg(data)
+    except ValueError:
+        return jsonify({'error': 'lease_minutes must be an integer'}), 400
+    
+    document = ReviewQueueService.claim(current_user_id, queue_agency(admin), lease_minutes)
+    if document is None:
+        return jsonify({'document': None, 'message': 'No document waiting for review'})
+    
+    return jsonify({'document': serialize_queued_document(document, document.user.risk_level)})
+
+@admin_bp.route('/review-queue/<int:document_id>/renew', methods=['POST'])
+@jwt_required()
+@admin_required
+def renew_review(document_id):
+    """Extend the calling agent's lease while the review goes on."""
+    current_user_id = get_jwt_identity()
+    document = Document.query.get_or_404(document_id)
+    data = request.get_json(silent=True) or {}
+    
+    try:
+        lease_minutes = lease_minutes_arg(data)
+    except ValueError:
+        return jsonify({'error': 'lease_minutes must be an integer'}), 400
+    
+    if not ReviewQueueService.renew(document, current_user_id, lease_minutes):
+        return jsonify({'error': 'Lease not held, claim the document again'}), 409
+    
+    return jsonify({'lease_expires_at': document.lease_expires_at.isoformat()})
+
+@admin_bp.route('/review-queue/<int:document_id>/release', methods=['POST'])
+@jwt_required()
+@admin_required
+def release_review(document_id):
+    """Put a claimed document back in the queue without reviewing it."""
+    current_user_id = get_jwt_identity()
+    document = Document.query.get_or_404(document_id)
+    
+    if not ReviewQueueService.release(document, current_user_id):
+        return jsonify({'error': 'Document is being reviewed by another agent'}), 409
+    
+    return jsonify({'message': 'Document released'})
+
 @admin_bp.route('/appointments', methods=['POST'])
 @admin_required
 def create_appointment():
@@ -442,6 +566,8 @@ def activate_user_account(user_id):
     )
     db.session.add(e_signature)
     db.session.commit()
+    # The e-signature recommendation depends on it
+    schedule_analytics_refresh(user.id)
     
     # Send notification to user
     NotificationService.create_notification(
@@ -478,10 +604,11 @@ def get_recommendations():
     admin = Admin.query.filter_by(user_id=current_user_id).first()
     
     # Get users based on admin role
+    query = User.query.options(undefer_group('activity'))
     if admin.role == 'director':
-        users = User.query.all()
+        users = query.all()
     else:
-        users = User.query.filter_by(agency_id=admin.agency_id).all()
+        users = query.filter_by(agency_id=admin.agency_id).all()
     
     recommendations = []
     for user in users:
@@ -1,13 +1,15 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from models import User, db
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from sqlalchemy.orm import undefer, undefer_group
 from datetime import datetime, timedelta
 import random
 import string
 import pyotp
 import base64
 import os
+from services.face_index import get_face_index, DUPLICATE_TOLERANCE
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -74,7 +76,12 @@ def login():
     if not data or not data.get('username') or not data.get('password'):
         return jsonify({'error': 'Nom d\'utilisateur et mot de passe requis'}), 400
     
-    user = User.query.filter_by(username=data['username']).first()
+    # Only the profile fields echoed back below are loaded with the row
+    user = User.query.options(
+        undefer(User.family_status),
+        undefer(User.profession),
+        undefer(User.nationality)
+    ).filter_by(username=data['username']).first()
     
     if not user or not check_password_hash(user.password_hash, data['password']):
         return jsonify({'error': 'Nom d\'utilisateur ou mot de passe incorrect'}), 401
@@ -99,7 +106,7 @@ def login():
 @jwt_required()
 def get_user_profile():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
+    user = User.query.options(undefer_group('profile')).get(user_id)
     
     if not user:
         return jsonify({'error': 'Utilisateur non trouvé'}), 404
@@ -254,14 +261,23 @@ def register_face():
         return jsonify({'error': 'No file uploaded'}), 400
     file = request.files['photo']
     try:
-        import face_recognition
-        import numpy as np
-        image = face_recognition.load_image_file(file)
-        encodings = face_recognition.face_encodings(image)
-        if not encodings:
+        from services.face_pipeline import FacePipeline
+        encoding, _ = FacePipeline.encode(file.read())
+        if encoding is None:
             return jsonify({'error': 'No face detected'}), 400
-        user.face_embedding = encodings[0].tolist()
+        user.face_embedding = encoding
+        user.face_registered_at = datetime.utcnow()
         db.session.commit()
+        
+        # Same face already registered under another identity: flag it for the fraud team
+        face_index = get_face_index()
+        face_index.add(user.id, user.face_embedding)
+        duplicates = face_index.nearest(user.face_embedding, tolerance=DUPLICATE_TOLERANCE, exclude_user_id=user.id)
+        if duplicates:
+            current_app.logger.warning(
+                f"Face registered by user {user.id} matches user(s) "
+                + ', '.join(f'{other_id} (distance {distance:.3f})' for other_id, distance in duplicates)
+            )
         return jsonify({'message': 'Face registered successfully'}), 200
     except ImportError:
         return jsonify({'error': 'face_recognition library not installed'}), 500
@@ -273,19 +289,17 @@ def verify_face():
     if 'photo' not in request.files or 'username' not in request.form:
         return jsonify({'error': 'No file uploaded or username missing'}), 400
     username = request.form.get('username')
-    user = User.query.filter_by(username=username).first()
-    if not user or not user.face_embedding:
+    user = User.query.options(undefer_group('biometric')).filter_by(username=username).first()
+    if not user or user.face_embedding is None:
         return jsonify({'error': 'Face ID not registered'}), 400
     file = request.files['photo']
     try:
         import face_recognition
-        import numpy as np
-        image = face_recognition.load_image_file(file)
-        encodings = face_recognition.face_encodings(image)
-        if not encodings:
+        from services.face_pipeline import FacePipeline
+        encoding, _ = FacePipeline.encode(file.read())
+        if encoding is None:
             return jsonify({'error': 'No face detected'}), 400
-        known = np.array(user.face_embedding)
-        match = face_recognition.compare_faces([known], encodings[0])[0]
+        match = face_recognition.compare_faces([user.face_embedding], encoding)[0]
         if match:
             access_token = create_access_token(identity=user.id)
             return jsonify({'access_token': access_token}), 200
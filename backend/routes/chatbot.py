@@ -1,61 +1,78 @@
-from flask import Blueprint, request, jsonify
-from textblob import TextBlob
-import re
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity
+import json
 from datetime import datetime
-import cv2
-import pytesseract
-import numpy as np
 import os
-from werkzeug.utils import secure_filename
+from knowledge_base.matcher import IntentMatcher
+from knowledge_base.sentiment import get_sentiment_analyzer
+from knowledge_base.retrieval import KnowledgeBaseRetriever
+from knowledge_base.fr import FRENCH_KNOWLEDGE_BASE as ONBOARDING_KNOWLEDGE_BASE
+from services.chat_context_store import create_context_store
+from services.document_extraction import decode_image, document_region, extract_text
+from services.chat_history_service import ChatHistoryService
+from services.image_quality import ImageQualityService
+from tasks.chat_history_task import record_chat_turn, buffered_chat_turns
 
 # Base de connaissances enrichie pour l'inscription 100% en ligne
 FRENCH_KNOWLEDGE_BASE = {
     'greeting': {
         'pattern': r'^(bonjour|salut|hello|hi|hey|salam)$',
+        'keywords': ['bonjour', 'salut', 'hello', 'hi', 'hey', 'salam'],
         'response': """Bonjour ! Je suis l'assistant virtuel d'AGB. Je peux vous guider pour ouvrir un compte 100% en ligne. Dites-moi simplement où vous en êtes ou posez-moi une question !"""
     },
     'start_registration': {
         'pattern': r'(ouvrir|créer|nouveau).*(compte|inscription)',
+        'keywords': ['compte', 'inscription'],
         'response': """Pour commencer l'ouverture de votre compte :\n1. Cliquez sur 'S'enregistrer' sur l'écran d'accueil.\n2. Remplissez vos informations (prénom, nom, email, téléphone, mot de passe).\nBesoin d'aide sur une étape précise ?"""
     },
     'password_rules': {
         'pattern': r'(mot de passe|password|sécurité).*',
+        'keywords': ['mot de passe', 'password', 'sécurité'],
         'response': """Votre mot de passe doit comporter au moins 8 caractères, avec :\n- Une lettre majuscule\n- Une lettre minuscule\n- Un chiffre\nN'hésitez pas à me demander des conseils pour le choisir !"""
     },
     'sms_code': {
         'pattern': r'(sms|code|confirmation|vérification).*',
+        'keywords': ['sms', 'code', 'confirmation', 'vérification'],
         'response': """Après avoir saisi votre numéro de téléphone, vous recevrez un code par SMS. Entrez-le dans l'application pour valider votre numéro. Si vous ne recevez pas le code, cliquez sur 'Renvoyer le code'."""
     },
     'security_questions': {
         'pattern': r'(question.*sécur|sécurité|protection).*',
+        'keywords': ['question', 'sécurité', 'protection'],
         'response': """Les questions de sécurité servent à protéger votre compte et à réinitialiser votre mot de passe si besoin. Choisissez des questions et réponses faciles à retenir pour vous, mais difficiles à deviner pour les autres."""
     },
     'personal_info': {
         'pattern': r'(information.*personnel|profil|donnée.*personnel|civilité|nom|prénom|situation familiale|famille|parent|naissance|adresse|nationalité)',
+        'keywords': ['information', 'profil', 'donnée', 'civilité', 'nom', 'situation familiale', 'famille', 'parent', 'naissance', 'adresse', 'nationalité'],
         'response': """Remplissez soigneusement vos informations personnelles :\n- Civilité, prénom, nom\n- Situation familiale et informations sur vos parents\n- Date, pays, wilaya et ville de naissance\n- Nationalité\n- Adresse complète (rue, wilaya, commune, code postal, pays)\nBesoin d'aide sur un champ en particulier ?"""
     },
     'professional_info': {
         'pattern': r'(profession|emploi|travail|secteur|employeur|salaire|date d\'embauche)',
+        'keywords': ['profession', 'emploi', 'travail', 'secteur', 'employeur', 'salaire', "date d'embauche"],
         'response': """Indiquez votre profession, secteur d'activité, employeur, salaire mensuel et date d'embauche si vous êtes salarié. Ces informations sont nécessaires pour compléter votre dossier."""
     },
     'document_upload': {
         'pattern': r'(document|photo|justificatif|selfie|pièce d\'identité|passeport|permis|carte d\'identité|résidence|prendre en photo|envoyer|scanner)',
+        'keywords': ['document', 'photo', 'justificatif', 'selfie', "pièce d'identité", 'passeport', 'permis', "carte d'identité", 'résidence', 'envoyer', 'scanner'],
         'response': """Pour valider votre identité, prenez en photo les documents demandés (pièce d'identité, justificatif de domicile, etc.) et réalisez un selfie.\n\n**Conseils pour une photo réussie :**\n- Utilisez un bon éclairage\n- Évitez les reflets et le flou\n- Assurez-vous que toutes les informations sont lisibles\n- Ne cachez aucune partie du document\n\nLes photos seront vérifiées automatiquement par notre système (photos_process)."""
     },
     'document_quality': {
         'pattern': r'(qualité|photo.*refusée|photo.*pas bonne|photo.*rejetée|photo.*problème)',
+        'keywords': ['qualité', 'photo'],
         'response': """Si votre photo/document est refusé :\n- Vérifiez la netteté et la luminosité\n- Reprenez la photo sans flash si possible\n- Placez le document à plat et évitez les ombres\n- Vérifiez que toutes les informations sont visibles\nBesoin d'un exemple ou d'une aide pour prendre la photo ?"""
     },
     'terms_conditions': {
         'pattern': r'(condition.*générale|accepter|valider|confirmer)',
+        'keywords': ['condition', 'accepter', 'valider', 'confirmer'],
         'response': """Avant de finaliser, veuillez lire et accepter les conditions générales d'utilisation. Cochez les cases puis cliquez sur 'Confirmer et poursuivre'."""
     },
     'final_step': {
         'pattern': r'(final|terminé|fin|confirmation|félicitation|enregistrement réussi)',
+        'keywords': ['fin', 'terminé', 'confirmation', 'félicitation', 'enregistrement réussi'],
         'response': """Félicitations ! Votre inscription est terminée. Vous pouvez maintenant accéder à votre espace personnel et suivre l'avancement de votre dossier.\nSi besoin, je peux vous guider pour la suite (ouverture de compte, dépôt de documents, etc.)."""
     },
     'help': {
         'pattern': r'(aide|support|problème|bloqué|question|contact)',
+        'keywords': ['aide', 'support', 'problème', 'bloqué', 'question', 'contact'],
         'response': """Pour toute question ou problème, cliquez sur 'Besoin d'aide ?' ou contactez-nous au +213 21 98 86 86. Je suis aussi là pour répondre à vos questions !"""
     },
     'fallback': {
@@ -64,46 +81,57 @@ FRENCH_KNOWLEDGE_BASE = {
     }
 }
 
+# Compiled once at import instead of re-parsing every pattern for every message
+FRENCH_MATCHER = IntentMatcher(FRENCH_KNOWLEDGE_BASE)
+
+# TF-IDF index over both knowledge bases, consulted when no pattern matches
+KB_RETRIEVER = KnowledgeBaseRetriever.load_or_build(
+    {'chatbot': FRENCH_KNOWLEDGE_BASE, 'onboarding': ONBOARDING_KNOWLEDGE_BASE},
+    path=os.environ.get('CHATBOT_RETRIEVAL_INDEX')
+)
+
 chatbot_bp = Blueprint('chatbot', __name__)
 
-# User context tracking
-user_contexts = {}
+# User context tracking: bounded LRU with idle expiry, optionally shared
+# between workers through CHATBOT_CONTEXT_DB
+user_contexts = create_context_store()
 
 def get_user_context(user_id):
-    if user_id not in user_contexts:
-        user_contexts[user_id] = {
-            'preferences': {
-                'language': 'fr',  # Default to French
-                'notifications': True
-            },
-            'sentiment_history': [],
-            'conversation_history': []
-        }
-    return user_contexts[user_id]
+    return user_contexts.get(user_id)
+
+def save_user_context(user_id, context):
+    user_contexts.save(user_id, context)
+
+# Lexicon scorer by default; CHATBOT_SENTIMENT_BACKEND=textblob restores TextBlob
+SENTIMENT_ANALYZER = get_sentiment_analyzer()
 
 def analyze_sentiment(text):
-    analysis = TextBlob(text)
-    polarity = analysis.sentiment.polarity
-    subjectivity = analysis.sentiment.subjectivity
+    return SENTIMENT_ANALYZER.score(text)
+
+def match_response(text, context):
+    """Return (language, category, response) for a message; no side effects."""
+    language = context['preferences']['language']
     
-    # Determine mood based on polarity
-    if polarity > 0.3:
-        mood = "positive"
-    elif polarity < -0.3:
-        mood = "negative"
+    # Get response based on language
+    if language == 'fr':
+        matcher = FRENCH_MATCHER
     else:
-        mood = "neutral"
+        # Default to French if language not supported
+        matcher = FRENCH_MATCHER
     
-    return {
-        'polarity': polarity,
-        'subjectivity': subjectivity,
-        'mood': mood
-    }
-
-def get_response(text, user_id):
-    context = get_user_context(user_id)
-    language = context['preferences']['language']
+    # Find matching category (first match wins, accent- and case-insensitive)
+    category, response = matcher.respond(text)
+    
+    # Paraphrased questions: answer with the closest entry if it is similar enough
+    if category == 'fallback':
+        retrieved = KB_RETRIEVER.lookup(text)
+        if retrieved:
+            category, response, _ = retrieved
     
+    return language, category, response
+
+def record_turn(text, user_id, context, category, response):
+    """Score sentiment and log the turn to the context and the history table."""
     # Analyze sentiment
     sentiment = analyze_sentiment(text)
     context['sentiment_history'].append({
@@ -112,27 +140,6 @@ def get_response(text, user_id):
         'timestamp': datetime.now().isoformat()
     })
     
-    # Get response based on language
-    if language == 'fr':
-        knowledge_base = FRENCH_KNOWLEDGE_BASE
-    else:
-        # Default to French if language not supported
-        knowledge_base = FRENCH_KNOWLEDGE_BASE
-    
-    # Find matching pattern
-    response = None
-    category = None
-    
-    for cat, data in knowledge_base.items():
-        if re.search(data['pattern'], text.lower()):
-            response = data['response']
-            category = cat
-            break
-    
-    if not response:
-        response = knowledge_base['fallback']['response']
-        category = 'fallback'
-    
     # Add to conversation history
     context['conversation_history'].append({
         'user_input': text,
@@ -141,6 +148,14 @@ def get_response(text, user_id):
         'sentiment': sentiment,
         'timestamp': datetime.now().isoformat()
     })
+    save_user_context(user_id, context)
+    record_chat_turn(user_id, text, response, category, sentiment)
+    return sentiment
+
+def get_response(text, user_id):
+    context = get_user_context(user_id)
+    language, category, response = match_response(text, context)
+    sentiment = record_turn(text, user_id, context, category, response)
     
     return {
         'response': response,
@@ -149,15 +164,23 @@ def get_response(text, user_id):
         'language': language
     }
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def chat_user_key():
+    """Key of the signed-in user's chat context and history, the same one /history reads."""
+    return str(get_jwt_identity())[:64]
+
 @chatbot_bp.route('/chat', methods=['POST'])
+@jwt_required()
 def chat():
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
+        data = request.get_json(silent=True) or {}
+        user_id = chat_user_key()
         message = data.get('message')
         
-        if not user_id or not message:
-            return jsonify({'error': 'Missing user_id or message'}), 400
+        if not message:
+            return jsonify({'error': 'Missing message'}), 400
         
         response_data = get_response(message, user_id)
         return jsonify(response_data)
@@ -165,14 +188,51 @@ def chat():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@chatbot_bp.route('/chat/stream', methods=['POST'])
+@jwt_required()
+def chat_stream():
+    """Same as /chat over server-sent events: the answer is sent as soon as it is
+    matched ('answer' event), sentiment and history logging run after that first
+    byte and are reported in a 'meta' event, then 'done'. A client that
+    disconnects after the answer still gets its turn logged, when the stream
+    is closed."""
+    data = request.get_json(silent=True) or {}
+    user_id = chat_user_key()
+    message = data.get('message')
+    
+    if not message:
+        return jsonify({'error': 'Missing message'}), 400
+    
+    def generate():
+        turn = None
+        try:
+            context = get_user_context(user_id)
+            language, category, response = match_response(message, context)
+            turn = (message, user_id, context, category, response)
+            yield sse_event('answer', {'response': response, 'category': category, 'language': language})
+            
+            turn, pending = None, turn
+            sentiment = record_turn(*pending)
+            yield sse_event('meta', {'sentiment': sentiment})
+            yield sse_event('done', {})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+        finally:
+            # Closed at the 'answer' yield (client gone): log the turn anyway
+            if turn is not None:
+                record_turn(*turn)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # keep nginx from buffering the stream
+    })
+
 @chatbot_bp.route('/preferences', methods=['GET', 'POST'])
+@jwt_required()
 def preferences():
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
-        
-        if not user_id:
-            return jsonify({'error': 'Missing user_id'}), 400
+        data = request.get_json(silent=True) or {}
+        user_id = chat_user_key()
         
         context = get_user_context(user_id)
         
@@ -180,6 +240,7 @@ def preferences():
             # Update preferences
             new_preferences = data.get('preferences', {})
             context['preferences'].update(new_preferences)
+            save_user_context(user_id, context)
             return jsonify({'message': 'Preferences updated', 'preferences': context['preferences']})
         
         # GET request - return current preferences
@@ -189,18 +250,34 @@ def preferences():
         return jsonify({'error': str(e)}), 500
 
 @chatbot_bp.route('/history', methods=['GET'])
+@jwt_required()
 def history():
     try:
-        data = request.get_json()
-        user_id = data.get('user_id')
+        user_key = chat_user_key()
+        cursor = request.args.get('cursor', type=int)
+        limit = request.args.get('limit', type=int)
         
-        if not user_id:
-            return jsonify({'error': 'Missing user_id'}), 400
-        
-        context = get_user_context(user_id)
+        turns, next_cursor = ChatHistoryService.get_history(user_key, cursor=cursor, limit=limit)
+        if not cursor:
+            # The first page also shows this worker's turns not written yet;
+            # one flushed while the page was read is already in it
+            written = {(turn['timestamp'], turn['user_input']) for turn in turns}
+            pending = [{
+                'id': None,
+                'user_input': row['user_input'],
+                'bot_response': row['bot_response'],
+                'category': row['category'],
+                'sentiment': row['sentiment'],
+                'timestamp': row['created_at'].isoformat()
+            } for row in reversed(buffered_chat_turns(user_key))]
+            turns = [turn for turn in pending if (turn['timestamp'], turn['user_input']) not in written] + turns
         return jsonify({
-            'conversation_history': context['conversation_history'],
-            'sentiment_history': context['sentiment_history']
+            'conversation_history': turns,
+            'sentiment_history': [
+                {'text': turn['user_input'], 'sentiment': turn['sentiment'], 'timestamp': turn['timestamp']}
+                for turn in turns
+            ],
+            'next_cursor': next_cursor
         })
     
     except Exception as e:
@@ -210,25 +287,24 @@ def history():
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'png', 'jpg', 'jpeg'}
 
-def check_image_quality(image_path):
-    img = cv2.imread(image_path)
-    if img is None:
-        return False, "Fichier non lisible"
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    fm = cv2.Laplacian(gray, cv2.CV_64F).var()
-    if fm < 100:
-        return False, "La photo est floue"
-    mean_brightness = np.mean(gray)
-    if mean_brightness < 50:
-        return False, "La photo est trop sombre"
-    if mean_brightness > 220:
-        return False, "La photo est trop claire"
-    return True, "Qualité correcte"
+# Quality checks run on a copy whose long side is at most this many pixels.
+# The Laplacian variance depends on that size, so the blur threshold is the
+# one ImageQualityService calibrated for the same downscale
+ANALYSIS_MAX_SIDE = ImageQualityService.ANALYSIS_MAX_SIDE
 
-def extract_text(image_path):
-    img = cv2.imread(image_path)
-    text = pytesseract.image_to_string(img, lang='fra')
-    return text
+QUALITY_MESSAGES_FR = {
+    "Image is too dark": "La photo est trop sombre",
+    "Image is too bright": "La photo est trop claire",
+    "Image has glare": "La photo présente des reflets",
+    "Image is too blurry": "La photo est floue",
+}
+
+def check_image_quality(gray):
+    """ImageQualityService's exposure, glare and blur checks on a grayscale image downscaled to ANALYSIS_MAX_SIDE."""
+    failure = ImageQualityService.check_reduced(gray)
+    if failure is not None:
+        return False, QUALITY_MESSAGES_FR.get(failure['message'], failure['message'])
+    return True, "Qualité correcte"
 
 def detect_document_type(text):
     if "passeport" in text.lower():
@@ -251,15 +327,21 @@ def analyze_photo():
     if not allowed_file(file.filename):
         return jsonify({'error': "Format de fichier non supporté."}), 400
 
-    filename = secure_filename(file.filename)
-    temp_path = os.path.join('/tmp', filename)
-    file.save(temp_path)
+    # Decoded in memory (no temp file to collide with concurrent uploads),
+    # at reduced size for the quality checks
+    data = file.read()
+    small_gray = decode_image(data, max_side=ANALYSIS_MAX_SIDE)
+    if small_gray is None:
+        return jsonify({'error': "Fichier non lisible"}), 400
 
-    # Analyse qualité
-    is_good, quality_msg = check_image_quality(temp_path)
-    # OCR
-    text = extract_text(temp_path)
-    doc_type = detect_document_type(text)
+    # Analyse qualité; full-resolution decode and OCR only if the photo is usable
+    is_good, quality_msg = check_image_quality(small_gray)
+    if is_good:
+        text = extract_text(decode_image(data), document_region(small_gray))
+        doc_type = detect_document_type(text)
+    else:
+        text = ''
+        doc_type = "Inconnu"
 
     # Génération de la réponse
     if not is_good:
@@ -271,7 +353,6 @@ def analyze_photo():
         preview = '\n'.join(lines[:3])
         response = f"Document reconnu : {doc_type}.\nAperçu du texte détecté :\n{preview}\nLa qualité est bonne, vous pouvez continuer."
 
-    os.remove(temp_path)
     return jsonify({
         'response': response,
         'document_type': doc_type,
@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User
+from sqlalchemy.orm import undefer_group
 from services.kyc_engine import KYCChecker
+from services.chunked_upload import ChunkedUploadService, UploadError
 
 kyc_bp = Blueprint("kyc", __name__)
 
@@ -9,17 +11,26 @@ kyc_bp = Blueprint("kyc", __name__)
 @jwt_required()
 def kyc_check():
     user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    # Récupère les fichiers et infos du POST
-    documents = request.files
-    selfie = documents.get('selfie')
-    id_doc = documents.get('id_card')
-    proof = documents.get('proof_of_address')
+    user = User.query.options(undefer_group('profile')).get(user_id)
+    # Récupère les fichiers et infos du POST; a file sent through a resumable
+    # upload (/api/verification/uploads) is referenced by its <field>_upload_id
+    try:
+        selfie, id_doc, proof = [
+            request.files.get(field) or (
+                ChunkedUploadService.open_finalized(request.form[f'{field}_upload_id'], user_id)
+                if request.form.get(f'{field}_upload_id') else None
+            )
+            for field in ('selfie', 'id_card', 'proof_of_address')
+        ]
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
     # ... autres champs
     checker = KYCChecker(user, {'id': id_doc, 'proof_of_address': proof}, selfie)
     result = checker.run_all_checks()
     return jsonify({
         'score': result.global_score,
         'risk_level': result.risk_level,
-        'details': result.scores
+        'details': result.scores,
+        'flags': result.flags,
+        'stages': result.details.get('stages', {})
     }) 
\ No newline at end of file
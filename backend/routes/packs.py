@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User
+from sqlalchemy.orm import undefer_group
 from services.packs import recommend_packs
 
 packs_bp = Blueprint("packs", __name__)
@@ -9,7 +10,7 @@ packs_bp = Blueprint("packs", __name__)
 @jwt_required()
 def recommend():
     user_id = get_jwt_identity()
-    user = User.query.get_or_404(user_id)
+    user = User.query.options(undefer_group('profile')).get_or_404(user_id)
     age = user.get_age()
     revenue = user.revenue or 0
     packs = recommend_packs(age, revenue)
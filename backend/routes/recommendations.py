@@ -3,6 +3,7 @@ from flask_jwt_extended import jwt_required, get_jwt_identity
 from models import User, Account, Offer, Transaction
 from extensions import db
 from datetime import datetime, timedelta
+from sqlalchemy.orm import undefer_group
 import numpy as np
 from sklearn.preprocessing import StandardScaler
 from sklearn.cluster import KMeans
@@ -16,18 +17,15 @@ def calculate_user_features(user):
         'revenue': user.revenue or 0,
         'age': (datetime.utcnow() - user.birth_date).days / 365 if user.birth_date else 30,
         'account_count': len(user.accounts),
-        'transaction_count': sum(len(acc.transactions) for acc in user.accounts),
+        # Activity counters cover every storage tier, closed and archived months included
+        'transaction_count': user.total_transactions or 0,
         'avg_transaction': 0,
         'fidelity_points': user.fidelity_points
     }
     
     # Calculate average transaction amount
-    all_transactions = []
-    for account in user.accounts:
-        all_transactions.extend([t.amount for t in account.transactions])
-    
-    if all_transactions:
-        features['avg_transaction'] = sum(all_transactions) / len(all_transactions)
+    if features['transaction_count']:
+        features['avg_transaction'] = (user.total_volume or 0.0) / features['transaction_count']
     
     return features
 
@@ -83,7 +81,7 @@ def get_recommended_offers(user):
 @jwt_required()
 def get_offers():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    user = User.query.options(undefer_group('profile'), undefer_group('activity')).get(current_user_id)
     
     if not user:
         return jsonify({'error': 'User not found'}), 404
@@ -4,6 +4,9 @@ from models import Transaction, Account, User
 from extensions import db
 from sqlalchemy.exc import SQLAlchemyError
 from datetime import datetime
+from services.analytics_service import AnalyticsService
+from services.transaction_partitions import TransactionPartitionService
+from tasks.analytics_task import schedule_analytics_refresh
 
 transactions_bp = Blueprint('transactions', __name__)
 
@@ -20,20 +23,24 @@ def get_user_transactions():
     accounts = Account.query.filter_by(user_id=current_user_id).all()
     account_ids = [account.id for account in accounts]
     
-    # Get all transactions for these accounts
-    transactions = Transaction.query.filter(
-        Transaction.account_id.in_(account_ids)
-    ).order_by(Transaction.created_at.desc()).all()
+    # Optional date range (end day included), so only the matching monthly periods are read;
+    # without start_date only the hot window is listed
+    start_date, end_date = TransactionPartitionService.day_range(
+        request.args.get('start_date'), request.args.get('end_date')
+    )
+    
+    # Get all transactions for these accounts, from the hot table and closed periods
+    transactions = TransactionPartitionService.query_transactions(account_ids, start_date, end_date)
     
     return jsonify([{
-        'id': transaction.id,
-        'amount': transaction.amount,
-        'transaction_type': transaction.transaction_type,
-        'status': transaction.status,
-        'account_id': transaction.account_id,
-        'recipient_account_id': transaction.recipient_account_id,
-        'created_at': transaction.created_at.isoformat(),
-        'description': transaction.description
+        'id': transaction['id'],
+        'amount': transaction['amount'],
+        'transaction_type': transaction['transaction_type'],
+        'status': transaction['status'],
+        'account_id': transaction['account_id'],
+        'recipient_account_id': transaction['recipient_account_id'],
+        'created_at': transaction['created_at'].isoformat() if transaction['created_at'] else None,
+        'description': transaction['description']
     } for transaction in transactions]), 200
 
 @transactions_bp.route('/', methods=['POST'])
@@ -63,6 +70,8 @@ def create_transaction():
             description=data.get('description')
         )
         
+        recipient_account = None
+        
         # Handle different transaction types
         if data['transaction_type'] == 'deposit':
             account.balance += data['amount']
@@ -84,9 +93,20 @@ def create_transaction():
             recipient_account.balance += data['amount']
             transaction.status = 'completed'
         
+        transaction.created_at = datetime.utcnow()
         db.session.add(transaction)
+        
+        # Activity counters commit together with the posting
+        AnalyticsService.record_postings([
+            (account.user_id, transaction.amount, transaction.created_at)
+        ])
         db.session.commit()
         
+        schedule_analytics_refresh(
+            account.user_id,
+            recipient_account.user_id if recipient_account else None
+        )
+        
         return jsonify({
             'id': transaction.id,
             'amount': transaction.amount,
@@ -111,21 +131,22 @@ def get_transaction(transaction_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    transaction = Transaction.query.get(transaction_id)
+    # Closed months may have moved to a period table or the archive
+    transaction = TransactionPartitionService.get_transaction(transaction_id)
     if not transaction:
         return jsonify({'error': 'Transaction not found'}), 404
     
-    account = Account.query.get(transaction.account_id)
+    account = Account.query.get(transaction['account_id'])
     if account.user_id != current_user_id and user.role != 'admin':
         return jsonify({'error': 'Unauthorized'}), 403
     
     return jsonify({
-        'id': transaction.id,
-        'amount': transaction.amount,
-        'transaction_type': transaction.transaction_type,
-        'status': transaction.status,
-        'account_id': transaction.account_id,
-        'recipient_account_id': transaction.recipient_account_id,
-        'created_at': transaction.created_at.isoformat(),
-        'description': transaction.description
+        'id': transaction['id'],
+        'amount': transaction['amount'],
+        'transaction_type': transaction['transaction_type'],
+        'status': transaction['status'],
+        'account_id': transaction['account_id'],
+        'recipient_account_id': transaction['recipient_account_id'],
+        'created_at': transaction['created_at'].isoformat() if transaction['created_at'] else None,
+        'description': transaction['description']
     }), 200 
\ No newline at end of file
@@ -1,7 +1,18 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app, send_file
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User, Document, Account, Agency, Notification, ApplicationProgress
+from models import User, Document, DocumentStatus, Account, Agency, Notification, ApplicationProgress
 from extensions import db
+from services.image_quality import ImageQualityService
+from services.upload_storage import UploadStorageService
+from services.chunked_upload import ChunkedUploadService, UploadError
+from services.perceptual_hash import compute_hashes, get_document_hash_index
+from services.document_extraction import EXTRACTORS, extract_document
+from services.document_storage import DocumentStorageService
+from services.review_queue import ReviewQueueService
+from services.notification_service import NotificationService
+from tasks.analytics_task import schedule_analytics_refresh
+from sqlalchemy import update, or_
+import io
 import os
 from datetime import datetime
 import cv2
@@ -9,7 +20,6 @@ import numpy as np
 from PIL import Image
 import pytesseract
 import json
-from werkzeug.utils import secure_filename
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
@@ -17,72 +27,26 @@ import requests
 
 verification_bp = Blueprint('verification', __name__)
 
-UPLOAD_FOLDER = 'uploads'
 ALLOWED_EXTENSIONS = {'pdf', 'png', 'jpg', 'jpeg'}
+EXTRACTED_DOCUMENT_TYPES = set(EXTRACTORS)
+MAX_BULK_DOCUMENTS = 500
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 def check_image_quality(image_path):
-    # Read image
-    img = cv2.imread(image_path)
-    if img is None:
-        return False, "Invalid image file"
-    
-    # Check resolution
-    height, width = img.shape[:2]
-    if width < 800 or height < 600:
-        return False, "Image resolution too low"
-    
-    # Check blur
-    laplacian_var = cv2.Laplacian(img, cv2.CV_64F).var()
-    if laplacian_var < 100:
-        return False, "Image is too blurry"
-    
-    # Check noise
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    noise = cv2.fastNlMeansDenoising(gray)
-    noise_level = np.mean(np.abs(gray - noise))
-    if noise_level > 20:
-        return False, "Image has too much noise"
-    
-    return True, "Image quality is good"
+    """Return (ok, message, score 0-100) from the tiered quality analyzer."""
+    if image_path.lower().endswith('.pdf'):
+        # Blur check on the first page only, see ImageQualityService.analyze_pdf
+        report = ImageQualityService.analyze_pdf(image_path)
+    else:
+        report = ImageQualityService.analyze(image_path)
+    return report['ok'], report['message'], report['score']
 
 def extract_data_from_document(file_path, document_type):
+    """Return (ok, extracted fields or error message) using the extractor registered for the type."""
     try:
-        if file_path.lower().endswith('.pdf'):
-            # Convert PDF to image first
-            # You'll need to implement PDF to image conversion
-            pass
-        
-        # Extract text using OCR
-        text = pytesseract.image_to_string(Image.open(file_path))
-        
-        # Process extracted text based on document type
-        if document_type == 'id':
-            # Extract ID card information
-            data = {
-                'name': extract_name(text),
-                'id_number': extract_id_number(text),
-                'birth_date': extract_birth_date(text),
-                'birth_place': extract_birth_place(text)
-            }
-        elif document_type == 'residency':
-            # Extract residency information
-            data = {
-                'address': extract_address(text),
-                'wilaya': extract_wilaya(text)
-            }
-        elif document_type == 'birth_certificate':
-            # Extract birth certificate information
-            data = {
-                'name': extract_name(text),
-                'birth_date': extract_birth_date(text),
-                'birth_place': extract_birth_place(text),
-                'parents': extract_parents(text)
-            }
-        
-        return True, data
+        return extract_document(file_path, document_type)
     except Exception as e:
         return False, str(e)
 
@@ -115,6 +79,84 @@ def send_notification(user, title, message, notification_type='email'):
         # Implement SMS sending logic here
         pass
 
+def process_stored_document(user, document_type, content_hash, file_path, file_size, file_type):
+    """Quality check, OCR and Document creation for a stored file; returns (payload, status)."""
+    existing = Document.query.filter_by(
+        user_id=user.id, document_type=document_type, content_hash=content_hash
+    ).first()
+    if existing:
+        return {
+            'message': 'Document already uploaded',
+            'document_id': existing.id,
+            'extracted_data': existing.extracted_data
+        }, 200
+    
+    # Same content already processed (re-upload, or shared by another applicant): reuse its results
+    processed = UploadStorageService.find_processed(content_hash, document_type)
+    if processed:
+        quality_score = processed.quality_score
+        extracted_data = processed.extracted_data
+        phash, dhash = processed.phash, processed.dhash
+    else:
+        # Check image quality. A rejected file stays until the unreferenced-file
+        # sweep (run_upload_gc.py): another upload may be adopting the same content
+        quality_ok, quality_message, quality_score = check_image_quality(file_path)
+        if not quality_ok:
+            send_notification(user, 'Document Quality Issue', 
+                             f'Your {document_type} document has quality issues: {quality_message}')
+            return {'error': quality_message}, 400
+        
+        # Extract data from document (selfies and other types have nothing to extract)
+        if document_type in EXTRACTED_DOCUMENT_TYPES:
+            extraction_ok, extracted_data = extract_data_from_document(file_path, document_type)
+        else:
+            extraction_ok, extracted_data = True, {}
+        if not extraction_ok:
+            send_notification(user, 'Document Processing Issue',
+                             f'We could not process your {document_type} document: {extracted_data}')
+            return {'error': 'Document processing failed'}, 400
+        
+        phash, dhash = compute_hashes(file_path)
+    
+    # Save document information
+    document = Document(
+        user_id=user.id,
+        document_type=document_type,
+        file_path=file_path,
+        file_type=file_type,
+        file_size=file_size,
+        content_hash=content_hash,
+        quality_score=quality_score,
+        extracted_data=extracted_data,
+        phash=phash,
+        dhash=dhash,
+        hashed_at=datetime.utcnow() if phash else None,
+        review_due_at=ReviewQueueService.due_at(datetime.utcnow(), user.risk_level)
+    )
+    
+    db.session.add(document)
+    db.session.commit()
+    
+    # Same image already submitted by someone else: flag it for review
+    if phash:
+        hash_index = get_document_hash_index()
+        hash_index.add(document.id, user.id, content_hash, phash, dhash)
+        others = [match for match in hash_index.similar(phash, dhash, exclude_document_id=document.id)
+                  if match['user_id'] != user.id]
+        if others:
+            current_app.logger.warning(
+                f"Document {document.id} of user {user.id} matches "
+                + ', '.join(f"document {match['document_id']} of user {match['user_id']}"
+                            f" ({'identical' if match['content_hash'] == content_hash else 'near-duplicate'})"
+                            for match in others)
+            )
+    
+    return {
+        'message': 'Document uploaded successfully',
+        'document_id': document.id,
+        'extracted_data': extracted_data
+    }, 201
+
 @verification_bp.route('/upload-document', methods=['POST'])
 @jwt_required()
 def upload_document():
@@ -136,43 +178,108 @@ def upload_document():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type'}), 400
     
-    filename = secure_filename(file.filename)
-    file_path = os.path.join(UPLOAD_FOLDER, filename)
-    file.save(file_path)
+    # Stored by content hash: same-named files no longer collide, identical ones are kept once
+    file_type = file.filename.rsplit('.', 1)[1].lower()
+    content_hash, file_path, file_size, _ = UploadStorageService.store(file.stream, file_type)
     
-    # Check image quality
-    quality_ok, quality_message = check_image_quality(file_path)
-    if not quality_ok:
-        send_notification(user, 'Document Quality Issue', 
-                         f'Your {document_type} document has quality issues: {quality_message}')
-        return jsonify({'error': quality_message}), 400
+    payload, status = process_stored_document(user, document_type, content_hash, file_path, file_size, file_type)
+    return jsonify(payload), status
+
+# Resumable uploads: POST /uploads, then PUT /uploads/<id>?offset=N per chunk
+# (GET /uploads/<id> tells where to resume), then POST /uploads/<id>/finalize
+
+@verification_bp.route('/uploads', methods=['POST'])
+@jwt_required()
+def create_upload():
+    current_user_id = get_jwt_identity()
+    data = request.get_json() or {}
+    filename = data.get('filename', '')
+    document_type = data.get('document_type')
     
-    # Extract data from document
-    extraction_ok, extracted_data = extract_data_from_document(file_path, document_type)
-    if not extraction_ok:
-        send_notification(user, 'Document Processing Issue',
-                         f'We could not process your {document_type} document: {extracted_data}')
-        return jsonify({'error': 'Document processing failed'}), 400
+    if not document_type or not data.get('size'):
+        return jsonify({'error': 'Missing filename, size or document type'}), 400
     
-    # Save document information
-    document = Document(
-        user_id=current_user_id,
-        document_type=document_type,
-        file_path=file_path,
-        file_type=filename.rsplit('.', 1)[1].lower(),
-        quality_score=100,  # You can implement a scoring system
-        extracted_data=extracted_data
-    )
+    if not allowed_file(filename):
+        return jsonify({'error': 'Invalid file type'}), 400
     
-    db.session.add(document)
-    db.session.commit()
+    try:
+        size = int(data['size'])
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be an integer'}), 400
+    
+    try:
+        session = ChunkedUploadService.create_session(
+            current_user_id, document_type, filename.rsplit('.', 1)[1].lower(),
+            size, data.get('sha256')
+        )
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
     
     return jsonify({
-        'message': 'Document uploaded successfully',
-        'document_id': document.id,
-        'extracted_data': extracted_data
+        'upload_id': session.id,
+        'offset': 0,
+        'chunk_size': ChunkedUploadService.CHUNK_SIZE,
+        'max_chunk_size': ChunkedUploadService.MAX_CHUNK_SIZE
     }), 201
 
+@verification_bp.route('/uploads/<upload_id>', methods=['GET'])
+@jwt_required()
+def get_upload(upload_id):
+    try:
+        session = ChunkedUploadService.get_session(upload_id, get_jwt_identity())
+    except UploadError as e:
+        return jsonify({'error': e.message}), e.status
+    
+    return jsonify({
+        'upload_id': session.id,
+        'status': session.status,
+        'offset': session.received_size,
+        'size': session.total_size,
+        'document_id': session.document_id
+    })
+
+@verification_bp.route('/uploads/<upload_id>', methods=['PUT'])
+@jwt_required()
+def upload_chunk(upload_id):
+    """Raw chunk bytes in the body; optional X-Chunk-SHA256 header is verified before writing."""
+    offset = request.args.get('offset', type=int)
+    if offset is None:
+        return jsonify({'error': 'Missing offset'}), 400
+    
+    try:
+        session = ChunkedUploadService.get_session(upload_id, get_jwt_identity())
+        received = ChunkedUploadService.append_chunk(
+            session, offset, request.get_data(cache=False), request.headers.get('X-Chunk-SHA256')
+        )
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    
+    return jsonify({'offset': received, 'complete': received == session.total_size})
+
+@verification_bp.route('/uploads/<upload_id>/finalize', methods=['POST'])
+@jwt_required()
+def finalize_upload(upload_id):
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
+    
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+    
+    try:
+        session = ChunkedUploadService.get_session(upload_id, current_user_id)
+        content_hash, file_path, file_size = ChunkedUploadService.finalize(session)
+    except UploadError as e:
+        return jsonify({'error': e.message, **e.details}), e.status
+    
+    # Same pipeline as a single-request upload
+    payload, status = process_stored_document(
+        user, session.document_type, content_hash, file_path, file_size, session.file_type
+    )
+    if 'document_id' in payload:
+        session.document_id = payload['document_id']
+        db.session.commit()
+    return jsonify(payload), status
+
 @verification_bp.route('/verify-document/<int:document_id>', methods=['POST'])
 @jwt_required()
 def verify_document(document_id):
@@ -186,11 +293,18 @@ def verify_document(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
+    # Claimed from the review queue by someone else
+    holder = ReviewQueueService.lease_holder(document)
+    if holder is not None and holder != admin.id:
+        return jsonify({'error': 'Document is being reviewed by another agent'}), 409
+    
     data = request.get_json()
     document.status = data.get('status')
     document.verification_notes = data.get('notes')
     document.verified_at = datetime.utcnow()
     document.verified_by = current_user_id
+    document.lease_owner_id = None
+    document.lease_expires_at = None
     
     db.session.commit()
     
@@ -199,8 +313,122 @@ def verify_document(document_id):
     send_notification(user, 'Document Verification Update',
                      f'Your {document.document_type} document has been {document.status.value}')
     
+    # Recommendations depend on the verification state
+    schedule_analytics_refresh(document.user_id)
+    
     return jsonify({'message': 'Document verification updated'}), 200
 
+@verification_bp.route('/verify-documents', methods=['POST'])
+@jwt_required()
+def verify_documents():
+    """Verify or reject many documents at once: {"document_ids": [...], "status": "verified" | "rejected", "notes": "..."}.
+
+    All statuses change in one transaction, together with the queued emails
+    (one per applicant, listing their documents), which run_email_delivery.py
+    sends in batches. Only pending documents change: ids already reviewed
+    are reported as already_reviewed (so a resubmitted request neither flips
+    them nor emails the applicant again), and documents another agent holds
+    a review lease on are skipped.
+    """
+    current_user_id = get_jwt_identity()
+    admin = User.query.get(current_user_id)
+    
+    if not admin or admin.role not in ['admin', 'director']:
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    data = request.get_json(silent=True) or {}
+    document_ids = data.get('document_ids')
+    if not isinstance(document_ids, list) or not document_ids or not all(isinstance(i, int) for i in document_ids):
+        return jsonify({'error': 'document_ids must be a non-empty list of ids'}), 400
+    if len(document_ids) > MAX_BULK_DOCUMENTS:
+        return jsonify({'error': f'At most {MAX_BULK_DOCUMENTS} documents per request'}), 400
+    if data.get('status') not in (DocumentStatus.VERIFIED.value, DocumentStatus.REJECTED.value):
+        return jsonify({'error': 'status must be verified or rejected'}), 400
+    status = DocumentStatus(data['status'])
+    
+    # One UPDATE for all of them; the status and lease conditions are checked in the same statement
+    now = datetime.utcnow()
+    updated = db.session.execute(
+        update(Document).where(
+            Document.id.in_(document_ids),
+            Document.status == DocumentStatus.PENDING,
+            or_(
+                Document.lease_expires_at.is_(None),
+                Document.lease_expires_at <= now,
+                Document.lease_owner_id == admin.id
+            )
+        ).values(
+            status=status,
+            verification_notes=data.get('notes'),
+            verified_at=now,
+            verified_by=admin.id,
+            lease_owner_id=None,
+            lease_expires_at=None
+        ).returning(Document.id, Document.user_id, Document.document_type)
+        .execution_options(synchronize_session=False)
+    ).all()
+    
+    updated_ids = {row.id for row in updated}
+    remaining = set(document_ids) - updated_ids
+    existing = dict(
+        db.session.query(Document.id, Document.status).filter(Document.id.in_(remaining))
+    ) if remaining else {}
+    reviewed = {document_id for document_id, current in existing.items() if current != DocumentStatus.PENDING}
+    leased = set(existing) - reviewed
+    
+    documents_by_user = {}
+    for row in updated:
+        documents_by_user.setdefault(row.user_id, []).append(row.document_type)
+    users = User.query.filter(User.id.in_(documents_by_user)).all() if documents_by_user else []
+    for user in users:
+        NotificationService.queue_email(
+            user,
+            'Document Verification Update',
+            '\n'.join(f'Your {document_type} document has been {status.value}'
+                      for document_type in documents_by_user[user.id])
+        )
+    
+    db.session.commit()
+    schedule_analytics_refresh(*documents_by_user)
+    
+    return jsonify({
+        'updated': sorted(updated_ids),
+        'already_reviewed': sorted(reviewed),
+        'skipped': sorted(leased),
+        'not_found': sorted(remaining - set(existing)),
+        'notifications_queued': len(users)
+    }), 200
+
+@verification_bp.route('/documents/<int:document_id>/file', methods=['GET'])
+@jwt_required()
+def get_document_file(document_id):
+    """The document for display: ?max_side=N gets a cached thumbnail at least N px wide instead of the full file."""
+    current_user_id = get_jwt_identity()
+    viewer = User.query.get(current_user_id)
+    
+    document = Document.query.get(document_id)
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+    if not viewer or (document.user_id != viewer.id and viewer.role not in ['admin', 'director']):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    max_side = request.args.get('max_side', type=int)
+    accept_webp = request.accept_mimetypes['image/webp'] > 0
+    try:
+        source, mimetype, variant = DocumentStorageService.representation(document, max_side, accept_webp)
+    except OSError:
+        return jsonify({'error': 'Document file not available'}), 404
+    
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    response = send_file(source, mimetype=mimetype, etag=f'{document.content_hash or document.id}-{document.storage_tier}-{variant}',
+                         max_age=86400, conditional=True)
+    # Identity documents: the browser may cache them, shared proxies may not
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.headers['Vary'] = 'Accept'
+    return response
+
 @verification_bp.route('/activate-account/<int:account_id>', methods=['POST'])
 @jwt_required()
 def activate_account(account_id):
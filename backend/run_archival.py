@@ -0,0 +1,12 @@
+from app import create_app
+from tasks.archive_task import archive_transactions
+
+def run_archival_task():
+    """Run the transaction partitioning/archival job once (schedule it monthly with cron)."""
+    app = create_app()
+    with app.app_context():
+        closed, archived = archive_transactions()
+        print(f"Closed periods: {closed or 'none'}; archived periods: {archived or 'none'}")
+
+if __name__ == '__main__':
+    run_archival_task()
@@ -0,0 +1,16 @@
+import argparse
+from app import create_app
+from tasks.chat_history_task import prune_chat_history
+
+def run_chat_pruning_task(retention_days=None):
+    """Delete chatbot history past the retention window once (schedule it daily with cron)."""
+    app = create_app()
+    with app.app_context():
+        deleted = prune_chat_history(retention_days)
+        print(f"Deleted {deleted} chat turn(s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prune old chatbot history')
+    parser.add_argument('--days', type=int, default=None, help='retention in days (default: 90)')
+    args = parser.parse_args()
+    run_chat_pruning_task(args.days)
@@ -0,0 +1,19 @@
+import argparse
+from app import create_app
+from services.document_storage import ARCHIVE_AFTER_DAYS
+from tasks.document_compaction_task import compact_documents
+
+def run_document_compaction_task(archive_after_days=ARCHIVE_AFTER_DAYS):
+    """Compact reviewed documents and archive cold ones once (schedule it nightly with cron)."""
+    app = create_app()
+    with app.app_context():
+        (compacted, compacted_saved), (archived, archived_saved) = compact_documents(archive_after_days)
+        print(f"Compacted {compacted} file(s), saving {compacted_saved / 1024:.0f} KiB")
+        print(f"Archived {archived} file(s), saving {archived_saved / 1024:.0f} KiB")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compact reviewed documents and archive cold ones')
+    parser.add_argument('--archive-days', type=int, default=ARCHIVE_AFTER_DAYS,
+                        help=f'days after review before a document is archived (default: {ARCHIVE_AFTER_DAYS})')
+    args = parser.parse_args()
+    run_document_compaction_task(args.archive_days)
@@ -0,0 +1,21 @@
+import argparse
+from app import create_app
+from tasks.document_hash_task import backfill_document_hashes, sweep_duplicate_documents
+
+def run_document_sweep_task(skip_backfill=False):
+    """Hash documents missing a perceptual hash, then list images shared across users (schedule it nightly)."""
+    app = create_app()
+    with app.app_context():
+        if not skip_backfill:
+            print(f"Hashed {backfill_document_hashes()} document(s)")
+        pairs, groups = sweep_duplicate_documents()
+        for pair in pairs:
+            print(f"{pair['kind']:>5}: documents {pair['document_ids'][0]} and {pair['document_ids'][1]} "
+                  f"(users {pair['user_ids'][0]} and {pair['user_ids'][1]}, pHash distance {pair['phash_distance']})")
+        print(f"{len(groups)} group(s) from {len(pairs)} pair(s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find document images submitted by several users')
+    parser.add_argument('--skip-backfill', action='store_true', help='only sweep documents already hashed')
+    args = parser.parse_args()
+    run_document_sweep_task(args.skip_backfill)
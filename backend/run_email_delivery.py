@@ -0,0 +1,24 @@
+import argparse
+import time
+from app import create_app
+from tasks.email_delivery_task import deliver_emails
+
+def run_email_delivery_task(interval=None):
+    """Send queued emails once, or every `interval` seconds until interrupted."""
+    app = create_app()
+    with app.app_context():
+        while True:
+            try:
+                sent, failed = deliver_emails()
+                print(f"Sent {sent} email(s), {failed} failed")
+            except Exception as e:
+                app.logger.error(f"Error in email delivery task: {str(e)}")
+            if not interval:
+                break
+            time.sleep(interval)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Send queued emails in batches')
+    parser.add_argument('--interval', type=int, default=None, help='keep running, delivering every N seconds')
+    args = parser.parse_args()
+    run_email_delivery_task(args.interval)
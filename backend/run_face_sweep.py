@@ -0,0 +1,20 @@
+import argparse
+from app import create_app
+from tasks.face_sweep_task import sweep_duplicate_faces
+from services.face_index import DUPLICATE_TOLERANCE
+
+def run_face_sweep_task(tolerance=DUPLICATE_TOLERANCE):
+    """List users sharing a registered face once (schedule it nightly with cron)."""
+    app = create_app()
+    with app.app_context():
+        pairs, groups = sweep_duplicate_faces(tolerance)
+        for group in groups:
+            print(f"Same face: users {', '.join(str(user_id) for user_id in group)}")
+        print(f"{len(groups)} group(s) from {len(pairs)} matching pair(s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Find users who registered the same face')
+    parser.add_argument('--tolerance', type=float, default=DUPLICATE_TOLERANCE,
+                        help=f'maximum embedding distance (default: {DUPLICATE_TOLERANCE})')
+    args = parser.parse_args()
+    run_face_sweep_task(args.tolerance)
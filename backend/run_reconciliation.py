@@ -0,0 +1,13 @@
+import sys
+from app import create_app
+from tasks.counters_task import reconcile_counters
+
+def run_reconciliation_task(repair=True):
+    """Run the activity counter reconciliation once (schedule it nightly with cron)."""
+    app = create_app()
+    with app.app_context():
+        drifted = reconcile_counters(repair=repair)
+        print(f"{len(drifted)} user(s) with drifted counters")
+
+if __name__ == '__main__':
+    run_reconciliation_task(repair='--dry-run' not in sys.argv)
@@ -0,0 +1,16 @@
+from app import create_app
+from tasks.review_queue_task import maintain_review_queue
+
+def run_review_queue_task():
+    """Clean up the document review queue once (schedule it every few minutes with cron).
+
+    Expired leases are already claimable without it; this clears them for the
+    queue listing and applies risk level changes to the queue order.
+    """
+    app = create_app()
+    with app.app_context():
+        released, reprioritized = maintain_review_queue()
+        print(f"Cleared {released} expired lease(s), reprioritized {reprioritized} document(s)")
+
+if __name__ == '__main__':
+    run_review_queue_task()
@@ -0,0 +1,19 @@
+import argparse
+from app import create_app
+from tasks.upload_gc_task import collect_abandoned_uploads, collect_unreferenced_files
+
+def run_upload_gc_task(older_than_hours=None, grace_hours=None):
+    """Clean up abandoned chunked uploads and unreferenced stored files once (schedule it hourly with cron)."""
+    app = create_app()
+    with app.app_context():
+        expired = collect_abandoned_uploads(older_than_hours)
+        print(f"Expired {expired} abandoned upload(s)")
+        files, freed = collect_unreferenced_files(grace_hours)
+        print(f"Deleted {files} unreferenced file(s), {freed} bytes freed")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Clean up abandoned chunked uploads and unreferenced stored files')
+    parser.add_argument('--hours', type=int, default=None, help='idle time before an upload is abandoned (default: 24)')
+    parser.add_argument('--grace-hours', type=int, default=None, help='time an unreferenced file is kept (default: 24)')
+    args = parser.parse_args()
+    run_upload_gc_task(args.hours, args.grace_hours)
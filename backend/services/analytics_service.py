@@ -1,7 +1,8 @@
-from models import User, UserAnalytics, Transaction, Appointment
+from models import User, UserAnalytics, Transaction, Account, Appointment, RiskLevel
 from extensions import db
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, case, bindparam, update
+from services.transaction_partitions import TransactionPartitionService
 
 class AnalyticsService:
     @staticmethod
@@ -20,8 +21,8 @@ class AnalyticsService:
         # Calculate risk factors
         risk_score = 0
         
-        # Transaction volume risk
-        total_volume = sum(t.amount for t in user.accounts[0].transactions) if user.accounts else 0
+        # Transaction volume risk (lifetime counter, covers archived periods too)
+        total_volume = user.total_volume or 0
         if total_volume > 10000:
             risk_score += 2
         elif total_volume > 5000:
@@ -63,7 +64,140 @@ class AnalyticsService:
         return risk_level
     
     @staticmethod
-    def generate_recommendations(user_id):
+    def record_postings(postings):
+        """Increment the per-user activity counters for posted transactions.
+        
+        postings is an iterable of (user_id, amount, posted_at). The counters
+        are incremented in SQL inside the caller's database transaction, so
+        they commit or roll back together with the postings themselves.
+        Postings are folded per user first, so a bulk batch costs one UPDATE
+        execution per distinct user.
+        """
+        totals = {}
+        for user_id, amount, posted_at in postings:
+            count, volume, last_activity = totals.get(user_id, (0, 0.0, posted_at))
+            totals[user_id] = (count + 1, volume + amount, max(last_activity, posted_at))
+        
+        if not totals:
+            return
+        
+        user_table = User.__table__
+        db.session.execute(
+            user_table.update()
+            .where(user_table.c.id == bindparam('b_user_id'))
+            .values(
+                total_transactions=func.coalesce(user_table.c.total_transactions, 0) + bindparam('b_count'),
+                total_volume=func.coalesce(user_table.c.total_volume, 0.0) + bindparam('b_volume'),
+                last_activity=case(
+                    (user_table.c.last_activity.is_(None), bindparam('b_last_activity')),
+                    (user_table.c.last_activity < bindparam('b_last_activity'), bindparam('b_last_activity')),
+                    else_=user_table.c.last_activity
+                )
+            ),
+            [
+                {'b_user_id': user_id, 'b_count': count, 'b_volume': volume, 'b_last_activity': last_activity}
+                for user_id, (count, volume, last_activity) in totals.items()
+            ]
+        )
+    
+    @staticmethod
+    def reconcile_activity_counters(repair=True, tolerance=0.01):
+        """Detect and optionally repair drift in the per-user activity counters.
+        
+        Recomputes every user's counters from the transaction history (one
+        grouped query over the hot table, plus closed and archived periods)
+        and compares them with the stored values. Returns the ids of the users
+        whose counters had drifted (and, with repair, were fixed).
+        
+        The stored counters are read before the history. A posting committed
+        in between is then in the history but not in the value read, and
+        would look like drift: each repair is a conditional UPDATE that only
+        applies while the counters still hold the values read, so such a
+        user (whose counter has moved on) is left alone instead of losing
+        the increment. The next run checks them again.
+        """
+        stored = {
+            user_id: (count, volume, last_activity)
+            for user_id, count, volume, last_activity in db.session.query(
+                User.id, User.total_transactions, User.total_volume, User.last_activity
+            )
+        }
+        
+        # Closed and archived periods no longer live in "transaction"
+        actual = TransactionPartitionService.cold_activity_by_user()
+        for user_id, hot_count, hot_volume, hot_last_activity in db.session.query(
+            Account.user_id,
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0.0),
+            func.max(Transaction.created_at)
+        ).join(Transaction, Transaction.account_id == Account.id).group_by(Account.user_id):
+            cold_count, cold_volume, cold_last_activity = actual.get(user_id, (0, 0.0, None))
+            actual[user_id] = (
+                cold_count + hot_count,
+                cold_volume + float(hot_volume),
+                max((d for d in (cold_last_activity, hot_last_activity) if d is not None), default=None)
+            )
+        
+        drifted = []
+        for user_id, (count, volume, last_activity) in stored.items():
+            expected_count, expected_volume, expected_last_activity = actual.get(user_id, (0, 0.0, None))
+            
+            if (count or 0) != expected_count or abs((volume or 0.0) - expected_volume) > tolerance \
+                    or (expected_last_activity is not None and last_activity != expected_last_activity):
+                drifted.append((user_id, (count, volume, last_activity), (
+                    expected_count,
+                    expected_volume,
+                    expected_last_activity if expected_last_activity else last_activity
+                )))
+        
+        if not repair:
+            return [user_id for user_id, _, _ in drifted]
+        
+        repaired = []
+        for user_id, (count, volume, last_activity), (expected_count, expected_volume, expected_last_activity) in drifted:
+            result = db.session.execute(
+                update(User).where(
+                    User.id == user_id,
+                    User.total_transactions.is_not_distinct_from(count),
+                    User.total_volume.is_not_distinct_from(volume),
+                    User.last_activity.is_not_distinct_from(last_activity)
+                ).values(
+                    total_transactions=expected_count,
+                    total_volume=expected_volume,
+                    last_activity=expected_last_activity
+                ).execution_options(synchronize_session=False)
+            )
+            if result.rowcount:
+                repaired.append(user_id)
+        db.session.commit()
+        
+        return repaired
+    
+    @staticmethod
+    def get_recent_activity(account_ids, days=30):
+        """Aggregate a user's recent transactions in a single query."""
+        if not account_ids:
+            return {'count': 0, 'volume': 0.0, 'max_amount': 0.0, 'last_activity': None}
+        
+        count, volume, max_amount, last_activity = db.session.query(
+            func.count(Transaction.id),
+            func.coalesce(func.sum(Transaction.amount), 0.0),
+            func.coalesce(func.max(Transaction.amount), 0.0),
+            func.max(Transaction.created_at)
+        ).filter(
+            Transaction.account_id.in_(account_ids),
+            Transaction.created_at >= datetime.utcnow() - timedelta(days=days)
+        ).one()
+        
+        return {
+            'count': count,
+            'volume': float(volume),
+            'max_amount': float(max_amount),
+            'last_activity': last_activity
+        }
+    
+    @staticmethod
+    def generate_recommendations(user_id, recent_activity=None):
         """Generate recommendations for a user based on their analytics."""
         user = User.query.get(user_id)
         if not user:
@@ -91,15 +225,13 @@ class AnalyticsService:
             })
         
         # Check transaction patterns
-        recent_transactions = Transaction.query.filter(
-            Transaction.account_id.in_([a.id for a in user.accounts]),
-            Transaction.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).all()
+        if recent_activity is None:
+            recent_activity = AnalyticsService.get_recent_activity([a.id for a in user.accounts])
         
-        if recent_transactions:
+        if recent_activity['count']:
             # Check for unusual transaction patterns
-            avg_amount = sum(t.amount for t in recent_transactions) / len(recent_transactions)
-            if any(t.amount > avg_amount * 3 for t in recent_transactions):
+            avg_amount = recent_activity['volume'] / recent_activity['count']
+            if recent_activity['max_amount'] > avg_amount * 3:
                 recommendations.append({
                     'type': 'unusual_activity',
                     'priority': 'medium',
@@ -108,7 +240,7 @@ class AnalyticsService:
                 })
         
         # Check for missing e-signature
-        if user.total_volume > 10000 and not user.e_signature:
+        if (user.total_volume or 0) > 10000 and not user.e_signature:
             recommendations.append({
                 'type': 'e_signature_needed',
                 'priority': 'medium',
@@ -119,69 +251,153 @@ class AnalyticsService:
         return recommendations
     
     @staticmethod
-    def get_user_analytics(user_id):
-        """Get comprehensive analytics for a user."""
+    def refresh_user_analytics(user_id):
+        """Recompute and store a user's 30-day metrics and recommendations.
+        
+        This is the write side of the analytics read path: it is run by the
+        background worker in tasks/analytics_task.py whenever a transaction
+        lands, a document is reviewed or an e-signature is requested or
+        signed (what the recommendations depend on), so get_user_analytics
+        only ever reads the stored row.
+        """
         user = User.query.get(user_id)
         if not user:
             return None
         
-        # Get or create analytics
         analytics = UserAnalytics.query.filter_by(user_id=user_id).first()
         if not analytics:
             analytics = UserAnalytics(user_id=user_id)
             db.session.add(analytics)
-            db.session.commit()
         
-        # Calculate recent activity
-        recent_transactions = Transaction.query.filter(
-            Transaction.account_id.in_([a.id for a in user.accounts]),
-            Transaction.created_at >= datetime.utcnow() - timedelta(days=30)
-        ).all()
-        
-        # Calculate metrics
-        total_volume = sum(t.amount for t in recent_transactions)
-        avg_transaction = total_volume / len(recent_transactions) if recent_transactions else 0
+        recent_activity = AnalyticsService.get_recent_activity([a.id for a in user.accounts])
         
-        # Update analytics
-        analytics.total_transactions = len(recent_transactions)
-        analytics.total_volume = total_volume
-        analytics.last_activity = datetime.utcnow()
+        analytics.total_transactions = recent_activity['count']
+        analytics.total_volume = recent_activity['volume']
+        analytics.avg_transaction = (
+            recent_activity['volume'] / recent_activity['count'] if recent_activity['count'] else 0.0
+        )
+        analytics.last_activity = recent_activity['last_activity']
+        analytics.recommendations = AnalyticsService.generate_recommendations(user_id, recent_activity)
+        analytics.computed_at = datetime.utcnow()
         db.session.commit()
         
+        return analytics
+    
+    @staticmethod
+    def get_user_analytics(user_id):
+        """Get comprehensive analytics for a user.
+        
+        Read-only: serves the metrics precomputed by refresh_user_analytics and
+        never inserts or commits. When no row exists yet, zeroed metrics are
+        returned and a refresh is queued.
+        """
+        analytics = UserAnalytics.query.filter_by(user_id=user_id).first()
+        
+        if not analytics:
+            if not db.session.query(User.id).filter_by(id=user_id).first():
+                return None
+            
+            # Imported here to avoid a circular import with the task module
+            from tasks.analytics_task import schedule_analytics_refresh
+            schedule_analytics_refresh(user_id)
+            
+            return {
+                'user_id': user_id,
+                'risk_level': 'low',
+                'verification_score': 0.0,
+                'total_transactions': 0,
+                'total_volume': 0.0,
+                'avg_transaction': 0.0,
+                'last_activity': None,
+                'recommendations': [],
+                'computed_at': None
+            }
+        
         return {
-            'user_id': user.id,
+            'user_id': user_id,
             'risk_level': analytics.risk_level,
             'verification_score': analytics.verification_score,
             'total_transactions': analytics.total_transactions,
             'total_volume': analytics.total_volume,
-            'avg_transaction': avg_transaction,
+            'avg_transaction': analytics.avg_transaction or 0.0,
             'last_activity': analytics.last_activity.isoformat() if analytics.last_activity else None,
-            'recommendations': AnalyticsService.generate_recommendations(user_id)
+            'recommendations': analytics.recommendations or [],
+            'computed_at': analytics.computed_at.isoformat() if analytics.computed_at else None
         }
     
     @staticmethod
-    def get_agency_analytics(agency_id):
-        """Get analytics for an entire agency."""
-        users = User.query.filter_by(agency_id=agency_id).all()
-        
-        total_users = len(users)
-        active_users = len([u for u in users if u.account_status == 'active'])
-        pending_users = len([u for u in users if u.account_status == 'pending'])
-        
-        risk_levels = {
-            'low': len([u for u in users if u.risk_level == 'low']),
-            'medium': len([u for u in users if u.risk_level == 'medium']),
-            'high': len([u for u in users if u.risk_level == 'high'])
+    def _agency_aggregates():
+        """Conditional COUNT/SUM columns shared by the agency analytics queries."""
+        return (
+            func.count(User.id).label('total_users'),
+            func.sum(case((User.account_status == 'active', 1), else_=0)).label('active_users'),
+            func.sum(case((User.account_status == 'pending', 1), else_=0)).label('pending_users'),
+            func.sum(case((User.risk_level == RiskLevel.LOW, 1), else_=0)).label('low_risk'),
+            func.sum(case((User.risk_level == RiskLevel.MEDIUM, 1), else_=0)).label('medium_risk'),
+            func.sum(case((User.risk_level == RiskLevel.HIGH, 1), else_=0)).label('high_risk'),
+            func.coalesce(func.sum(User.total_volume), 0.0).label('total_volume')
+        )
+    
+    @staticmethod
+    def _format_agency_row(row):
+        total_users = row.total_users or 0
+        total_volume = float(row.total_volume or 0)
+        return {
+            'total_users': total_users,
+            'active_users': row.active_users or 0,
+            'pending_users': row.pending_users or 0,
+            'risk_levels': {
+                'low': row.low_risk or 0,
+                'medium': row.medium_risk or 0,
+                'high': row.high_risk or 0
+            },
+            'total_volume': total_volume,
+            'avg_transaction': total_volume / total_users if total_users > 0 else 0
         }
+    
+    @staticmethod
+    def get_agency_analytics(agency_id=None):
+        """Get analytics for an entire agency, or the whole bank when agency_id is None."""
+        query = db.session.query(*AnalyticsService._agency_aggregates())
+        if agency_id is not None:
+            query = query.filter(User.agency_id == agency_id)
+        
+        return AnalyticsService._format_agency_row(query.one())
+    
+    @staticmethod
+    def get_agencies_analytics(agency_ids=None):
+        """Get analytics for several agencies in one grouped query.
         
-        total_volume = sum(u.total_volume for u in users)
-        avg_transaction = total_volume / total_users if total_users > 0 else 0
+        Returns a dict keyed by agency id. Users without an agency are
+        grouped under None.
+        """
+        query = db.session.query(User.agency_id, *AnalyticsService._agency_aggregates())
+        if agency_ids is not None:
+            query = query.filter(User.agency_id.in_(agency_ids))
+        
+        rows = query.group_by(User.agency_id).all()
+        return {row.agency_id: AnalyticsService._format_agency_row(row) for row in rows}
+    
+    @staticmethod
+    def get_bank_analytics():
+        """Get bank-wide totals plus the per-agency breakdown from one grouped query."""
+        agencies = AnalyticsService.get_agencies_analytics()
+        
+        total_users = sum(a['total_users'] for a in agencies.values())
+        total_volume = sum(a['total_volume'] for a in agencies.values())
         
         return {
             'total_users': total_users,
-            'active_users': active_users,
-            'pending_users': pending_users,
-            'risk_levels': risk_levels,
+            'active_users': sum(a['active_users'] for a in agencies.values()),
+            'pending_users': sum(a['pending_users'] for a in agencies.values()),
+            'risk_levels': {
+                level: sum(a['risk_levels'][level] for a in agencies.values())
+                for level in ('low', 'medium', 'high')
+            },
             'total_volume': total_volume,
-            'avg_transaction': avg_transaction
-        } 
\ No newline at end of file
+            'avg_transaction': total_volume / total_users if total_users > 0 else 0,
+            'agencies': [
+                dict(agency_data, agency_id=agency_id)
+                for agency_id, agency_data in agencies.items()
+            ]
+        }
@@ -0,0 +1,65 @@
+from models import ChatMessage
+from extensions import db
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+
+class ChatHistoryService:
+    """Append-only storage of chatbot turns with cursor pagination and age-based pruning."""
+
+    RETENTION_DAYS = 90
+    DEFAULT_PAGE_SIZE = 20
+    MAX_PAGE_SIZE = 100
+    PRUNE_CHUNK = 5000
+
+    @staticmethod
+    def insert_turns(rows):
+        """Insert a batch of turns (dicts of ChatMessage columns) in one executemany."""
+        if not rows:
+            return 0
+        db.session.execute(ChatMessage.__table__.insert(), rows)
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def get_history(user_key, cursor=None, limit=None):
+        """Return (turns newest first, next_cursor) for one chatbot user.
+
+        The cursor is the id of the last turn of the previous page; pages are
+        read with an index range scan on (user_key, id), so deep pages cost
+        the same as the first one.
+        """
+        limit = min(limit or ChatHistoryService.DEFAULT_PAGE_SIZE, ChatHistoryService.MAX_PAGE_SIZE)
+        query = ChatMessage.query.filter(ChatMessage.user_key == user_key)
+        if cursor:
+            query = query.filter(ChatMessage.id < cursor)
+        messages = query.order_by(ChatMessage.id.desc()).limit(limit + 1).all()
+
+        next_cursor = messages[limit - 1].id if len(messages) > limit else None
+        turns = [{
+            'id': message.id,
+            'user_input': message.user_input,
+            'bot_response': message.bot_response,
+            'category': message.category,
+            'sentiment': message.sentiment,
+            'timestamp': message.created_at.isoformat() if message.created_at else None
+        } for message in messages[:limit]]
+        return turns, next_cursor
+
+    @staticmethod
+    def prune(retention_days=None):
+        """Delete turns older than the retention window, in chunks to keep locks short."""
+        cutoff = datetime.utcnow() - timedelta(days=retention_days or ChatHistoryService.RETENTION_DAYS)
+        deleted = 0
+        while True:
+            ids = db.session.execute(
+                select(ChatMessage.id)
+                .where(ChatMessage.created_at < cutoff)
+                .order_by(ChatMessage.id)
+                .limit(ChatHistoryService.PRUNE_CHUNK)
+            ).scalars().all()
+            if not ids:
+                break
+            db.session.execute(delete(ChatMessage).where(ChatMessage.id.in_(ids)))
+            db.session.commit()
+            deleted += len(ids)
+        return deleted
@@ -0,0 +1,215 @@
+from models import UploadSession, Document
+from extensions import db
+from services.upload_storage import UploadStorageService
+from services.document_storage import DocumentStorageService
+from datetime import datetime, timedelta
+from sqlalchemy import update
+import hashlib
+import io
+import os
+import secrets
+
+class UploadError(Exception):
+    """A chunked-upload request the client must correct; carries the HTTP status."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+class ChunkedUploadService:
+    """Resumable uploads: init a session, PUT chunks at explicit offsets, finalize.
+
+    Chunks are written into <UPLOAD_FOLDER>/.incoming/<session id>.part and
+    the session row tracks how many bytes are durable, so a client that lost
+    its connection asks for the offset and resumes from there, from any
+    worker. Finalizing verifies the size and the SHA-256 (when the client
+    sent one) and moves the file into content-addressed storage.
+
+    Concurrent requests on one session (a client retrying a PUT whose
+    response it never got, a double-clicked finalize) are serialized by
+    conditional status UPDATEs: a request first moves the session from
+    'open' to 'appending' or 'finalizing' and only touches the file if it
+    won; the others get a 409. A claim left behind by a crashed worker is
+    taken over after CLAIM_TIMEOUT.
+    """
+
+    CHUNK_SIZE = 1024 * 1024  # suggested to clients
+    MAX_CHUNK_SIZE = 8 * 1024 * 1024
+    MAX_FILE_SIZE = 50 * 1024 * 1024
+    ABANDONED_AFTER = timedelta(hours=24)
+    CLAIM_TIMEOUT = timedelta(minutes=5)
+    READ_SIZE = 64 * 1024
+
+    @staticmethod
+    def part_path(session_id):
+        return os.path.join(UploadStorageService.incoming_folder(), f'{session_id}.part')
+
+    @staticmethod
+    def create_session(user_id, document_type, file_type, total_size, sha256=None):
+        if total_size <= 0 or total_size > ChunkedUploadService.MAX_FILE_SIZE:
+            raise UploadError(f'File size must be between 1 and {ChunkedUploadService.MAX_FILE_SIZE} bytes')
+        if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256.lower())):
+            raise UploadError('sha256 must be 64 hexadecimal characters')
+
+        session = UploadSession(
+            id=secrets.token_hex(16),
+            user_id=user_id,
+            document_type=document_type,
+            file_type=file_type,
+            total_size=total_size,
+            received_size=0,
+            sha256=sha256.lower() if sha256 else None,
+            status='open'
+        )
+        open(ChunkedUploadService.part_path(session.id), 'wb').close()
+        db.session.add(session)
+        db.session.commit()
+        return session
+
+    @staticmethod
+    def get_session(session_id, user_id):
+        session = UploadSession.query.get(session_id)
+        if not session or session.user_id != int(user_id):
+            raise UploadError('Upload not found', 404)
+        return session
+
+    @staticmethod
+    def _claim(session, status, **conditions):
+        """Move the session from 'open' (or a stale claim) to status; False if another request holds it."""
+        now = datetime.utcnow()
+        stale = now - ChunkedUploadService.CLAIM_TIMEOUT
+        result = db.session.execute(
+            update(UploadSession)
+            .where(
+                UploadSession.id == session.id,
+                (UploadSession.status == 'open')
+                | (UploadSession.status.in_(('appending', 'finalizing')) & (UploadSession.updated_at < stale)),
+                *[getattr(UploadSession, column) == value for column, value in conditions.items()]
+            )
+            .values(status=status, updated_at=now)
+        )
+        db.session.commit()
+        db.session.refresh(session)
+        return result.rowcount == 1
+
+    @staticmethod
+    def _claim_lost(session):
+        if session.status == 'open':
+            raise UploadError('Unexpected offset', 409, offset=session.received_size)
+        raise UploadError(f'Upload is {session.status}', 409, offset=session.received_size)
+
+    @staticmethod
+    def _release(session, **values):
+        session.status = 'open'
+        session.updated_at = datetime.utcnow()
+        for column, value in values.items():
+            setattr(session, column, value)
+        db.session.commit()
+
+    @staticmethod
+    def append_chunk(session, offset, data, chunk_sha256=None):
+        """Write one chunk at `offset`, which must be the number of bytes received so far."""
+        if session.status in ('finalized', 'expired'):
+            raise UploadError(f'Upload is {session.status}', 409)
+        if offset != session.received_size:
+            raise UploadError('Unexpected offset', 409, offset=session.received_size)
+        if not data:
+            raise UploadError('Empty chunk')
+        if len(data) > ChunkedUploadService.MAX_CHUNK_SIZE:
+            raise UploadError(f'Chunks are limited to {ChunkedUploadService.MAX_CHUNK_SIZE} bytes', 413)
+        if offset + len(data) > session.total_size:
+            raise UploadError('Chunk goes past the declared file size', 416)
+        if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+            raise UploadError('Chunk checksum mismatch', 422, offset=session.received_size)
+
+        # Claim the offset before writing: a concurrent PUT at the same offset loses here
+        if not ChunkedUploadService._claim(session, 'appending', received_size=offset):
+            ChunkedUploadService._claim_lost(session)
+
+        try:
+            with open(ChunkedUploadService.part_path(session.id), 'r+b') as part:
+                part.seek(offset)
+                part.write(data)
+                part.truncate()
+                part.flush()
+                os.fsync(part.fileno())
+        except Exception:
+            ChunkedUploadService._release(session)
+            raise
+        ChunkedUploadService._release(session, received_size=offset + len(data))
+        return session.received_size
+
+    @staticmethod
+    def finalize(session):
+        """Verify the assembled file and move it into storage; returns (content_hash, path, size)."""
+        if session.status in ('finalized', 'expired'):
+            raise UploadError(f'Upload is {session.status}', 409)
+        if session.received_size != session.total_size:
+            raise UploadError('Upload is incomplete', 409, offset=session.received_size)
+        if not ChunkedUploadService._claim(session, 'finalizing', received_size=session.total_size):
+            ChunkedUploadService._claim_lost(session)
+
+        part_path = ChunkedUploadService.part_path(session.id)
+        try:
+            digest = hashlib.sha256()
+            with open(part_path, 'rb') as part:
+                while True:
+                    block = part.read(ChunkedUploadService.READ_SIZE)
+                    if not block:
+                        break
+                    digest.update(block)
+            content_hash = digest.hexdigest()
+
+            if session.sha256 and content_hash != session.sha256:
+                # Start over from scratch rather than keep bytes we know are wrong
+                open(part_path, 'wb').close()
+                ChunkedUploadService._release(session, received_size=0)
+                raise UploadError('File checksum mismatch, upload again from offset 0', 422, offset=0)
+
+            path, _ = UploadStorageService.adopt(part_path, session.file_type, content_hash)
+        except UploadError:
+            raise
+        except Exception:
+            ChunkedUploadService._release(session)
+            raise
+        session.status = 'finalized'
+        session.updated_at = datetime.utcnow()
+        db.session.commit()
+        return content_hash, path, session.total_size
+
+    @staticmethod
+    def open_finalized(session_id, user_id):
+        """Stored bytes of a finalized upload's document, as a file object (for /api/kyc/check)."""
+        session = ChunkedUploadService.get_session(session_id, user_id)
+        if session.status != 'finalized' or session.document_id is None:
+            raise UploadError('Upload is not finalized into a document', 409)
+        document = Document.query.get(session.document_id)
+        return io.BytesIO(DocumentStorageService.read(document.file_path))
+
+    @staticmethod
+    def collect_abandoned(older_than=None):
+        """Expire open sessions idle for too long and delete their temp files; returns the count."""
+        cutoff = datetime.utcnow() - (older_than or ChunkedUploadService.ABANDONED_AFTER)
+        sessions = UploadSession.query.filter(
+            UploadSession.status.in_(('open', 'appending', 'finalizing')),
+            UploadSession.updated_at < cutoff
+        ).all()
+        for session in sessions:
+            part_path = ChunkedUploadService.part_path(session.id)
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            session.status = 'expired'
+        db.session.commit()
+
+        # Temp files whose session row is gone (e.g. crash between file and row creation)
+        incoming = UploadStorageService.incoming_folder()
+        for name in os.listdir(incoming):
+            path = os.path.join(incoming, name)
+            if datetime.utcfromtimestamp(os.path.getmtime(path)) >= cutoff:
+                continue
+            session_id = name[:-len('.part')] if name.endswith('.part') else None
+            if session_id is None or UploadSession.query.get(session_id) is None:
+                os.remove(path)
+        return len(sessions)
@@ -0,0 +1,282 @@
+"""
+Field extraction from uploaded identity and proof documents.
+
+Each document type has one entry in EXTRACTORS saying which fields it
+yields and whether it carries an ICAO MRZ. Extraction OCRs as little of the
+image as it can:
+
+1. for MRZ documents, the MRZ band is located on a downscaled copy
+   (morphology only, no OCR) and Tesseract reads just that strip with an
+   MRZ character whitelist; a strip whose check digits all match gives the
+   name, document number, birth and expiry dates directly;
+2. only the fields still missing after that are looked for in the OCR text
+   of the document region (the card or page cropped from the photo), with
+   the precompiled patterns of FIELD_PATTERNS.
+
+The imaging helpers (reduced decode, document region, OCR) are shared with
+the chatbot's photo analysis.
+"""
+import io
+import re
+import unicodedata
+import cv2
+import numpy as np
+import pytesseract
+from PIL import Image
+from services.mrz import parse_mrz
+
+OCR_MAX_SIDE = 1600
+MRZ_SEARCH_WIDTH = 800
+MRZ_OCR_WIDTH = 1400  # MRZ strip width for Tesseract: ~30 px per character line
+MRZ_OCR_CONFIG = '--psm 6 -c tessedit_char_whitelist=ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<'
+REDUCED_DECODE_FLAGS = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+def decode_image(data, max_side=None, long_side=None, resize=True):
+    """Decode an uploaded image from memory straight to grayscale, or None if unreadable.
+
+    With max_side, the decoder itself scales down by the largest power of two
+    that keeps the long side >= max_side (JPEG decodes at 1/2, 1/4 or 1/8 for
+    much less work), then the result is resized to exactly max_side unless
+    resize is False. long_side spares reading the header when the caller
+    already knows the image size.
+    """
+    factor = 1
+    if max_side:
+        if long_side is None:
+            try:
+                long_side = max(Image.open(io.BytesIO(data)).size)  # header only
+            except Exception:
+                return None
+        while factor < 8 and long_side // (factor * 2) >= max_side:
+            factor *= 2
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), REDUCED_DECODE_FLAGS[factor])
+    if img is None or not max_side or not resize:
+        return img
+    return downscale(img, max_side)
+
+def downscale(img, max_side):
+    """Shrink img so its long side is at most max_side."""
+    height, width = img.shape[:2]
+    scale = max_side / max(height, width)
+    if scale >= 1:
+        return img
+    return cv2.resize(img, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+def crop(gray, region):
+    """Crop a region given as fractions (x, y, w, h) of the frame."""
+    if not region:
+        return gray
+    height, width = gray.shape[:2]
+    x, y, w, h = region
+    return gray[int(y * height):int((y + h) * height), int(x * width):int((x + w) * width)]
+
+def document_region(small_gray):
+    """Bounding box of the largest edge contour as fractions (x, y, w, h) of the frame, or None."""
+    edges = cv2.Canny(cv2.GaussianBlur(small_gray, (5, 5), 0), 50, 150)
+    edges = cv2.dilate(edges, np.ones((5, 5), np.uint8))
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    x, y, w, h = cv2.boundingRect(max(contours, key=cv2.contourArea))
+    height, width = small_gray.shape
+    # Too small to be the document itself: OCR the whole frame instead
+    if w * h < 0.2 * width * height:
+        return None
+    return x / width, y / height, w / width, h / height
+
+def extract_text(gray, region=None):
+    """OCR the document region of a full-resolution grayscale image after Otsu binarisation."""
+    gray = downscale(crop(gray, region), OCR_MAX_SIDE)
+    _, binary = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return pytesseract.image_to_string(binary, lang='fra')
+
+def mrz_region(gray):
+    """Box of the MRZ band as fractions (x, y, w, h) of the frame, or None.
+
+    Dark monospaced text on a light background: a blackhat transform keeps
+    the characters, a horizontal gradient plus closing merges each line into
+    a bar, and the MRZ is the lowest wide, flat blob.
+    """
+    small = downscale(gray, MRZ_SEARCH_WIDTH)
+    height, width = small.shape
+    small = cv2.GaussianBlur(small, (3, 3), 0)
+    blackhat = cv2.morphologyEx(small, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5)))
+    gradient = np.absolute(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=-1))
+    gradient = cv2.normalize(gradient, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    gradient = cv2.morphologyEx(gradient, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (13, 5)))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Join the 2-3 MRZ lines into one block
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (21, 21)))
+    mask = cv2.erode(mask, None, iterations=4)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    best = None
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w >= 0.6 * width and w / max(h, 1) >= 4 and (best is None or y > best[1]):
+            best = (x, y, w, h)
+    if best is None:
+        return None
+    x, y, w, h = best
+    # Erosion trimmed the edges; take some margin back
+    pad_x, pad_y = int(0.03 * width), int(0.35 * h)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    return x0 / width, y0 / height, (x1 - x0) / width, (y1 - y0) / height
+
+def read_mrz(gray, formats, region=None):
+    """Locate and OCR the MRZ strip only; returns the parsed MRZ or None."""
+    gray = crop(gray, region)
+    band = mrz_region(gray)
+    if band is None:
+        return None
+    strip = crop(gray, band)
+    scale = MRZ_OCR_WIDTH / strip.shape[1]
+    strip = cv2.resize(strip, (MRZ_OCR_WIDTH, max(1, int(strip.shape[0] * scale))),
+                       interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_CUBIC)
+    _, binary = cv2.threshold(strip, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return parse_mrz(pytesseract.image_to_string(binary, config=MRZ_OCR_CONFIG), formats)
+
+# --- Field patterns, compiled once ---
+
+def _clean(value):
+    return re.sub(r'\s+', ' ', value).strip(' :.-,')
+
+def _iso_date(match):
+    day, month, year = (int(group) for group in match.groups()[:3])
+    if not (1 <= day <= 31 and 1 <= month <= 12):
+        return None
+    return f'{year:04d}-{month:02d}-{day:02d}'
+
+DATE = r'(\d{1,2})\s*[./\- ]\s*(\d{1,2})\s*[./\- ]\s*((?:19|20)\d{2})'
+NAME = r"([A-ZÀ-Ý][A-ZÀ-Ýa-zà-ÿ' \-]{1,60})"
+
+# field -> (pattern, value from match); the first pattern that matches wins
+FIELD_PATTERNS = {
+    'last_name': [
+        (re.compile(r'^\s*(?:Nom(?! de jeune)|Surname)\s*[:.]?\s*' + NAME + r'\s*$', re.I | re.M),
+         lambda m: _clean(m.group(1))),
+    ],
+    'first_name': [
+        (re.compile(r'^\s*(?:Pr[ée]noms?|Given names?)\s*[:.]?\s*' + NAME + r'\s*$', re.I | re.M),
+         lambda m: _clean(m.group(1))),
+    ],
+    'id_number': [
+        # Numéro d'identification national: 18 digits
+        (re.compile(r'\b(\d{18})\b'), lambda m: m.group(1)),
+        (re.compile(r"\bN(?:°|o|um[ée]ro)\.?\s*[:.]?\s*([A-Z0-9]{6,12})\b", re.I), lambda m: m.group(1).upper()),
+    ],
+    'birth_date': [
+        (re.compile(r'(?:N[ée]\(?e?\)?\s+le|Date de naissance|Date of birth)\s*[:.]?\s*' + DATE, re.I), _iso_date),
+    ],
+    'birth_place': [
+        (re.compile(r'(?:Lieu de naissance|Place of birth)\s*[:.]?\s*' + NAME, re.I), lambda m: _clean(m.group(1))),
+        (re.compile(r'N[ée]\(?e?\)?\s+le\s*' + DATE + r'\s*[àa]\s+' + NAME, re.I), lambda m: _clean(m.group(4))),
+    ],
+    'address': [
+        (re.compile(r'(?:Adresse|Demeurant\s+[àa]|Domicili[ée]\(?e?\)?\s+[àa])\s*[:.]?\s*(.{5,120})$', re.I | re.M),
+         lambda m: _clean(m.group(1))),
+    ],
+    'wilaya': [
+        (re.compile(r"\bWilaya\s*(?:de\s+|d')?\s*[:.]?\s*([A-Za-zÀ-ÿ' \-]{3,40}?)\s*(?:$|,|\d)", re.I | re.M),
+         lambda m: _clean(m.group(1)).title()),
+    ],
+    'parents': [
+        (re.compile(r'(?:Fils|Fille|Enfant)\s+de\s*[:.]?\s*' + NAME + r'\s+et\s+de\s+' + NAME, re.I),
+         lambda m: {'father': _clean(m.group(1)), 'mother': _clean(m.group(2))}),
+    ],
+}
+
+def normalize_ocr_text(text):
+    """Recompose accents and drop the stray characters Tesseract puts at line starts."""
+    text = unicodedata.normalize('NFC', text)
+    return re.sub(r'^[|_~`]+\s*', '', text, flags=re.M)
+
+def extract_fields(text, fields):
+    """Apply FIELD_PATTERNS for the requested fields; missing ones are None."""
+    text = normalize_ocr_text(text)
+    data = {}
+    for field in fields:
+        data[field] = None
+        for pattern, value in FIELD_PATTERNS.get(field, ()):
+            match = pattern.search(text)
+            if match:
+                data[field] = value(match)
+                if data[field]:
+                    break
+    return data
+
+class DocumentExtractor:
+    """How to extract one document type: the fields it yields and the MRZ formats it may carry.
+
+    The region OCR only runs when a `required` field (all fields by default)
+    is still missing after the MRZ; it then fills every missing field.
+    """
+
+    def __init__(self, fields, mrz_formats=(), required=None):
+        self.fields = tuple(fields)
+        self.mrz_formats = tuple(mrz_formats)
+        self.required = tuple(required) if required is not None else self.fields
+
+    def from_mrz(self, mrz):
+        data = {
+            'last_name': mrz['last_name'],
+            'first_name': mrz['first_name'],
+            'id_number': mrz.get('personal_number') or mrz.get('optional_data') or mrz['document_number'],
+            'document_number': mrz['document_number'],
+            'birth_date': mrz['birth_date'],
+            'expiry_date': mrz['expiry_date'],
+            'sex': mrz['sex'],
+            'nationality': mrz['nationality'],
+        }
+        return {field: value for field, value in data.items() if field in self.fields and value}
+
+    def extract(self, gray, detect_region=True):
+        """Fields from a full-resolution grayscale image; MRZ first, region OCR only for what is missing.
+
+        detect_region=False for rendered PDF pages, which are the document already.
+        """
+        region = document_region(downscale(gray, MRZ_SEARCH_WIDTH)) if detect_region else None
+        data = {}
+        mrz = read_mrz(gray, self.mrz_formats, region) if self.mrz_formats else None
+        if mrz and mrz['valid']:
+            data.update(self.from_mrz(mrz))
+        missing = [field for field in self.fields if field not in data and field != 'name']
+        if any(field in missing for field in self.required):
+            data.update(extract_fields(extract_text(gray, region), missing))
+        if 'name' in self.fields:
+            data['name'] = ' '.join(part for part in (data.get('first_name'), data.get('last_name')) if part) or None
+        data['mrz'] = {'format': mrz['format'], 'valid': mrz['valid'], 'checks': mrz['checks']} if mrz else None
+        return data
+
+IDENTITY_FIELDS = ('name', 'first_name', 'last_name', 'id_number', 'birth_date', 'birth_place',
+                   'document_number', 'expiry_date', 'sex', 'nationality')
+# A valid MRZ has all of these: no full-text OCR just for the birth place
+IDENTITY_REQUIRED = ('first_name', 'last_name', 'id_number', 'birth_date')
+
+# Document type -> extractor; a new document type only needs an entry here
+EXTRACTORS = {
+    'id': DocumentExtractor(IDENTITY_FIELDS, mrz_formats=('TD1',), required=IDENTITY_REQUIRED),
+    'passport': DocumentExtractor(IDENTITY_FIELDS, mrz_formats=('TD3',), required=IDENTITY_REQUIRED),
+    'residency': DocumentExtractor(('address', 'wilaya')),
+    'birth_certificate': DocumentExtractor(('name', 'first_name', 'last_name', 'birth_date', 'birth_place', 'parents')),
+}
+
+def extract_document(file_path, document_type):
+    """Extract the fields of a stored document image; returns (ok, data or error message)."""
+    extractor = EXTRACTORS.get(document_type)
+    if extractor is None:
+        return False, f'No extractor for document type {document_type}'
+    if file_path.lower().endswith('.pdf'):
+        # Imported here: the PDF module imports EXTRACTORS from this one
+        from services.pdf_extraction import extract_pdf
+        return True, extract_pdf(file_path, document_type)
+    gray = cv2.imdecode(np.fromfile(file_path, dtype=np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return False, 'Unreadable image'
+    return True, extractor.extract(gray)
@@ -0,0 +1,357 @@
+"""
+Storage tiers of reviewed documents, and the cheapest way to serve them.
+
+A document stays exactly as uploaded while it is pending: quality checks,
+extraction and hashing all read the original. Once it is verified or
+rejected, the compaction job (tasks/document_compaction_task.py) moves it
+through two tiers:
+
+- 'compacted': review thumbnails (THUMBNAIL_SIDES, WebP or JPEG) are cached
+  next to the uploads, keyed by content hash like the uploads themselves,
+  and the file is re-encoded: PNGs to lossless WebP, JPEGs to a progressive
+  JPEG with optimized Huffman tables and the original quantization tables.
+  The result is decoded and compared with the original, and only kept if
+  it saves at least MIN_SAVING and is pixel-identical (WebP) or within
+  NEAR_LOSSLESS_MIN_PSNR (JPEG, where the colour conversion round trip moves
+  a few pixels by a level or two); PDFs are kept as uploaded.
+- 'archived': ARCHIVE_AFTER_DAYS after review the file moves to the cold
+  folder (ARCHIVE_FOLDER/documents), gzip-compressed when that saves
+  MIN_SAVING. Thumbnails stay in hot storage.
+
+A stored file is shared by every Document pointing to it (identical uploads
+are stored once, see UploadStorageService), so each step handles all the
+documents of one file together, and is skipped while any of them is pending.
+New files are written under their own names before the documents are
+repointed. The names derive from the content hash, so an existing one is
+reused, and an abandoned step only removes a file it created and no
+document points to. The repointing transaction re-reads which documents use the old
+file: if an upload of the same content attached a new document to it in
+the meantime, the step is abandoned (and retried by the next run).
+Otherwise the old file is handed to UploadStorageService.discard_if_unreferenced,
+which keeps it when an upload adopted it but has not committed its
+document yet.
+
+representation() picks what to send for a requested size and the types the
+client accepts: a cached thumbnail (rendered on demand if missing), the
+stored file, or the stored file decompressed or transcoded in memory.
+"""
+import gzip
+import hashlib
+import io
+import os
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from PIL import Image, ImageOps
+from extensions import db
+from models import Document, DocumentStatus
+from services.upload_storage import UploadStorageService
+
+THUMBNAIL_SIDES = (320, 1280)
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_FOLDER = '.thumbnails'
+PDF_THUMBNAIL_DPI = 110  # an A4 page is ~1290 px high, just above the largest thumbnail
+MIN_SAVING = 0.10
+NEAR_LOSSLESS_MIN_PSNR = 50  # dB against the decoded original
+ARCHIVE_AFTER_DAYS = 180
+COMPACTION_BATCH_SIZE = 100
+
+REENCODED_MODES = {'1', 'L', 'LA', 'P', 'RGB', 'RGBA'}  # 8-bit modes WebP can hold without loss
+MIMETYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'webp': 'image/webp',
+    'pdf': 'application/pdf'
+}
+
+def _shard(folder, content_hash, name):
+    return os.path.join(folder, content_hash[:2], content_hash[2:4], name)
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+        os.replace(temp_path, path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _write_new(path, data):
+    """Write a step's target file unless it already exists; True if this call created it.
+
+    Targets are named after the content hash, so an existing one holds the
+    same bytes and may already be used by other documents: it is reused as is.
+    """
+    if os.path.exists(path):
+        return False
+    _write_atomic(path, data)
+    return True
+
+def _abandon_new(path, created):
+    """Undo _write_new after an abandoned step, keeping a file that other documents point to."""
+    if created and not UploadStorageService.is_referenced(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def _pixels(img, mode):
+    return np.asarray(img.convert(mode), dtype=np.int16)
+
+class DocumentStorageService:
+
+    @staticmethod
+    def thumbnail_folder():
+        return os.path.join(current_app.config['UPLOAD_FOLDER'], THUMBNAIL_FOLDER)
+
+    @staticmethod
+    def archive_folder():
+        return os.path.join(current_app.config['ARCHIVE_FOLDER'], 'documents')
+
+    @staticmethod
+    def stored_format(path):
+        """Format of a stored file from its name, ignoring the archive's .gz."""
+        if path.endswith('.gz'):
+            path = path[:-3]
+        return path.rsplit('.', 1)[-1].lower()
+
+    @staticmethod
+    def read(path):
+        """Bytes of a stored file in its stored format (archived files are decompressed)."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        return gzip.decompress(data) if path.endswith('.gz') else data
+
+    @staticmethod
+    def render_thumbnail(data, extension, side, image_format='webp'):
+        """Encoded thumbnail fitting in side x side of an image or a PDF's first page."""
+        if extension == 'pdf':
+            from services.pdf_extraction import render_document_page
+            img = Image.fromarray(render_document_page(data, 0, PDF_THUMBNAIL_DPI))
+        else:
+            img = Image.open(io.BytesIO(data))
+            # JPEGs decode straight at a reduced scale (1/2 to 1/8) when the thumbnail allows it
+            img.draft('RGB', (side, side))
+            img = ImageOps.exif_transpose(img)
+        if img.mode not in ('L', 'RGB'):
+            img = img.convert('RGB')
+        img.thumbnail((side, side), Image.LANCZOS)
+        buffer = io.BytesIO()
+        if image_format == 'webp':
+            img.save(buffer, 'WEBP', quality=THUMBNAIL_QUALITY, method=4)
+        else:
+            img.save(buffer, 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+    @staticmethod
+    def thumbnail(document, side, image_format='webp', data=None):
+        """Path of a cached thumbnail of the document, rendered first if needed.
+
+        data: the stored file's bytes, if already read, to avoid reading it again.
+        """
+        path = _shard(DocumentStorageService.thumbnail_folder(), document.content_hash,
+                      f'{document.content_hash}-{side}.{image_format}')
+        if not os.path.exists(path):
+            if data is None:
+                data = DocumentStorageService.read(document.file_path)
+            extension = DocumentStorageService.stored_format(document.file_path)
+            _write_atomic(path, DocumentStorageService.render_thumbnail(data, extension, side, image_format))
+        return path
+
+    @staticmethod
+    def reencode(data, extension):
+        """Faithful smaller re-encoding of an image as (bytes, extension), or None if it doesn't save MIN_SAVING."""
+        if extension == 'pdf':
+            return None
+        try:
+            img = Image.open(io.BytesIO(data))
+            img.load()
+        except Exception:
+            return None
+        if img.mode not in REENCODED_MODES:
+            return None
+        metadata = {key: img.info[key] for key in ('exif', 'icc_profile') if img.info.get(key)}
+        buffer = io.BytesIO()
+        if img.format == 'JPEG':
+            # Lossless WebP of a decoded photo is 2-4x the JPEG: re-encode the JPEG itself instead
+            img.save(buffer, 'JPEG', quality='keep', subsampling='keep', optimize=True, progressive=True, **metadata)
+            new_extension, min_psnr = 'jpg', NEAR_LOSSLESS_MIN_PSNR
+        else:
+            img.save(buffer, 'WEBP', lossless=True, quality=100, method=4, **metadata)
+            new_extension, min_psnr = 'webp', float('inf')
+        encoded = buffer.getvalue()
+        if len(encoded) > (1 - MIN_SAVING) * len(data):
+            return None
+
+        mode = 'RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB'
+        with Image.open(io.BytesIO(encoded)) as decoded:
+            mse = np.mean(np.square(_pixels(decoded, mode) - _pixels(img, mode), dtype=np.float64))
+        psnr = 10 * np.log10(255 ** 2 / mse) if mse else float('inf')
+        return (encoded, new_extension) if psnr >= min_psnr else None
+
+    @staticmethod
+    def _repoint(documents, path, tier, size):
+        """Move the documents to path; False (nothing changed) if other documents took up their file meanwhile."""
+        old_path = documents[0].file_path
+        if old_path != path:
+            # In the committing transaction, locked on PostgreSQL
+            others = Document.query.filter(
+                Document.file_path == old_path,
+                Document.id.notin_([document.id for document in documents])
+            ).with_for_update().first()
+            if others is not None:
+                db.session.rollback()
+                return False
+        for document in documents:
+            document.file_path = path
+            document.storage_tier = tier
+            document.storage_size = size
+            if tier == 'compacted':
+                document.compacted_at = datetime.utcnow()
+        db.session.commit()
+        if old_path != path:
+            UploadStorageService.discard_if_unreferenced(old_path)
+        return True
+
+    @staticmethod
+    def compact(documents):
+        """Thumbnails and a re-encoded file for the documents sharing one stored file; returns bytes saved (None: skipped)."""
+        path = documents[0].file_path
+        data = DocumentStorageService.read(path)
+        content_hash = documents[0].content_hash or hashlib.sha256(data).hexdigest()
+        for document in documents:
+            document.content_hash = document.content_hash or content_hash  # files stored before hashing
+        extension = DocumentStorageService.stored_format(path)
+
+        if extension in MIMETYPES:
+            for side in THUMBNAIL_SIDES:
+                DocumentStorageService.thumbnail(documents[0], side, data=data)
+
+        reencoded = DocumentStorageService.reencode(data, extension)
+        if reencoded is None:
+            DocumentStorageService._repoint(documents, path, 'compacted', len(data))
+            return 0
+        encoded, new_extension = reencoded
+        # Its own name: the upload path must keep holding exactly the bytes of its hash
+        new_path = _shard(current_app.config['UPLOAD_FOLDER'], content_hash, f'{content_hash}.compact.{new_extension}')
+        created = _write_new(new_path, encoded)
+        if not DocumentStorageService._repoint(documents, new_path, 'compacted', len(encoded)):
+            _abandon_new(new_path, created)
+            return None
+        return len(data) - len(encoded)
+
+    @staticmethod
+    def archive(documents):
+        """Move the file shared by these documents to the cold folder; returns bytes saved (None: skipped)."""
+        path = documents[0].file_path
+        data = DocumentStorageService.read(path)
+        name = os.path.basename(path)
+        compressed = gzip.compress(data, compresslevel=9)
+        if len(compressed) <= (1 - MIN_SAVING) * len(data):
+            data, name = compressed, name + '.gz'
+        new_path = _shard(DocumentStorageService.archive_folder(), documents[0].content_hash, name)
+        created = _write_new(new_path, data)
+        saved = (documents[0].storage_size or os.path.getsize(path)) - len(data)
+        if not DocumentStorageService._repoint(documents, new_path, 'archived', len(data)):
+            _abandon_new(new_path, created)
+            return None
+        return saved
+
+    @staticmethod
+    def _by_file(documents):
+        """Group documents by stored file, dropping files that a pending document still uses."""
+        groups = defaultdict(list)
+        for document in documents:
+            groups[document.file_path].append(document)
+        pending = {
+            path for (path,) in db.session.query(Document.file_path).filter(
+                Document.file_path.in_(list(groups)),
+                Document.status == DocumentStatus.PENDING
+            )
+        }
+        return [group for path, group in groups.items() if path not in pending]
+
+    @staticmethod
+    def _run(query, step, batch_size):
+        """Apply step to every file of the documents matched by query, in id order; returns (files, bytes saved).
+
+        step returns the bytes saved, or None when it leaves the file alone.
+        """
+        files = saved = last_id = 0
+        while True:
+            documents = query.filter(Document.id > last_id).order_by(Document.id).limit(batch_size).all()
+            if not documents:
+                break
+            last_id = documents[-1].id
+            for group in DocumentStorageService._by_file(documents):
+                # Other documents of the same file, outside this batch, move with it
+                group = Document.query.filter(Document.file_path == group[0].file_path).all()
+                try:
+                    result = step(group)
+                    if result is not None:
+                        saved += result
+                        files += 1
+                except Exception as e:
+                    # Missing or unreadable file: leave it where it is, the next run retries
+                    db.session.rollback()
+                    current_app.logger.warning(f"Document storage: {group[0].file_path} skipped: {e}")
+        return files, saved
+
+    @staticmethod
+    def compact_reviewed(batch_size=COMPACTION_BATCH_SIZE):
+        """Compact the files of every verified or rejected document still in the 'original' tier."""
+        query = Document.query.filter(
+            Document.storage_tier == 'original',
+            Document.status != DocumentStatus.PENDING
+        )
+        return DocumentStorageService._run(query, DocumentStorageService.compact, batch_size)
+
+    @staticmethod
+    def archive_cold(after_days=ARCHIVE_AFTER_DAYS, batch_size=COMPACTION_BATCH_SIZE):
+        """Archive compacted files whose documents were all reviewed more than after_days ago."""
+        cutoff = datetime.utcnow() - timedelta(days=after_days)
+        query = Document.query.filter(
+            Document.storage_tier == 'compacted',
+            Document.verified_at < cutoff
+        )
+
+        def archive_if_cold(group):
+            if any(document.verified_at is None or document.verified_at >= cutoff for document in group):
+                return None
+            return DocumentStorageService.archive(group)
+
+        return DocumentStorageService._run(query, archive_if_cold, batch_size)
+
+    @staticmethod
+    def representation(document, max_side=None, accept_webp=True):
+        """Cheapest representation of a document for a viewer, as (path or bytes, mimetype, variant).
+
+        max_side: largest side the viewer will display; the smallest cached
+        thumbnail covering it is served instead of the document. Without it,
+        the full document is served in its stored format, decompressed if
+        archived, and transcoded to PNG (lossless) if the viewer can't take
+        WebP.
+        """
+        extension = DocumentStorageService.stored_format(document.file_path)
+        image_format = 'webp' if accept_webp else 'jpg'
+        if max_side and document.content_hash and extension in MIMETYPES:
+            for side in THUMBNAIL_SIDES:
+                if side >= max_side:
+                    path = DocumentStorageService.thumbnail(document, side, image_format)
+                    return path, MIMETYPES[image_format], f'{side}.{image_format}'
+
+        if extension == 'webp' and not accept_webp:
+            with Image.open(io.BytesIO(DocumentStorageService.read(document.file_path))) as img:
+                buffer = io.BytesIO()
+                img.save(buffer, 'PNG')
+            return buffer.getvalue(), MIMETYPES['png'], 'full.png'
+        mimetype = MIMETYPES.get(extension, 'application/octet-stream')
+        if document.file_path.endswith('.gz'):
+            return DocumentStorageService.read(document.file_path), mimetype, f'full.{extension}'
+        return document.file_path, mimetype, f'full.{extension}'
@@ -0,0 +1,116 @@
+import io
+import cv2
+import numpy as np
+import face_recognition
+from PIL import Image, ImageOps
+
+class FacePipeline:
+    """Face encoding that never runs detection on the full-resolution photo.
+
+    face_recognition.face_encodings(image) runs the HOG detector over every
+    pixel: on a 12-megapixel phone photo that is most of the request. Here:
+
+    1. detection runs on a copy downscaled to DETECT_MAX_SIDE (a face filling
+       a selfie, or an ID portrait, is still well above HOG's ~80 px minimum);
+       if nothing is found there, once more at twice that size;
+    2. the largest face is cropped with a margin from the original image and
+       scaled so the face is at most ENCODE_FACE_SIZE px (the encoder aligns
+       faces to a 150 px chip, more pixels add nothing);
+    3. the encoder runs on that crop with the known location: no second
+       detection.
+
+    Locations are returned as fractions of the frame (x, y, w, h), like
+    routes/chatbot.document_region, so a portrait found once on an ID card
+    can be passed back in to skip detection entirely.
+
+    `python bench_face_pipeline.py` compares latency and encodings with the
+    full-resolution path.
+    """
+
+    # Parts of cached results' keys (services/kyc_cache.py): bump when the pipeline changes
+    VERSION = 'roi-1'
+    DETECTOR_VERSION = 'hog-800-x1'
+
+    DETECT_MAX_SIDE = 800
+    ENCODE_FACE_SIZE = 300
+    MARGIN = 0.5  # of the face size, on each side of the crop
+    UPSAMPLE = 1
+
+    @staticmethod
+    def load(data):
+        """Decode an uploaded photo to RGB, upright according to its EXIF orientation."""
+        with Image.open(io.BytesIO(data)) as img:
+            return np.asarray(ImageOps.exif_transpose(img).convert('RGB'))
+
+    @staticmethod
+    def _scaled(rgb, max_side):
+        height, width = rgb.shape[:2]
+        scale = min(1.0, max_side / max(height, width))
+        if scale == 1.0:
+            return rgb, scale
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return cv2.resize(rgb, size, interpolation=cv2.INTER_AREA), scale
+
+    @staticmethod
+    def locate(rgb):
+        """Largest face as (top, right, bottom, left) in full-resolution pixels, or None."""
+        for max_side in (FacePipeline.DETECT_MAX_SIDE, 2 * FacePipeline.DETECT_MAX_SIDE):
+            small, scale = FacePipeline._scaled(rgb, max_side)
+            locations = face_recognition.face_locations(small, FacePipeline.UPSAMPLE)
+            if locations or scale == 1.0:
+                break
+        if not locations:
+            return None
+        top, right, bottom, left = max(locations, key=lambda box: (box[2] - box[0]) * (box[1] - box[3]))
+        return int(top / scale), int(right / scale), int(bottom / scale), int(left / scale)
+
+    @staticmethod
+    def encode_at(rgb, location):
+        """128-d float32 encoding of the face at `location`, from a crop of the original image."""
+        height, width = rgb.shape[:2]
+        top, right, bottom, left = location
+        margin = int(FacePipeline.MARGIN * max(bottom - top, right - left))
+        crop_top, crop_left = max(0, top - margin), max(0, left - margin)
+        crop = rgb[crop_top:min(height, bottom + margin), crop_left:min(width, right + margin)]
+
+        scale = min(1.0, FacePipeline.ENCODE_FACE_SIZE / max(bottom - top, right - left))
+        if scale < 1.0:
+            crop = cv2.resize(crop, (max(1, round(crop.shape[1] * scale)), max(1, round(crop.shape[0] * scale))),
+                              interpolation=cv2.INTER_AREA)
+        box = (
+            int((top - crop_top) * scale), int((right - crop_left) * scale),
+            int((bottom - crop_top) * scale), int((left - crop_left) * scale)
+        )
+        encodings = face_recognition.face_encodings(np.ascontiguousarray(crop), [box])
+        return encodings[0].astype(np.float32) if encodings else None
+
+    @staticmethod
+    def relative(location, shape):
+        top, right, bottom, left = location
+        height, width = shape[:2]
+        return left / width, top / height, (right - left) / width, (bottom - top) / height
+
+    @staticmethod
+    def absolute(portrait, shape):
+        x, y, w, h = portrait
+        height, width = shape[:2]
+        return int(y * height), int((x + w) * width), int((y + h) * height), int(x * width)
+
+    @staticmethod
+    def encode(data, portrait=None):
+        """Encode the main face of an image file's bytes; returns (encoding, portrait) or (None, None).
+
+        portrait is the face box as fractions (x, y, w, h); pass a previously
+        returned one to skip detection on the same image.
+        """
+        rgb = FacePipeline.load(data)
+        if portrait:
+            location = FacePipeline.absolute(portrait, rgb.shape)
+        else:
+            location = FacePipeline.locate(rgb)
+            if location is None:
+                return None, None
+        encoding = FacePipeline.encode_at(rgb, location)
+        if encoding is None:
+            return None, None
+        return encoding, FacePipeline.relative(location, rgb.shape)
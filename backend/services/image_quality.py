@@ -0,0 +1,179 @@
+import io
+import cv2
+import numpy as np
+from PIL import Image
+from services.document_extraction import decode_image, downscale
+from services.pdf_extraction import render_document_page
+
+class ImageQualityService:
+    """Tiered quality check for uploaded document photos.
+
+    Each tier only runs if the previous one passed, cheapest first:
+
+    1. resolution, from the image header (no pixel decode);
+    2. exposure, glare and blur on a grayscale copy decoded at reduced size
+       (JPEG DCT scaling) and resized to ANALYSIS_MAX_SIDE;
+    3. noise, estimated at full resolution on a few tiles as the median
+       absolute deviation of a Laplacian high-pass (robust to edges).
+
+    The result carries a 0-100 score that Document.quality_score stores.
+
+    A PDF only gets the blur check, on its first page (analyze_pdf): pages
+    are rendered at a fixed DPI, so resolution says nothing, and mostly white
+    pages would fail the exposure and glare checks.
+    """
+
+    # Part of cached results' keys (services/kyc_cache.py): bump when thresholds or metrics change
+    VERSION = 'tiered-1'
+
+    MIN_WIDTH = 800
+    MIN_HEIGHT = 600
+    ANALYSIS_MAX_SIDE = 1000
+    PDF_DPI = 100  # an A4 page renders at about 1170 px, just above ANALYSIS_MAX_SIDE
+    MIN_SHARPNESS = 100.0  # Laplacian variance at ANALYSIS_MAX_SIDE
+    MIN_BRIGHTNESS = 40
+    MAX_BRIGHTNESS = 230
+    MAX_GLARE_FRACTION = 0.05  # saturated pixels on an otherwise normally lit photo
+    MAX_NOISE_SIGMA = 20.0
+    NOISE_TILE = 256
+    NOISE_TILES = 4
+
+    # Weight of each metric in the score; tiers not reached count as 0
+    WEIGHTS = {'sharpness': 0.4, 'exposure': 0.2, 'glare': 0.15, 'noise': 0.25}
+
+    # 3x3 high-pass whose response to white noise of std sigma has std 6 * sigma
+    NOISE_KERNEL = np.array([[1, -2, 1], [-2, 4, -2], [1, -2, 1]], dtype=np.float32)
+
+    # A PDF is only checked for blur, so its score is the sharpness alone
+    PDF_WEIGHTS = {'sharpness': 1.0}
+
+    @staticmethod
+    def _result(ok, message, tier, metrics, weights=None):
+        weights = weights or ImageQualityService.WEIGHTS
+        scores = ImageQualityService._metric_scores(metrics)
+        score = sum(weights.get(name, 0.0) * value for name, value in scores.items())
+        return {
+            'ok': ok,
+            'message': message,
+            'score': round(100 * score, 1),
+            'tier': tier,
+            'metrics': metrics
+        }
+
+    @staticmethod
+    def _metric_scores(metrics):
+        """Map raw metrics onto [0, 1], 1 being best."""
+        scores = {}
+        if 'sharpness' in metrics:
+            scores['sharpness'] = min(1.0, metrics['sharpness'] / (3 * ImageQualityService.MIN_SHARPNESS))
+        if 'brightness' in metrics:
+            scores['exposure'] = max(0.0, 1 - abs(metrics['brightness'] - 128) / 128)
+        if 'glare_fraction' in metrics:
+            scores['glare'] = max(0.0, 1 - metrics['glare_fraction'] / ImageQualityService.MAX_GLARE_FRACTION)
+        if 'noise_sigma' in metrics:
+            scores['noise'] = max(0.0, 1 - metrics['noise_sigma'] / ImageQualityService.MAX_NOISE_SIGMA)
+        return scores
+
+    @staticmethod
+    def estimate_noise(gray):
+        """Noise standard deviation from the MAD of a high-pass over a few central tiles."""
+        height, width = gray.shape
+        tile = ImageQualityService.NOISE_TILE
+        if height < 2 * tile or width < 2 * tile:
+            samples = [gray]
+        else:
+            # Tiles spread along the diagonal, away from the borders
+            step = 1.0 / (ImageQualityService.NOISE_TILES + 1)
+            samples = [
+                gray[int(height * step * i) - tile // 2:int(height * step * i) + tile // 2,
+                     int(width * step * i) - tile // 2:int(width * step * i) + tile // 2]
+                for i in range(1, ImageQualityService.NOISE_TILES + 1)
+            ]
+        responses = np.concatenate([
+            cv2.filter2D(sample.astype(np.float32), -1, ImageQualityService.NOISE_KERNEL)[1:-1, 1:-1].ravel()
+            for sample in samples
+        ])
+        mad = np.median(np.abs(responses - np.median(responses)))
+        return float(1.4826 * mad / 6)
+
+    @staticmethod
+    def check_reduced(small, metrics=None):
+        """Tier 2 on a grayscale image already reduced to ANALYSIS_MAX_SIDE.
+
+        Fills in metrics and returns the result of the first failed check,
+        or None when exposure, glare and sharpness are all acceptable.
+        """
+        metrics = {} if metrics is None else metrics
+        metrics['sharpness'] = float(cv2.Laplacian(small, cv2.CV_64F).var())
+        metrics['brightness'] = float(small.mean())
+        metrics['glare_fraction'] = float(np.count_nonzero(small >= 250)) / small.size
+        if metrics['brightness'] < ImageQualityService.MIN_BRIGHTNESS:
+            return ImageQualityService._result(False, "Image is too dark", 'exposure', metrics)
+        if metrics['brightness'] > ImageQualityService.MAX_BRIGHTNESS:
+            return ImageQualityService._result(False, "Image is too bright", 'exposure', metrics)
+        if metrics['glare_fraction'] > ImageQualityService.MAX_GLARE_FRACTION and metrics['brightness'] < 200:
+            return ImageQualityService._result(False, "Image has glare", 'glare', metrics)
+        # After exposure: under- or overexposed photos also have little edge energy
+        if metrics['sharpness'] < ImageQualityService.MIN_SHARPNESS:
+            return ImageQualityService._result(False, "Image is too blurry", 'blur', metrics)
+        return None
+
+    @staticmethod
+    def analyze_pdf(source):
+        """Blur check on the first page of a PDF (path or bytes); same result shape as analyze()."""
+        metrics = {}
+        weights = ImageQualityService.PDF_WEIGHTS
+        try:
+            page = render_document_page(source, 0, dpi=ImageQualityService.PDF_DPI)
+        except Exception:
+            return ImageQualityService._result(False, "Invalid PDF file", 'decode', metrics, weights)
+        small = downscale(page, ImageQualityService.ANALYSIS_MAX_SIDE)
+        metrics['width'], metrics['height'] = page.shape[1], page.shape[0]
+        # Only the inked area: blank space would dilute the variance of a short page
+        ink = small < 200
+        if ink.any():
+            rows, columns = np.flatnonzero(ink.any(axis=1)), np.flatnonzero(ink.any(axis=0))
+            margin = 8
+            small = small[max(rows[0] - margin, 0):rows[-1] + margin + 1,
+                          max(columns[0] - margin, 0):columns[-1] + margin + 1]
+        metrics['sharpness'] = float(cv2.Laplacian(small, cv2.CV_64F).var())
+        if metrics['sharpness'] < ImageQualityService.MIN_SHARPNESS:
+            return ImageQualityService._result(False, "Image is too blurry", 'blur', metrics, weights)
+        return ImageQualityService._result(True, "PDF document", 'passed', metrics, weights)
+
+    @staticmethod
+    def analyze(image_path):
+        """Run the tiers on an image file; returns ok, message, score (0-100), tier and metrics."""
+        return ImageQualityService.analyze_bytes(np.fromfile(image_path, dtype=np.uint8))
+
+    @staticmethod
+    def analyze_bytes(data):
+        """Same as analyze() for an encoded image already in memory (bytes or uint8 array)."""
+        data = np.frombuffer(data, dtype=np.uint8)
+        metrics = {}
+
+        # Tier 1: resolution from the header
+        try:
+            with Image.open(io.BytesIO(data)) as header:
+                width, height = header.size
+        except Exception:
+            return ImageQualityService._result(False, "Invalid image file", 'decode', metrics)
+        metrics['width'], metrics['height'] = width, height
+        if width < ImageQualityService.MIN_WIDTH or height < ImageQualityService.MIN_HEIGHT:
+            return ImageQualityService._result(False, "Image resolution too low", 'resolution', metrics)
+
+        # Tier 2: exposure, glare and blur on a reduced copy
+        small = decode_image(data, ImageQualityService.ANALYSIS_MAX_SIDE, long_side=max(width, height))
+        if small is None:
+            return ImageQualityService._result(False, "Invalid image file", 'decode', metrics)
+        failure = ImageQualityService.check_reduced(small, metrics)
+        if failure is not None:
+            return failure
+
+        # Tier 3: noise at full resolution, on tiles only
+        gray = cv2.imdecode(data, cv2.IMREAD_GRAYSCALE)
+        metrics['noise_sigma'] = ImageQualityService.estimate_noise(gray)
+        if metrics['noise_sigma'] > ImageQualityService.MAX_NOISE_SIGMA:
+            return ImageQualityService._result(False, "Image has too much noise", 'noise', metrics)
+
+        return ImageQualityService._result(True, "Image quality is good", 'passed', metrics)
@@ -0,0 +1,181 @@
+"""
+Per-stage result cache for the KYC pipeline.
+
+Each expensive stage (OCR, face encoding, image quality) is a pure function
+of the uploaded bytes and of the model that processed them, so its output is
+cached under sha256(stage, model version, input content hash). A retried
+/kyc/check with a new selfie but the same ID card recomputes the face
+encoding of the selfie only; bumping a model version invalidates exactly the
+results that model produced.
+
+Two levels, both bounded:
+
+- memory: per-process LRU of the most recently used MAX_MEMORY_ITEMS results;
+- disk: one pickle per result under KYC_CACHE_DIR, sharded like uploads,
+  shared by every worker on the host. When the folder grows past
+  MAX_DISK_BYTES the least recently used files (by mtime, refreshed on every
+  hit) are deleted until it is back under DISK_LOW_WATERMARK of the limit.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+MAX_MEMORY_ITEMS = 512
+MAX_DISK_BYTES = 256 * 1024 * 1024
+DISK_LOW_WATERMARK = 0.8
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'kyc')
+
+_MISSING = object()
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+class StageResultCache:
+    """Memory + disk cache of pipeline stage outputs keyed by content hash and model version."""
+
+    def __init__(self, folder=DEFAULT_CACHE_DIR, max_memory_items=MAX_MEMORY_ITEMS, max_disk_bytes=MAX_DISK_BYTES):
+        self.folder = folder
+        self.max_memory_items = max_memory_items
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_bytes = None  # measured on first write
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(stage, model_version, input_hash):
+        return hashlib.sha256(f'{stage}\0{model_version}\0{input_hash}'.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.pkl')
+
+    def get(self, stage, model_version, input_hash, default=None):
+        key = self.key(stage, model_version, input_hash)
+        with self._lock:
+            value = self._memory.get(key, _MISSING)
+            if value is not _MISSING:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return value
+
+        value = self._read_disk(key)
+        with self._lock:
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._remember(key, value)
+        return value
+
+    def put(self, stage, model_version, input_hash, value):
+        key = self.key(stage, model_version, input_hash)
+        with self._lock:
+            self._remember(key, value)
+        if self.max_disk_bytes:
+            self._write_disk(key, value)
+
+    def get_or_compute(self, stage, model_version, input_hash, compute):
+        """Return the cached result of `stage` for this input, or compute and cache it."""
+        value = self.get(stage, model_version, input_hash, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.put(stage, model_version, input_hash, value)
+        return value
+
+    def clear_memory(self):
+        with self._lock:
+            self._memory.clear()
+
+    def _remember(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _read_disk(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return _MISSING
+        except Exception:
+            # Truncated or from an incompatible version: drop it and recompute
+            self._remove(path)
+            return _MISSING
+        try:
+            os.utime(path)  # recency for eviction
+        except OSError:
+            pass
+        return value
+
+    def _write_disk(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            size = os.path.getsize(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._scan())
+            else:
+                self._disk_bytes += size
+            over = self._disk_bytes > self.max_disk_bytes
+        if over:
+            self.evict()
+
+    def _scan(self):
+        """(path, size, mtime) of every cached file."""
+        entries = []
+        if not os.path.isdir(self.folder):
+            return entries
+        for shard in os.scandir(self.folder):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue  # evicted by another worker meanwhile
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def evict(self):
+        """Delete least recently used files until the folder is under the low watermark."""
+        entries = sorted(self._scan(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_disk_bytes * DISK_LOW_WATERMARK
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            self._remove(path)
+            total -= size
+        with self._lock:
+            self._disk_bytes = total
+        return total
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+def create_stage_cache():
+    """Build the cache configured by KYC_CACHE_DIR / KYC_CACHE_MEMORY_ITEMS / KYC_CACHE_DISK_MB (0 disables disk)."""
+    return StageResultCache(
+        folder=os.environ.get('KYC_CACHE_DIR', DEFAULT_CACHE_DIR),
+        max_memory_items=int(os.environ.get('KYC_CACHE_MEMORY_ITEMS', MAX_MEMORY_ITEMS)),
+        max_disk_bytes=int(os.environ.get('KYC_CACHE_DISK_MB', MAX_DISK_BYTES // (1024 * 1024))) * 1024 * 1024
+    )
@@ -4,6 +4,30 @@ import easyocr
 import face_recognition
 import csv
 import os
+import threading
+from services.image_quality import ImageQualityService
+from services.face_pipeline import FacePipeline
+from services.kyc_cache import content_hash, create_stage_cache
+
+# Model versions are part of every cached stage result's key
+OCR_LANGUAGES = ['fr', 'en']
+OCR_MODEL_VERSION = f"easyocr-{easyocr.__version__}-{'+'.join(OCR_LANGUAGES)}-paragraph"
+FACE_MODEL_VERSION = f"face_recognition-{face_recognition.__version__}-hog-{FacePipeline.VERSION}"
+QUALITY_MODEL_VERSION = ImageQualityService.VERSION
+
+STAGE_CACHE = create_stage_cache()
+
+_reader = None
+_reader_lock = threading.Lock()
+
+def get_ocr_reader():
+    """The easyocr reader, loaded on first use only: cached stages never need it."""
+    global _reader
+    if _reader is None:
+        with _reader_lock:
+            if _reader is None:
+                _reader = easyocr.Reader(OCR_LANGUAGES)
+    return _reader
 
 class KYCResult:
     def __init__(self):
@@ -14,16 +38,65 @@ class KYCResult:
         self.details = {}
 
 class KYCChecker:
-    def __init__(self, user, documents, selfie, video=None):
+    def __init__(self, user, documents, selfie, video=None, cache=None):
         self.user = user
         self.documents = documents  # dict: {"id": ..., "proof_of_address": ...}
         self.selfie = selfie
         self.video = video
-        self.reader = easyocr.Reader(['fr', 'en'])
+        self.cache = cache or STAGE_CACHE
+        self.stages = {}  # stage -> 'cached' or 'computed', for this run
+
+    @staticmethod
+    def read_input(file):
+        """(bytes, content hash) of an uploaded file, or (None, None) when absent or empty."""
+        if not file:
+            return None, None
+        file.seek(0)
+        data = file.read()
+        file.seek(0)
+        if not data:
+            return None, None
+        return data, content_hash(data)
+
+    def _stage(self, name, model_version, input_hash, compute):
+        cached = True
+
+        def run():
+            nonlocal cached
+            cached = False
+            return compute()
+
+        value = self.cache.get_or_compute(name.split(':')[0], model_version, input_hash, run)
+        self.stages[name] = 'cached' if cached else 'computed'
+        return value
+
+    def ocr_text(self, data, input_hash, name='ocr'):
+        return self._stage(name, OCR_MODEL_VERSION, input_hash, lambda: get_ocr_reader().readtext(
+            np.frombuffer(data, dtype=np.uint8), detail=0, paragraph=True
+        ))
+
+    def face(self, data, input_hash, name='face'):
+        """(encoding, portrait box) of the main face, or (None, None).
+
+        The box is cached on its own, keyed by the detector settings only, so
+        an ID card's portrait is found once and reused even when the encoder
+        version changes.
+        """
+        def encode():
+            portrait = self.cache.get('portrait', FacePipeline.DETECTOR_VERSION, input_hash)
+            encoding, portrait = FacePipeline.encode(data, portrait)
+            if portrait:
+                self.cache.put('portrait', FacePipeline.DETECTOR_VERSION, input_hash, portrait)
+            return encoding, portrait
+
+        return self._stage(name, FACE_MODEL_VERSION, input_hash, encode)
+
+    def image_quality(self, data, input_hash, name='quality'):
+        return self._stage(name, QUALITY_MODEL_VERSION, input_hash, lambda: ImageQualityService.analyze_bytes(data))
 
     def run_all_checks(self):
         result = KYCResult()
-        result.scores['documents'] = self.check_documents()
+        result.scores['documents'] = self.check_documents(result)
         result.scores['personal'] = self.check_personal_data()
         result.scores['behavior'] = self.check_behavior()
         result.scores['aml'] = self.check_aml()
@@ -44,14 +117,20 @@ class KYCChecker:
             result.risk_level = "medium"
         else:
             result.risk_level = "high"
+        result.details['stages'] = self.stages
         return result
 
-    def check_documents(self):
+    def check_documents(self, result=None):
+        id_data, id_hash = self.read_input(self.documents.get('id'))
+        selfie_data, selfie_hash = self.read_input(self.selfie)
         # OCR sur la pièce d'identité
-        id_img = self.documents.get('id')
-        if id_img:
-            text = self.reader.readtext(np.array(bytearray(id_img.read()), dtype=np.uint8), detail=0, paragraph=True)
-            id_img.seek(0)
+        if id_data:
+            quality = self.image_quality(id_data, id_hash, 'quality:id')
+            if result is not None:
+                result.details['id_quality'] = quality['score']
+                if not quality['ok']:
+                    result.flags.append(f"id_quality: {quality['message']}")
+            text = self.ocr_text(id_data, id_hash, 'ocr:id')
             # Vérification de la présence de nom, prénom, date de naissance, etc.
             if any(self.user.last_name.lower() in t.lower() for t in text):
                 ocr_score = 1.0
@@ -60,17 +139,12 @@ class KYCChecker:
         else:
             ocr_score = 0.0
         # Face matching
-        selfie_img = self.selfie
-        if id_img and selfie_img:
-            id_img.seek(0)
-            selfie_img.seek(0)
+        if id_data and selfie_data:
             try:
-                id_face = face_recognition.load_image_file(id_img)
-                selfie_face = face_recognition.load_image_file(selfie_img)
-                id_enc = face_recognition.face_encodings(id_face)
-                selfie_enc = face_recognition.face_encodings(selfie_face)
-                if id_enc and selfie_enc:
-                    match = face_recognition.compare_faces([id_enc[0]], selfie_enc[0])[0]
+                id_enc, _ = self.face(id_data, id_hash, 'face:id')
+                selfie_enc, _ = self.face(selfie_data, selfie_hash, 'face:selfie')
+                if id_enc is not None and selfie_enc is not None:
+                    match = face_recognition.compare_faces([id_enc], selfie_enc)[0]
                     face_score = 1.0 if match else 0.0
                 else:
                     face_score = 0.0
@@ -0,0 +1,157 @@
+"""
+ICAO 9303 machine readable zone parsing with check-digit validation.
+
+Supports the two formats Algerian documents use:
+
+- TD1, 3 lines of 30 characters: the biometric national ID card (back side);
+- TD3, 2 lines of 44 characters: the passport.
+
+OCR output is normalised first (upper case, no spaces, '<' look-alikes),
+then every field is read by position. Digits and letters that OCR commonly
+swaps (O/0, I/1, S/5, B/8...) are corrected according to what the position
+must hold, and every check digit is verified; `valid` is only true when all
+of them match, which makes a misread MRZ very unlikely to pass.
+"""
+import re
+from datetime import date
+
+TD1_LENGTH = 30
+TD3_LENGTH = 44
+CHECK_WEIGHTS = (7, 3, 1)
+
+MRZ_LINE = re.compile(r'^[A-Z0-9<]{28,46}$')
+FILLER_LOOKALIKES = str.maketrans({'«': '<', '‹': '<', '(': '<', '[': '<', '{': '<'})
+TO_DIGIT = str.maketrans('OQDIL|ZSBGT', '00011125867')
+TO_LETTER = str.maketrans('01258', 'OIZSB')
+
+def check_digit(field):
+    """ICAO check digit: weighted sum of the character values (0-9, A=10..Z=35, < = 0) mod 10."""
+    total = 0
+    for i, char in enumerate(field):
+        if char.isdigit():
+            value = int(char)
+        elif 'A' <= char <= 'Z':
+            value = ord(char) - 55
+        else:
+            value = 0
+        total += value * CHECK_WEIGHTS[i % 3]
+    return str(total % 10)
+
+def _digits(field):
+    return field.translate(TO_DIGIT)
+
+def _letters(field):
+    return field.translate(TO_LETTER)
+
+def _date(yymmdd, future=False):
+    """YYMMDD to ISO. Birth dates are in the past; expiry dates in this century."""
+    if not yymmdd.isdigit():
+        return None
+    year, month, day = int(yymmdd[:2]), int(yymmdd[2:4]), int(yymmdd[4:])
+    if future:
+        year += 2000
+    else:
+        year += 2000 if year <= date.today().year % 100 else 1900
+    try:
+        return date(year, month, day).isoformat()
+    except ValueError:
+        return None
+
+def _names(field):
+    surname, _, given = _letters(field).strip('<').partition('<<')
+    return surname.replace('<', ' ').strip(), given.replace('<', ' ').strip()
+
+def _checked(checks, name, field, digit):
+    checks[name] = check_digit(field) == digit
+
+def find_mrz_lines(text):
+    """The MRZ lines of OCR output, as (format, lines), or (None, []) if there is none."""
+    candidates = []
+    for line in text.upper().translate(FILLER_LOOKALIKES).splitlines():
+        line = re.sub(r'\s+', '', line)
+        if MRZ_LINE.match(line) and '<' in line:
+            candidates.append(line)
+    # The MRZ is the last block of the document
+    for length, count, mrz_format in ((TD3_LENGTH, 2, 'TD3'), (TD1_LENGTH, 3, 'TD1')):
+        lines = [line for line in candidates if abs(len(line) - length) <= 2]
+        if len(lines) >= count:
+            # OCR sometimes drops or adds a trailing filler: pad or cut to the nominal length
+            return mrz_format, [line[:length].ljust(length, '<') for line in lines[-count:]]
+    return None, []
+
+def parse_td1(lines):
+    line1, line2, line3 = lines
+    checks = {}
+    number, number_check, optional1 = line1[5:14], line1[14], line1[15:30]
+    if number_check == '<' and '<' in optional1:
+        # Numbers longer than 9 characters continue in the optional data, check digit last
+        extra = optional1[:optional1.index('<')]
+        number, number_check = number + extra[:-1], extra[-1:]
+        optional1 = optional1[len(extra):]
+    birth = _digits(line2[0:6])
+    expiry = _digits(line2[8:14])
+    line2 = birth + _digits(line2[6]) + line2[7] + expiry + _digits(line2[14]) + line2[15:29] + _digits(line2[29])
+    _checked(checks, 'document_number', number, number_check)
+    _checked(checks, 'birth_date', birth, line2[6])
+    _checked(checks, 'expiry_date', expiry, line2[14])
+    _checked(checks, 'composite', line1[5:30] + line2[0:7] + line2[8:15] + line2[18:29], line2[29])
+    last_name, first_name = _names(line3)
+    return {
+        'format': 'TD1',
+        'document_code': line1[0:2].strip('<'),
+        'issuing_country': _letters(line1[2:5]),
+        'document_number': number.strip('<'),
+        'optional_data': optional1.strip('<'),
+        'birth_date': _date(birth),
+        'sex': line2[7].replace('<', 'X'),
+        'expiry_date': _date(expiry, future=True),
+        'nationality': _letters(line2[15:18]),
+        'optional_data_2': line2[18:29].strip('<'),
+        'last_name': last_name,
+        'first_name': first_name,
+        'checks': checks,
+        'valid': all(checks.values())
+    }
+
+def parse_td3(lines):
+    line1, line2 = lines
+    checks = {}
+    number = line2[0:9]
+    birth = _digits(line2[13:19])
+    expiry = _digits(line2[21:27])
+    line2 = (number + _digits(line2[9]) + line2[10:13] + birth + _digits(line2[19]) + line2[20]
+             + expiry + _digits(line2[27]) + line2[28:42] + _digits(line2[42]) + _digits(line2[43]))
+    _checked(checks, 'document_number', number, line2[9])
+    _checked(checks, 'birth_date', birth, line2[19])
+    _checked(checks, 'expiry_date', expiry, line2[27])
+    # An empty personal number may carry '<' or '0' as its check digit
+    personal_number = line2[28:42]
+    checks['personal_number'] = check_digit(personal_number) == line2[42] or (
+        personal_number.strip('<') == '' and line2[42] in '<0'
+    )
+    _checked(checks, 'composite', line2[0:10] + line2[13:20] + line2[21:43], line2[43])
+    last_name, first_name = _names(line1[5:44])
+    return {
+        'format': 'TD3',
+        'document_code': line1[0:2].strip('<'),
+        'issuing_country': _letters(line1[2:5]),
+        'document_number': number.strip('<'),
+        'nationality': _letters(line2[10:13]),
+        'birth_date': _date(birth),
+        'sex': line2[20].replace('<', 'X'),
+        'expiry_date': _date(expiry, future=True),
+        'personal_number': personal_number.strip('<'),
+        'last_name': last_name,
+        'first_name': first_name,
+        'checks': checks,
+        'valid': all(checks.values())
+    }
+
+PARSERS = {'TD1': parse_td1, 'TD3': parse_td3}
+
+def parse_mrz(text, formats=('TD1', 'TD3')):
+    """Parse the MRZ found in OCR text; returns a dict of fields (with 'valid') or None."""
+    mrz_format, lines = find_mrz_lines(text)
+    if mrz_format not in formats:
+        return None
+    return PARSERS[mrz_format](lines)
@@ -1,12 +1,15 @@
 from datetime import datetime, timedelta
 from flask import current_app
-from models import Notification, User
+from models import Notification, User, OutgoingEmail
 from extensions import db
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
 
+EMAIL_BATCH_SIZE = 100
+EMAIL_MAX_ATTEMPTS = 5
+
 class NotificationService:
     @staticmethod
     def create_notification(user_id, process_type, last_step):
@@ -113,4 +116,73 @@ class NotificationService:
     def mark_process_completed(notification):
         """Mark a process as completed."""
         notification.status = 'completed'
-        db.session.commit() 
\ No newline at end of file
+        db.session.commit()
+
+    @staticmethod
+    def queue_email(user, subject, body):
+        """Queue a plain-text email to a user, in the caller's transaction; it is only sent once committed."""
+        email = OutgoingEmail(user_id=user.id, recipient=user.email, subject=subject, body=body)
+        db.session.add(email)
+        return email
+
+    @staticmethod
+    def _smtp_connection():
+        server = smtplib.SMTP(current_app.config['MAIL_SERVER'], current_app.config['MAIL_PORT'], timeout=30)
+        if current_app.config['MAIL_USE_TLS']:
+            server.starttls()
+        if current_app.config['MAIL_USERNAME']:
+            server.login(current_app.config['MAIL_USERNAME'], current_app.config['MAIL_PASSWORD'])
+        return server
+
+    @staticmethod
+    def deliver_queued_emails(batch_size=EMAIL_BATCH_SIZE, max_attempts=EMAIL_MAX_ATTEMPTS):
+        """Send queued emails, batch_size at a time over a single SMTP connection; returns (sent, failed).
+
+        A message the server refuses is retried by later runs until it has
+        failed max_attempts times. If the server can't be reached the run
+        stops and everything stays queued. On PostgreSQL the rows of a batch
+        are locked with SKIP LOCKED, so several delivery workers can run.
+        """
+        sent = failed = last_id = 0
+        while True:
+            query = OutgoingEmail.query.filter(
+                OutgoingEmail.status == 'queued',
+                OutgoingEmail.id > last_id
+            ).order_by(OutgoingEmail.id).limit(batch_size)
+            if db.engine.dialect.name == 'postgresql':
+                query = query.with_for_update(skip_locked=True)
+            emails = query.all()
+            if not emails:
+                break
+            last_id = emails[-1].id
+
+            try:
+                server = NotificationService._smtp_connection()
+            except (smtplib.SMTPException, OSError) as e:
+                current_app.logger.error(f"Email delivery: SMTP server unavailable: {str(e)}")
+                db.session.rollback()
+                break
+            with server:
+                for email in emails:
+                    msg = MIMEText(email.body, 'plain')
+                    msg['From'] = current_app.config['MAIL_DEFAULT_SENDER']
+                    msg['To'] = email.recipient
+                    msg['Subject'] = email.subject
+                    try:
+                        server.send_message(msg)
+                    except smtplib.SMTPServerDisconnected as e:
+                        # The rest of the batch stays queued for the next run
+                        current_app.logger.error(f"Email delivery: connection lost: {str(e)}")
+                        break
+                    except smtplib.SMTPException as e:
+                        email.attempts += 1
+                        email.last_error = str(e)
+                        if email.attempts >= max_attempts:
+                            email.status = 'failed'
+                            failed += 1
+                        continue
+                    email.status = 'sent'
+                    email.sent_at = datetime.utcnow()
+                    sent += 1
+            db.session.commit()
+        return sent, failed
@@ -0,0 +1,142 @@
+"""
+Field extraction from PDF documents, one rasterized page at a time.
+
+Pages are rendered with PDFium in grayscale at OCR_DPI (Tesseract's sweet
+spot), capped at MAX_PAGE_PIXELS for oversized pages, and handed to the
+document type's extractor (services/document_extraction.EXTRACTORS):
+
+- lazily: page N+1 is only rendered if the fields the extractor requires
+  are still missing after page N, so a one-page ID scan or a statement whose
+  first page carries the address costs a single render and OCR;
+- in parallel for long documents: from PARALLEL_MIN_PAGES pages on, pages
+  go to a process pool (OCR is CPU-bound) in waves of one page per worker,
+  each worker opening the file and rendering only its own page; a wave is
+  only submitted if the previous ones left required fields missing.
+
+Either way at most one page per worker process is held in memory.
+
+PDFium is not thread-safe: every call made in this process (page counts in
+the upload check, sequential extraction, thumbnails) goes through
+_pdfium_lock. Pool workers are started with 'spawn', so they never inherit
+a forked copy of the library state or of that lock.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import pypdfium2 as pdfium
+from services.document_extraction import EXTRACTORS
+
+OCR_DPI = 300
+MAX_PAGE_PIXELS = 40_000_000  # ~A3 at 300 DPI; larger pages render at a lower DPI
+MAX_PAGES = 50
+PARALLEL_MIN_PAGES = 3
+PDF_WORKERS = int(os.environ.get('PDF_WORKERS', min(4, os.cpu_count() or 1)))
+
+_pool = None
+_pool_lock = threading.Lock()
+_pdfium_lock = threading.RLock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def page_count(source):
+    """Number of pages of a PDF given as a path or bytes."""
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            return len(pdf)
+        finally:
+            pdf.close()
+
+def render_page(pdf, index, dpi=OCR_DPI):
+    """One page of an open PdfDocument as a grayscale uint8 array."""
+    with _pdfium_lock:
+        page = pdf[index]
+        try:
+            width, height = page.get_size()  # points, 1/72 inch
+            scale = dpi / 72
+            if width * height * scale * scale > MAX_PAGE_PIXELS:
+                scale = (MAX_PAGE_PIXELS / (width * height)) ** 0.5
+            bitmap = page.render(scale=scale, grayscale=True)
+            try:
+                return bitmap.to_numpy().reshape(bitmap.height, bitmap.width).copy()
+            finally:
+                bitmap.close()
+        finally:
+            page.close()
+
+def render_document_page(source, index=0, dpi=OCR_DPI):
+    """Open a PDF (path or bytes), render one page and close it again."""
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(source)
+        try:
+            return render_page(pdf, index, dpi)
+        finally:
+            pdf.close()
+
+def iter_pages(file_path, dpi=OCR_DPI, start=0, stop=None):
+    """Yield (index, grayscale page) one page at a time; each page is dropped before the next renders.
+
+    The lock is only held inside each PDFium call, so other requests can
+    render between two pages (the OCR of a page runs without it).
+    """
+    with _pdfium_lock:
+        pdf = pdfium.PdfDocument(file_path)
+        pages = len(pdf)
+    try:
+        for index in range(start, min(stop or pages, pages)):
+            yield index, render_page(pdf, index, dpi)
+    finally:
+        with _pdfium_lock:
+            pdf.close()
+
+def extract_page(file_path, index, document_type):
+    """Extract one page; runs in a pool worker, which renders the page itself."""
+    gray = render_document_page(file_path, index)
+    # A rendered page is the document: no frame to crop it from
+    return EXTRACTORS[document_type].extract(gray, detect_region=False)
+
+def merge_page(data, page_data, fields):
+    """Keep each field from the first page that has it."""
+    for field in fields:
+        if data.get(field) is None and page_data.get(field) is not None:
+            data[field] = page_data[field]
+    if page_data.get('mrz') and not (data.get('mrz') or {}).get('valid'):
+        data['mrz'] = page_data['mrz']
+
+def extract_pdf(file_path, document_type):
+    """Fields of a PDF document; stops at the first page (or wave) that completes the required fields."""
+    extractor = EXTRACTORS[document_type]
+    pages = min(page_count(file_path), MAX_PAGES)
+    data = {field: None for field in extractor.fields}
+    data['mrz'] = None
+
+    def complete():
+        return all(data.get(field) is not None for field in extractor.required if field != 'name')
+
+    if pages < PARALLEL_MIN_PAGES or PDF_WORKERS < 2:
+        for index, gray in iter_pages(file_path, stop=pages):
+            merge_page(data, extractor.extract(gray, detect_region=False), extractor.fields)
+            data['pages_processed'] = index + 1
+            if complete():
+                break
+    else:
+        pool = _get_pool()
+        for start in range(0, pages, PDF_WORKERS):
+            wave = [pool.submit(extract_page, file_path, index, document_type)
+                    for index in range(start, min(start + PDF_WORKERS, pages))]
+            # Merged in page order, so earlier pages win as in the sequential path
+            for future in wave:
+                merge_page(data, future.result(), extractor.fields)
+            data['pages_processed'] = min(start + PDF_WORKERS, pages)
+            if complete():
+                break
+    if 'name' in extractor.fields:
+        data['name'] = ' '.join(part for part in (data.get('first_name'), data.get('last_name')) if part) or None
+    data['pages'] = pages
+    return data
@@ -0,0 +1,174 @@
+from models import Document, DocumentStatus, User, RiskLevel
+from extensions import db
+from datetime import datetime, timedelta
+from sqlalchemy import or_, update
+
+class ReviewQueueService:
+    """Queue of pending documents for reviewing agents, handed out under leases.
+
+    Order: documents are reviewed by review_due_at, their upload time moved
+    earlier by a head start for riskier applicants (RISK_HEADSTART). Risk
+    and age are folded into one column set at upload, so the next document
+    is the first entry of the (status, review_due_at) index, and a low-risk
+    document still overtakes high-risk ones uploaded long enough after it.
+
+    Leases: claiming a document records the agent and an expiry. Until then
+    no other agent is given it and verify_document refuses it to others;
+    the agent renews the lease while working and releases it when done (a
+    verification releases it too). An expired lease counts as free, so
+    documents abandoned by a closed browser come back by themselves;
+    release_expired() only clears the stale columns.
+
+    Claiming without contention:
+    - PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED on the first free row
+      in queue order: concurrent agents lock different rows and never wait
+      for each other.
+    - SQLite has no row locks: the first CLAIM_CANDIDATES free ids are read
+      from the index, and the first that a conditional UPDATE (lease still
+      free) manages to take is the claim; losing that race to another agent
+      just moves on to the next candidate.
+    """
+
+    LEASE_MINUTES = 15
+    MAX_LEASE_MINUTES = 120
+    CLAIM_CANDIDATES = 5
+    RISK_HEADSTART = {
+        RiskLevel.LOW: timedelta(0),
+        RiskLevel.MEDIUM: timedelta(hours=12),
+        RiskLevel.HIGH: timedelta(hours=48)
+    }
+
+    @staticmethod
+    def is_postgres():
+        return db.engine.dialect.name == 'postgresql'
+
+    @staticmethod
+    def due_at(uploaded_at, risk_level):
+        """Queue position of a document uploaded at uploaded_at by a user of this risk level."""
+        return uploaded_at - ReviewQueueService.RISK_HEADSTART.get(risk_level, timedelta(0))
+
+    @staticmethod
+    def lease_holder(document, now=None):
+        """Id of the agent holding a live lease on the document, or None."""
+        now = now or datetime.utcnow()
+        if document.lease_owner_id and document.lease_expires_at and document.lease_expires_at > now:
+            return document.lease_owner_id
+        return None
+
+    @staticmethod
+    def _available(query, now, agency_id=None):
+        query = query.filter(
+            Document.status == DocumentStatus.PENDING,
+            or_(Document.lease_expires_at.is_(None), Document.lease_expires_at <= now)
+        )
+        if agency_id is not None:
+            query = query.join(User, Document.user_id == User.id).filter(User.agency_id == agency_id)
+        return query.order_by(Document.review_due_at, Document.id)
+
+    @staticmethod
+    def _lease_minutes(lease_minutes):
+        return max(1, min(lease_minutes or ReviewQueueService.LEASE_MINUTES, ReviewQueueService.MAX_LEASE_MINUTES))
+
+    @staticmethod
+    def claim(agent_id, agency_id=None, lease_minutes=None):
+        """Lease the next document to review to an agent; returns it, or None if the queue is empty.
+
+        agency_id restricts the queue to applicants of one agency.
+        """
+        now = datetime.utcnow()
+        expires_at = now + timedelta(minutes=ReviewQueueService._lease_minutes(lease_minutes))
+
+        if ReviewQueueService.is_postgres():
+            document = ReviewQueueService._available(Document.query, now, agency_id).with_for_update(
+                of=Document, skip_locked=True
+            ).first()
+            if document is None:
+                db.session.rollback()
+                return None
+            document.lease_owner_id = agent_id
+            document.lease_expires_at = expires_at
+            db.session.commit()
+            return document
+
+        while True:
+            candidates = [
+                document_id for (document_id,) in ReviewQueueService._available(
+                    db.session.query(Document.id), now, agency_id
+                ).limit(ReviewQueueService.CLAIM_CANDIDATES)
+            ]
+            if not candidates:
+                return None
+            for document_id in candidates:
+                taken = db.session.execute(
+                    update(Document).where(
+                        Document.id == document_id,
+                        Document.status == DocumentStatus.PENDING,
+                        or_(Document.lease_expires_at.is_(None), Document.lease_expires_at <= now)
+                    ).values(lease_owner_id=agent_id, lease_expires_at=expires_at)
+                    .execution_options(synchronize_session=False)
+                ).rowcount
+                db.session.commit()
+                if taken:
+                    return db.session.get(Document, document_id, populate_existing=True)
+            # Every candidate went to other agents meanwhile: read the next ones
+
+    @staticmethod
+    def renew(document, agent_id, lease_minutes=None):
+        """Extend the agent's own live lease; False if the agent doesn't hold it (anymore)."""
+        if ReviewQueueService.lease_holder(document) != agent_id:
+            return False
+        document.lease_expires_at = datetime.utcnow() + timedelta(
+            minutes=ReviewQueueService._lease_minutes(lease_minutes)
+        )
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def release(document, agent_id=None):
+        """Give the document back to the queue; agent_id, if given, must hold the lease."""
+        if agent_id is not None and ReviewQueueService.lease_holder(document) not in (agent_id, None):
+            return False
+        document.lease_owner_id = None
+        document.lease_expires_at = None
+        db.session.commit()
+        return True
+
+    @staticmethod
+    def release_expired():
+        """Clear the lease columns of expired leases; returns how many were cleared."""
+        released = db.session.execute(
+            update(Document).where(
+                Document.lease_owner_id.isnot(None),
+                Document.lease_expires_at <= datetime.utcnow()
+            ).values(lease_owner_id=None, lease_expires_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+        db.session.commit()
+        return released
+
+    @staticmethod
+    def reprioritize(user_id=None):
+        """Recompute review_due_at of pending documents (of one user) after risk levels changed."""
+        query = db.session.query(Document, User.risk_level).join(User, Document.user_id == User.id).filter(
+            Document.status == DocumentStatus.PENDING
+        )
+        if user_id is not None:
+            query = query.filter(Document.user_id == user_id)
+        changed = 0
+        for document, risk_level in query:
+            due_at = ReviewQueueService.due_at(document.created_at, risk_level)
+            if document.review_due_at != due_at:
+                document.review_due_at = due_at
+                changed += 1
+        db.session.commit()
+        return changed
+
+    @staticmethod
+    def pending(agency_id=None, limit=50):
+        """The head of the queue, leased documents included, as (document, risk level) pairs."""
+        query = db.session.query(Document, User.risk_level).join(User, Document.user_id == User.id).filter(
+            Document.status == DocumentStatus.PENDING
+        )
+        if agency_id is not None:
+            query = query.filter(User.agency_id == agency_id)
+        return query.order_by(Document.review_due_at, Document.id).limit(limit).all()
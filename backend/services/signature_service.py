@@ -2,6 +2,7 @@ from models import User, ESignature
 from extensions import db
 from datetime import datetime
 from services.notification_service import NotificationService
+from tasks.analytics_task import schedule_analytics_refresh
 import json
 
 class SignatureService:
@@ -30,6 +31,7 @@ class SignatureService:
         )
         db.session.add(signature)
         db.session.commit()
+        schedule_analytics_refresh(user_id)
         
         # Send notification
         NotificationService.create_notification(
@@ -55,6 +57,7 @@ class SignatureService:
         signature.signature_data = json.dumps(signature_data)
         signature.signed_at = datetime.utcnow()
         db.session.commit()
+        schedule_analytics_refresh(user_id)
         
         # Send notification
         NotificationService.create_notification(
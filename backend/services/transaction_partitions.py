@@ -0,0 +1,537 @@
+from models import Transaction, TransactionPeriod, ArchivedActivity, Account, User
+from extensions import db
+from collections import defaultdict
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, text, Table, Column, MetaData, select, insert, delete, inspect
+import gzip
+import json
+import os
+
+class TransactionPartitionService:
+    """Monthly partitioning and archival of the transaction history.
+
+    PostgreSQL: "transaction" is a native range-partitioned table with one
+    partition per month (see the partitioning migration), so the planner
+    prunes date-range queries on its own. Closed months are exported to the
+    archive and their partition is detached and dropped.
+
+    SQLite: "transaction" only holds the hot window. Closed months are moved
+    into per-period tables (transaction_YYYY_MM), which emulate partitions,
+    and are later exported to the archive and dropped.
+
+    The archive is one gzip-compressed JSON-lines file per month. Every
+    closed period is recorded in TransactionPeriod, and the per-user totals
+    of archived months are kept in ArchivedActivity.
+    """
+
+    HOT_MONTHS = 3
+    ARCHIVE_AFTER_MONTHS = 12
+    DEFAULT_PARTITION = 'transaction_default'
+
+    @staticmethod
+    def is_postgres():
+        return db.engine.dialect.name == 'postgresql'
+
+    @staticmethod
+    def is_partitioned():
+        """Whether "transaction" is a native partitioned table."""
+        if not TransactionPartitionService.is_postgres():
+            return False
+        return db.session.execute(text(
+            "SELECT 1 FROM pg_partitioned_table WHERE partrelid = '\"transaction\"'::regclass"
+        )).first() is not None
+
+    @staticmethod
+    def period_of(moment):
+        return f'{moment.year:04d}-{moment.month:02d}'
+
+    @staticmethod
+    def shift_period(period, months):
+        year, month = (int(part) for part in period.split('-'))
+        index = year * 12 + (month - 1) + months
+        return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+    @staticmethod
+    def period_bounds(period):
+        """Half-open [start, end) datetime range covered by a period."""
+        start = datetime.strptime(period, '%Y-%m')
+        end = datetime.strptime(TransactionPartitionService.shift_period(period, 1), '%Y-%m')
+        return start, end
+
+    @staticmethod
+    def partition_name(period):
+        return 'transaction_' + period.replace('-', '_')
+
+    @staticmethod
+    def hot_window_start(hot_months=None):
+        """First period of the hot window, and the datetime it starts at."""
+        hot_months = hot_months or TransactionPartitionService.HOT_MONTHS
+        period = TransactionPartitionService.shift_period(
+            TransactionPartitionService.period_of(datetime.utcnow()), -(hot_months - 1)
+        )
+        return period, TransactionPartitionService.period_bounds(period)[0]
+
+    @staticmethod
+    def _period_table(period):
+        """Lightweight Table for a per-period table with the Transaction columns."""
+        return Table(
+            TransactionPartitionService.partition_name(period),
+            MetaData(),
+            *[Column(c.name, c.type, primary_key=c.primary_key) for c in Transaction.__table__.columns]
+        )
+
+    @staticmethod
+    def _periods_in_range(start, end):
+        """Periods overlapping [start, end); either bound may be None."""
+        query = TransactionPeriod.query
+        if end is not None:
+            query = query.filter(TransactionPeriod.period <= TransactionPartitionService.period_of(end))
+        if start is not None:
+            query = query.filter(TransactionPeriod.period >= TransactionPartitionService.period_of(start))
+        return query.order_by(TransactionPeriod.period).all()
+
+    @staticmethod
+    def _archive_folder():
+        folder = current_app.config.get('ARCHIVE_FOLDER') or os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'archive'
+        )
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def ensure_partitions(months_ahead=2):
+        """Create the native monthly partitions for the current and upcoming months.
+
+        Only applies to PostgreSQL once "transaction" has been converted into a
+        partitioned table; a no-op everywhere else.
+        """
+        if not TransactionPartitionService.is_partitioned():
+            return []
+
+        created = []
+        current = TransactionPartitionService.period_of(datetime.utcnow())
+        for offset in range(months_ahead + 1):
+            period = TransactionPartitionService.shift_period(current, offset)
+            start, end = TransactionPartitionService.period_bounds(period)
+            name = TransactionPartitionService.partition_name(period)
+            if db.session.execute(text('SELECT to_regclass(:name)'), {'name': name}).scalar() is not None:
+                continue
+            bounds = f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+
+            # Rows of a month without its partition went to the default partition,
+            # where they would make CREATE ... PARTITION OF fail: move them into a
+            # standalone table first, then attach it. Writers wait on the lock.
+            db.session.execute(text(f'LOCK TABLE {TransactionPartitionService.DEFAULT_PARTITION} IN EXCLUSIVE MODE'))
+            stray = db.session.execute(text(
+                f'SELECT EXISTS (SELECT 1 FROM {TransactionPartitionService.DEFAULT_PARTITION} '
+                'WHERE created_at >= :start AND created_at < :end)'
+            ), {'start': start, 'end': end}).scalar()
+            if stray:
+                db.session.execute(text(
+                    f'CREATE TABLE {name} (LIKE "transaction" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)'
+                ))
+                db.session.execute(text(
+                    f'INSERT INTO {name} SELECT * FROM {TransactionPartitionService.DEFAULT_PARTITION} '
+                    'WHERE created_at >= :start AND created_at < :end'
+                ), {'start': start, 'end': end})
+                db.session.execute(text(
+                    f'DELETE FROM {TransactionPartitionService.DEFAULT_PARTITION} '
+                    'WHERE created_at >= :start AND created_at < :end'
+                ), {'start': start, 'end': end})
+                db.session.execute(text(f'ALTER TABLE "transaction" ATTACH PARTITION {name} {bounds}'))
+            else:
+                db.session.execute(text(f'CREATE TABLE {name} PARTITION OF "transaction" {bounds}'))
+            # One transaction per month, so a failure leaves earlier months in place
+            db.session.commit()
+            created.append(name)
+        return created
+
+    @staticmethod
+    def close_periods(hot_months=None):
+        """Register (and on SQLite, move out of the hot table) months older than the hot window."""
+        cutoff, cutoff_start = TransactionPartitionService.hot_window_start(hot_months)
+
+        oldest = db.session.query(func.min(Transaction.created_at)).filter(
+            Transaction.created_at < cutoff_start
+        ).scalar()
+        if oldest is None:
+            return []
+
+        closed = []
+        period = TransactionPartitionService.period_of(oldest)
+        while period < cutoff:
+            start, end = TransactionPartitionService.period_bounds(period)
+            in_period = (Transaction.created_at >= start) & (Transaction.created_at < end)
+
+            row_count, total_volume, min_id, max_id = db.session.query(
+                func.count(Transaction.id), func.coalesce(func.sum(Transaction.amount), 0.0),
+                func.min(Transaction.id), func.max(Transaction.id)
+            ).filter(in_period).one()
+
+            registry = TransactionPeriod.query.filter_by(period=period).first()
+            if registry and (registry.storage != 'table' or TransactionPartitionService.is_postgres()):
+                # Already registered; on SQLite late rows are only appended to a live period table
+                row_count = 0
+
+            if row_count:
+                if TransactionPartitionService.is_postgres():
+                    # Rows already live in their native partition
+                    storage = 'partition'
+                else:
+                    storage = 'table'
+                    period_table = TransactionPartitionService._period_table(period)
+                    period_table.create(db.engine, checkfirst=True)
+                    db.session.execute(insert(period_table).from_select(
+                        [c.name for c in Transaction.__table__.columns],
+                        select(*Transaction.__table__.columns).where(in_period)
+                    ))
+                    db.session.execute(delete(Transaction.__table__).where(in_period))
+
+                if registry:
+                    registry.row_count = (registry.row_count or 0) + row_count
+                    registry.total_volume = (registry.total_volume or 0.0) + total_volume
+                    if registry.min_id is not None:
+                        registry.min_id = min(registry.min_id, min_id)
+                        registry.max_id = max(registry.max_id, max_id)
+                else:
+                    db.session.add(TransactionPeriod(
+                        period=period,
+                        storage=storage,
+                        table_name=TransactionPartitionService.partition_name(period),
+                        row_count=row_count,
+                        total_volume=total_volume,
+                        min_id=min_id,
+                        max_id=max_id
+                    ))
+                db.session.commit()
+                closed.append(period)
+
+            period = TransactionPartitionService.shift_period(period, 1)
+
+        return closed
+
+    @staticmethod
+    def archive_periods(archive_after_months=None):
+        """Export closed periods past the retention window to compressed cold storage."""
+        archive_after_months = archive_after_months or TransactionPartitionService.ARCHIVE_AFTER_MONTHS
+        cutoff = TransactionPartitionService.shift_period(
+            TransactionPartitionService.period_of(datetime.utcnow()), -archive_after_months
+        )
+
+        archived = []
+        for registry in TransactionPeriod.query.filter(
+            TransactionPeriod.storage.in_(['partition', 'table']),
+            TransactionPeriod.period <= cutoff
+        ).order_by(TransactionPeriod.period).all():
+            start, end = TransactionPartitionService.period_bounds(registry.period)
+            if registry.storage == 'partition':
+                source = Transaction.__table__
+                where = (source.c.created_at >= start) & (source.c.created_at < end)
+            else:
+                source = TransactionPartitionService._period_table(registry.period)
+                where = None
+
+            path = os.path.join(
+                TransactionPartitionService._archive_folder(),
+                f'{registry.table_name}.jsonl.gz'
+            )
+            statement = select(source) if where is None else select(source).where(where)
+            with gzip.open(path, 'wt', encoding='utf-8') as archive:
+                for row in db.session.execute(statement).mappings():
+                    archive.write(json.dumps({
+                        key: value.isoformat() if isinstance(value, datetime) else value
+                        for key, value in row.items()
+                    }) + '\n')
+
+            summary = select(
+                Account.user_id,
+                func.count(source.c.id),
+                func.coalesce(func.sum(source.c.amount), 0.0),
+                func.max(source.c.created_at)
+            ).join(source, source.c.account_id == Account.id).group_by(Account.user_id)
+            if where is not None:
+                summary = summary.where(where)
+            per_user = {user_id: (count, volume, last_activity)
+                        for user_id, count, volume, last_activity in db.session.execute(summary)}
+
+            # Late rows of a native partition never went through close_periods
+            id_range = select(func.min(source.c.id), func.max(source.c.id))
+            registry.min_id, registry.max_id = db.session.execute(
+                id_range if where is None else id_range.where(where)
+            ).one()
+
+            for user_id, (count, volume, last_activity) in per_user.items():
+                db.session.add(ArchivedActivity(
+                    period=registry.period,
+                    user_id=user_id,
+                    transaction_count=count,
+                    volume=volume,
+                    last_activity=last_activity
+                ))
+
+            has_partition = registry.storage == 'partition' and TransactionPartitionService.is_partitioned() \
+                and db.session.execute(text('SELECT to_regclass(:name)'), {'name': registry.table_name}).scalar()
+            if has_partition:
+                db.session.execute(text(f'ALTER TABLE "transaction" DETACH PARTITION {registry.table_name}'))
+                db.session.execute(text(f'DROP TABLE {registry.table_name}'))
+            elif registry.storage == 'partition':
+                db.session.execute(delete(source).where(where))
+            else:
+                db.session.execute(text(f'DROP TABLE {registry.table_name}'))
+
+            registry.storage = 'archive'
+            registry.archive_path = path
+            registry.archived_at = datetime.utcnow()
+            db.session.commit()
+            archived.append(registry.period)
+
+        return archived
+
+    @staticmethod
+    def _read_archive(path, account_ids, start, end):
+        rows = []
+        with gzip.open(path, 'rt', encoding='utf-8') as archive:
+            for line in archive:
+                row = json.loads(line)
+                if account_ids is not None and row['account_id'] not in account_ids:
+                    continue
+                for key in ('created_at', 'updated_at'):
+                    if row.get(key):
+                        row[key] = datetime.fromisoformat(row[key])
+                created_at = row.get('created_at')
+                if start is not None and (created_at is None or created_at < start):
+                    continue
+                if end is not None and (created_at is None or created_at >= end):
+                    continue
+                rows.append(row)
+        return rows
+
+    @staticmethod
+    def query_transactions(account_ids, start=None, end=None):
+        """Transactions of the given accounts in [start, end), across every storage tier.
+
+        Without a start only the hot window is listed; closed and archived
+        months are reached by asking for a range that covers them. Only the
+        tiers whose periods overlap the range are touched: a query inside the
+        hot window never opens a per-period table or an archive. Rows are
+        returned as dicts, most recent first.
+        """
+        account_ids = list(account_ids)
+        if not account_ids:
+            return []
+        if start is None:
+            _, start = TransactionPartitionService.hot_window_start()
+
+        table = Transaction.__table__
+        conditions = [table.c.account_id.in_(account_ids)]
+        if start is not None:
+            conditions.append(table.c.created_at >= start)
+        if end is not None:
+            conditions.append(table.c.created_at < end)
+        rows = [dict(row) for row in db.session.execute(select(table).where(*conditions)).mappings()]
+
+        for registry in TransactionPartitionService._periods_in_range(start, end):
+            if registry.storage == 'table':
+                period_table = TransactionPartitionService._period_table(registry.period)
+                conditions = [period_table.c.account_id.in_(account_ids)]
+                if start is not None:
+                    conditions.append(period_table.c.created_at >= start)
+                if end is not None:
+                    conditions.append(period_table.c.created_at < end)
+                rows.extend(
+                    dict(row) for row in db.session.execute(select(period_table).where(*conditions)).mappings()
+                )
+            elif registry.storage == 'archive' and registry.archive_path and os.path.exists(registry.archive_path):
+                rows.extend(TransactionPartitionService._read_archive(
+                    registry.archive_path, set(account_ids), start, end
+                ))
+            # 'partition' periods are still part of "transaction" and were covered above
+
+        rows.sort(key=lambda row: row['created_at'] or datetime.min, reverse=True)
+        return rows
+
+    @staticmethod
+    def day_range(start_date=None, end_date=None):
+        """[start, end) datetimes for 'YYYY-MM-DD' request parameters, the end day included."""
+        start = datetime.strptime(start_date, '%Y-%m-%d') if start_date else None
+        end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1) if end_date else None
+        return start, end
+
+    @staticmethod
+    def _existing_period_tables():
+        return set(inspect(db.engine).get_table_names())
+
+    @staticmethod
+    def get_transaction(transaction_id):
+        """One transaction by id as a dict, wherever it lives now, or None.
+
+        The hot table is tried first, then only the closed periods whose id
+        range covers the id (usually one): per-period tables before archive
+        files. Periods closed before id ranges were recorded have none until
+        record_id_ranges fills them in, and are probed for any id meanwhile.
+        """
+        table = Transaction.__table__
+        row = db.session.execute(select(table).where(table.c.id == transaction_id)).mappings().first()
+        if row is not None:
+            return dict(row)
+
+        registries = TransactionPeriod.query.filter(
+            TransactionPeriod.storage.in_(['table', 'archive']),
+            (TransactionPeriod.min_id.is_(None)) | (
+                (TransactionPeriod.min_id <= transaction_id) & (TransactionPeriod.max_id >= transaction_id)
+            )
+        ).order_by(TransactionPeriod.period.desc()).all()
+        if not registries:
+            return None
+        existing_tables = TransactionPartitionService._existing_period_tables()
+        for registry in registries:
+            if registry.storage == 'table' and registry.table_name in existing_tables:
+                period_table = TransactionPartitionService._period_table(registry.period)
+                row = db.session.execute(
+                    select(period_table).where(period_table.c.id == transaction_id)
+                ).mappings().first()
+                if row is not None:
+                    return dict(row)
+        for registry in registries:
+            if registry.storage == 'archive' and registry.archive_path and os.path.exists(registry.archive_path):
+                for row in TransactionPartitionService._read_archive(registry.archive_path, None, None, None):
+                    if row['id'] == transaction_id:
+                        return row
+        return None
+
+    @staticmethod
+    def record_id_ranges():
+        """Fill in the id range of closed periods registered before it was recorded."""
+        updated = []
+        existing_tables = TransactionPartitionService._existing_period_tables()
+        for registry in TransactionPeriod.query.filter(TransactionPeriod.min_id.is_(None)).all():
+            if registry.storage == 'partition':
+                start, end = TransactionPartitionService.period_bounds(registry.period)
+                registry.min_id, registry.max_id = db.session.query(
+                    func.min(Transaction.id), func.max(Transaction.id)
+                ).filter(Transaction.created_at >= start, Transaction.created_at < end).one()
+            elif registry.storage == 'table' and registry.table_name in existing_tables:
+                period_table = TransactionPartitionService._period_table(registry.period)
+                registry.min_id, registry.max_id = db.session.execute(
+                    select(func.min(period_table.c.id), func.max(period_table.c.id))
+                ).one()
+            elif registry.storage == 'archive' and registry.archive_path and os.path.exists(registry.archive_path):
+                ids = [row['id'] for row in TransactionPartitionService._read_archive(
+                    registry.archive_path, None, None, None
+                )]
+                if ids:
+                    registry.min_id, registry.max_id = min(ids), max(ids)
+            else:
+                continue
+            db.session.commit()
+            updated.append(registry.period)
+        return updated
+
+    @staticmethod
+    def summarize(user_filter=None, start=None, end=None, daily=False):
+        """Count and volume of transactions in [start, end) across every tier, as (count, volume, per_day).
+
+        user_filter: criterion on User selecting whose transactions count (an
+        agency...), None for everyone. per_day maps 'YYYY-MM-DD' to the volume
+        of that day and is only filled when daily is set.
+
+        Archived periods lying entirely inside the range come from the
+        ArchivedActivity totals unless per-day volumes are needed; only then,
+        or for a period the range cuts through, is the archive file read.
+        """
+        users = select(User.id)
+        accounts = select(Account.id).join(User, Account.user_id == User.id)
+        if user_filter is not None:
+            users = users.where(user_filter)
+            accounts = accounts.where(user_filter)
+
+        totals = {'count': 0, 'volume': 0.0}
+        per_day = defaultdict(float)
+
+        def add_table(table):
+            conditions = [table.c.account_id.in_(accounts)]
+            if start is not None:
+                conditions.append(table.c.created_at >= start)
+            if end is not None:
+                conditions.append(table.c.created_at < end)
+            day = func.date(table.c.created_at)
+            columns = [func.count(table.c.id), func.coalesce(func.sum(table.c.amount), 0.0)]
+            statement = select(*columns, day).where(*conditions).group_by(day) if daily \
+                else select(*columns).where(*conditions)
+            for row in db.session.execute(statement):
+                totals['count'] += row[0]
+                totals['volume'] += float(row[1])
+                if daily and row[2] is not None:
+                    per_day[str(row[2])] += float(row[1])
+
+        add_table(Transaction.__table__)
+
+        account_ids = None
+        existing_tables = TransactionPartitionService._existing_period_tables()
+        for registry in TransactionPartitionService._periods_in_range(start, end):
+            if registry.storage == 'table' and registry.table_name in existing_tables:
+                add_table(TransactionPartitionService._period_table(registry.period))
+            elif registry.storage == 'archive':
+                period_start, period_end = TransactionPartitionService.period_bounds(registry.period)
+                inside = (start is None or start <= period_start) and (end is None or period_end <= end)
+                if inside and not daily:
+                    count, volume = db.session.query(
+                        func.coalesce(func.sum(ArchivedActivity.transaction_count), 0),
+                        func.coalesce(func.sum(ArchivedActivity.volume), 0.0)
+                    ).filter(
+                        ArchivedActivity.period == registry.period,
+                        ArchivedActivity.user_id.in_(users)
+                    ).one()
+                    totals['count'] += count
+                    totals['volume'] += float(volume)
+                elif registry.archive_path and os.path.exists(registry.archive_path):
+                    if account_ids is None:
+                        account_ids = set(db.session.execute(accounts).scalars())
+                    for row in TransactionPartitionService._read_archive(
+                        registry.archive_path, account_ids, start, end
+                    ):
+                        totals['count'] += 1
+                        totals['volume'] += row['amount'] or 0.0
+                        if daily:
+                            per_day[row['created_at'].date().isoformat()] += row['amount'] or 0.0
+            # 'partition' periods are still part of "transaction" and were covered above
+
+        return totals['count'], totals['volume'], dict(sorted(per_day.items()))
+
+    @staticmethod
+    def cold_activity_by_user():
+        """Per-user (count, volume, last_activity) of everything outside the "transaction" table."""
+        totals = {}
+
+        def merge(user_id, count, volume, last_activity):
+            previous = totals.get(user_id, (0, 0.0, None))
+            latest = previous[2]
+            if last_activity is not None and (latest is None or last_activity > latest):
+                latest = last_activity
+            totals[user_id] = (previous[0] + count, previous[1] + float(volume or 0.0), latest)
+
+        for row in db.session.query(
+            ArchivedActivity.user_id,
+            func.sum(ArchivedActivity.transaction_count),
+            func.sum(ArchivedActivity.volume),
+            func.max(ArchivedActivity.last_activity)
+        ).group_by(ArchivedActivity.user_id):
+            merge(*row)
+
+        existing_tables = TransactionPartitionService._existing_period_tables()
+        for registry in TransactionPeriod.query.filter_by(storage='table').all():
+            if registry.table_name not in existing_tables:
+                continue
+            period_table = TransactionPartitionService._period_table(registry.period)
+            for row in db.session.execute(
+                select(
+                    Account.user_id,
+                    func.count(period_table.c.id),
+                    func.sum(period_table.c.amount),
+                    func.max(period_table.c.created_at)
+                ).join(period_table, period_table.c.account_id == Account.id).group_by(Account.user_id)
+            ):
+                merge(*row)
+
+        return totals
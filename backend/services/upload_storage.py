@@ -0,0 +1,160 @@
+from models import Document
+from flask import current_app
+from datetime import datetime, timedelta
+import hashlib
+import os
+import secrets
+import tempfile
+
+class UploadStorageService:
+    """Content-addressed storage for uploaded documents.
+
+    A file is stored once under its SHA-256, sharded two levels deep so no
+    directory grows past a few thousand entries:
+
+        <UPLOAD_FOLDER>/3f/a9/3fa9...c2.jpg
+
+    Uploads are streamed to a temporary file in the same folder while being
+    hashed, then renamed into place (atomic on one filesystem). Identical
+    re-uploads land on the existing file, and Document.content_hash lets the
+    results already computed for that content be found and reused.
+
+    Files no Document points to (rejected uploads, originals replaced by a
+    compacted copy) are not deleted by the request that stops using them: a
+    concurrent upload of the same content may be about to reference the
+    file. collect_unreferenced() deletes them once they have been left alone
+    for UNREFERENCED_GRACE, which every adopt restarts.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    INCOMING_FOLDER = '.incoming'
+    UNREFERENCED_GRACE = timedelta(hours=24)
+
+    @staticmethod
+    def root():
+        return current_app.config['UPLOAD_FOLDER']
+
+    @staticmethod
+    def path_for(content_hash, extension):
+        return os.path.join(
+            UploadStorageService.root(), content_hash[:2], content_hash[2:4], f'{content_hash}.{extension}'
+        )
+
+    @staticmethod
+    def store(stream, extension):
+        """Stream a file-like object to storage; returns (content_hash, path, size, created)."""
+        incoming = UploadStorageService.incoming_folder()
+
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as temp_file:
+                while True:
+                    chunk = stream.read(UploadStorageService.CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+                    size += len(chunk)
+
+            path, created = UploadStorageService.adopt(temp_path, extension, digest.hexdigest())
+            return digest.hexdigest(), path, size, created
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    @staticmethod
+    def incoming_folder():
+        """Scratch folder on the storage filesystem, so adopting a file is a rename."""
+        folder = os.path.join(UploadStorageService.root(), UploadStorageService.INCOMING_FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    @staticmethod
+    def adopt(temp_path, extension, content_hash):
+        """Move an already-hashed file from the incoming folder into place; returns (path, created)."""
+        path = UploadStorageService.path_for(content_hash, extension)
+        created = not os.path.exists(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Replaced even when present (same bytes): the fresh mtime restarts the
+        # grace period, and a file being discarded right now is put back
+        os.replace(temp_path, path)
+        return path, created
+
+    @staticmethod
+    def find_processed(content_hash, document_type=None):
+        """Most recent Document with this content (and type) whose results can be reused."""
+        query = Document.query.filter(
+            Document.content_hash == content_hash,
+            Document.quality_score.isnot(None)
+        )
+        if document_type:
+            query = query.filter(Document.document_type == document_type)
+        return query.order_by(Document.id.desc()).first()
+
+    @staticmethod
+    def is_referenced(path):
+        return Document.query.filter_by(file_path=path).first() is not None
+
+    @staticmethod
+    def discard_if_unreferenced(path, grace=None):
+        """Delete a stored file no Document points to and no upload adopted within the grace period.
+
+        The file is first renamed away, so an upload adopting the same content
+        from then on writes a new file; one that adopted it just before shows
+        as a recent mtime and the file is put back.
+        """
+        if UploadStorageService.is_referenced(path):
+            return False
+        discarded = os.path.join(UploadStorageService.incoming_folder(), f'discard-{secrets.token_hex(8)}')
+        try:
+            os.rename(path, discarded)
+        except FileNotFoundError:
+            return False
+        cutoff = datetime.utcnow() - (grace or UploadStorageService.UNREFERENCED_GRACE)
+        if datetime.utcfromtimestamp(os.path.getmtime(discarded)) >= cutoff or UploadStorageService.is_referenced(path):
+            os.replace(discarded, path)
+            return False
+        os.remove(discarded)
+        return True
+
+    @staticmethod
+    def collect_unreferenced(grace=None, batch_size=500):
+        """Delete stored files left unreferenced for the grace period; returns (files, bytes)."""
+        cutoff = (datetime.utcnow() - (grace or UploadStorageService.UNREFERENCED_GRACE)).timestamp()
+        root = UploadStorageService.root()
+        files = freed = 0
+
+        def collect(candidates):
+            nonlocal files, freed
+            referenced = {
+                path for (path,) in Document.query.with_entities(Document.file_path).filter(
+                    Document.file_path.in_(list(candidates))
+                )
+            }
+            for path, size in candidates.items():
+                if path not in referenced and UploadStorageService.discard_if_unreferenced(path, grace):
+                    files += 1
+                    freed += size
+
+        # Only the <xx>/<yy> shards: dot-folders hold incoming parts and thumbnails
+        candidates = {}
+        for first in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+            if len(first) != 2 or not os.path.isdir(os.path.join(root, first)):
+                continue
+            for second in sorted(os.listdir(os.path.join(root, first))):
+                shard = os.path.join(root, first, second)
+                if len(second) != 2 or not os.path.isdir(shard):
+                    continue
+                for entry in os.scandir(shard):
+                    stat = entry.stat()
+                    if entry.is_file() and stat.st_mtime < cutoff:
+                        candidates[os.path.join(root, first, second, entry.name)] = stat.st_size
+                if len(candidates) >= batch_size:
+                    collect(candidates)
+                    candidates = {}
+        if candidates:
+            collect(candidates)
+        return files, freed
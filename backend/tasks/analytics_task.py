@@ -0,0 +1,45 @@
+import threading
+import queue
+from extensions import db
+from services.analytics_service import AnalyticsService
+
+# Users whose analytics need recomputing, deduplicated while they wait
+_pending = queue.Queue()
+_queued_ids = set()
+_queued_lock = threading.Lock()
+_worker = None
+
+def schedule_analytics_refresh(*user_ids):
+    """Queue an asynchronous analytics refresh for the given users."""
+    for user_id in user_ids:
+        if user_id is None:
+            continue
+        with _queued_lock:
+            if user_id in _queued_ids:
+                continue
+            _queued_ids.add(user_id)
+        _pending.put(user_id)
+
+def _run_worker(app):
+    """Drain the refresh queue forever, one user at a time."""
+    while True:
+        user_id = _pending.get()
+        with _queued_lock:
+            _queued_ids.discard(user_id)
+        with app.app_context():
+            try:
+                AnalyticsService.refresh_user_analytics(user_id)
+            except Exception as e:
+                db.session.rollback()
+                app.logger.error(f"Failed to refresh analytics for user {user_id}: {str(e)}")
+            finally:
+                db.session.remove()
+        _pending.task_done()
+
+def start_analytics_worker(app):
+    """Start the background thread that recomputes user analytics."""
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run_worker, args=(app,), name='analytics-refresh', daemon=True)
+        _worker.start()
+    return _worker
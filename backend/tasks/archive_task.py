@@ -0,0 +1,14 @@
+from flask import current_app
+from services.transaction_partitions import TransactionPartitionService
+
+def archive_transactions():
+    """Create upcoming partitions, close months past the hot window and archive old ones."""
+    created = TransactionPartitionService.ensure_partitions()
+    closed = TransactionPartitionService.close_periods()
+    archived = TransactionPartitionService.archive_periods()
+    TransactionPartitionService.record_id_ranges()
+    current_app.logger.info(
+        f"Transaction archival: {len(created)} partition(s) ensured, "
+        f"closed {closed or 'none'}, archived {archived or 'none'}"
+    )
+    return closed, archived
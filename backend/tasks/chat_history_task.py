@@ -0,0 +1,87 @@
+import atexit
+import threading
+from datetime import datetime
+from flask import current_app
+from extensions import db
+from services.chat_history_service import ChatHistoryService
+
+# Turns waiting to be written; flushed when BATCH_SIZE accumulate or every
+# FLUSH_INTERVAL seconds, whichever comes first
+BATCH_SIZE = 50
+FLUSH_INTERVAL = 2.0
+MAX_BUFFERED = BATCH_SIZE * 20  # oldest turns are dropped beyond this (writer down or failing)
+
+_buffer = []
+_buffer_lock = threading.Lock()
+_flush_requested = threading.Event()
+_worker = None
+
+def record_chat_turn(user_id, user_input, bot_response, category, sentiment):
+    """Buffer one chatbot turn for the next batched insert."""
+    row = {
+        'user_key': str(user_id)[:64],
+        'user_input': user_input,
+        'bot_response': bot_response,
+        'category': category,
+        'sentiment': sentiment,
+        'created_at': datetime.utcnow()
+    }
+    with _buffer_lock:
+        _buffer.append(row)
+        if len(_buffer) > MAX_BUFFERED:
+            del _buffer[0]
+        full = len(_buffer) >= BATCH_SIZE
+    if full:
+        _flush_requested.set()
+
+def buffered_chat_turns(user_id):
+    """Turns of one user still waiting in this worker's buffer, oldest first."""
+    user_key = str(user_id)[:64]
+    with _buffer_lock:
+        return [dict(row) for row in _buffer if row['user_key'] == user_key]
+
+def flush_chat_history():
+    """Write every buffered turn in one batch. Needs an application context."""
+    global _buffer
+    with _buffer_lock:
+        rows, _buffer = _buffer, []
+    if not rows:
+        return 0
+    try:
+        return ChatHistoryService.insert_turns(rows)
+    except Exception as e:
+        db.session.rollback()
+        with _buffer_lock:
+            _buffer = (rows + _buffer)[-MAX_BUFFERED:]
+        current_app.logger.error(f"Failed to write {len(rows)} chat turn(s): {str(e)}")
+        return 0
+
+def _run_writer(app):
+    """Flush the buffer on every size trigger or interval tick, forever."""
+    while True:
+        _flush_requested.wait(FLUSH_INTERVAL)
+        _flush_requested.clear()
+        with app.app_context():
+            try:
+                flush_chat_history()
+            finally:
+                db.session.remove()
+
+def _flush_at_exit(app):
+    with app.app_context():
+        flush_chat_history()
+
+def start_chat_history_writer(app):
+    """Start the background thread that batches chat history inserts."""
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_run_writer, args=(app,), name='chat-history-writer', daemon=True)
+        _worker.start()
+        atexit.register(_flush_at_exit, app)
+    return _worker
+
+def prune_chat_history(retention_days=None):
+    """Delete chat turns older than the retention window."""
+    deleted = ChatHistoryService.prune(retention_days)
+    current_app.logger.info(f"Chat history pruning: {deleted} turn(s) deleted")
+    return deleted
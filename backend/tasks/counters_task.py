@@ -0,0 +1,12 @@
+from flask import current_app
+from services.analytics_service import AnalyticsService
+
+def reconcile_counters(repair=True):
+    """Detect and repair drift between User activity counters and Transaction."""
+    drifted = AnalyticsService.reconcile_activity_counters(repair=repair)
+    if drifted:
+        current_app.logger.warning(
+            f"Activity counters drifted for {len(drifted)} user(s)"
+            f"{' and were repaired' if repair else ''}: {drifted[:20]}"
+        )
+    return drifted
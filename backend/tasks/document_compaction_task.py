@@ -0,0 +1,12 @@
+from flask import current_app
+from services.document_storage import DocumentStorageService, ARCHIVE_AFTER_DAYS
+
+def compact_documents(archive_after_days=ARCHIVE_AFTER_DAYS):
+    """Thumbnail and re-encode reviewed documents, then move long-reviewed ones to the archive."""
+    compacted, compacted_saved = DocumentStorageService.compact_reviewed()
+    archived, archived_saved = DocumentStorageService.archive_cold(archive_after_days)
+    current_app.logger.info(
+        f"Document compaction: {compacted} file(s) compacted ({compacted_saved} bytes saved), "
+        f"{archived} archived ({archived_saved} bytes saved)"
+    )
+    return (compacted, compacted_saved), (archived, archived_saved)
@@ -0,0 +1,60 @@
+from flask import current_app
+from datetime import datetime
+from extensions import db
+from models import Document
+from services.perceptual_hash import compute_hashes, DocumentHashIndex, PHASH_RADIUS, DHASH_RADIUS
+from services.face_index import group_duplicates
+
+BACKFILL_BATCH_SIZE = 200
+
+def backfill_document_hashes(batch_size=BACKFILL_BATCH_SIZE):
+    """Compute the perceptual hashes of stored documents uploaded before they existed."""
+    hashed = last_id = 0
+    while True:
+        documents = Document.query.filter(
+            Document.phash.is_(None),
+            Document.id > last_id
+        ).order_by(Document.id).limit(batch_size).all()
+        if not documents:
+            break
+        for document in documents:
+            # PDFs and missing or unreadable files stay unhashed; the id cursor moves past them
+            document.phash, document.dhash = compute_hashes(document.file_path)
+            if document.phash is not None:
+                document.hashed_at = datetime.utcnow()
+                hashed += 1
+        last_id = documents[-1].id
+        db.session.commit()
+    current_app.logger.info(f"Document hash backfill: {hashed} document(s) hashed")
+    return hashed
+
+def sweep_duplicate_documents(phash_radius=PHASH_RADIUS, dhash_radius=DHASH_RADIUS):
+    """Pairs of documents of different users showing the same image, and their groups.
+
+    A pair is 'exact' when the files are identical and 'near' when only the
+    perceptual hashes match (re-encoded, cropped or edited copy).
+    """
+    index = DocumentHashIndex()
+    index.refresh()
+    documents = Document.query.with_entities(
+        Document.id, Document.user_id, Document.content_hash, Document.phash, Document.dhash
+    ).filter(Document.phash.isnot(None)).order_by(Document.id).all()
+
+    pairs = []
+    for document_id, user_id, content_hash, phash_hex, dhash_hex in documents:
+        for match in index.similar(phash_hex, dhash_hex, phash_radius, dhash_radius):
+            # Each pair once, and a user re-uploading their own document is not a duplicate
+            if match['document_id'] <= document_id or match['user_id'] == user_id:
+                continue
+            pairs.append({
+                'document_ids': [document_id, match['document_id']],
+                'user_ids': [user_id, match['user_id']],
+                'kind': 'exact' if match['content_hash'] == content_hash else 'near',
+                'phash_distance': match['phash_distance'],
+                'dhash_distance': match['dhash_distance']
+            })
+    groups = group_duplicates([(*pair['document_ids'], pair['phash_distance']) for pair in pairs])
+    current_app.logger.info(
+        f"Duplicate document sweep: {len(documents)} document(s), {len(pairs)} pair(s), {len(groups)} group(s)"
+    )
+    return pairs, groups
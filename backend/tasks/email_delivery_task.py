@@ -0,0 +1,9 @@
+from flask import current_app
+from services.notification_service import NotificationService
+
+def deliver_emails():
+    """Send the emails queued by the application (bulk verification updates...)."""
+    sent, failed = NotificationService.deliver_queued_emails()
+    if sent or failed:
+        current_app.logger.info(f"Email delivery: {sent} sent, {failed} failed for good")
+    return sent, failed
@@ -0,0 +1,12 @@
+from flask import current_app
+from services.face_index import get_face_index, group_duplicates, DUPLICATE_TOLERANCE
+
+def sweep_duplicate_faces(tolerance=DUPLICATE_TOLERANCE):
+    """Find every group of users whose registered faces match each other."""
+    face_index = get_face_index()
+    pairs = face_index.duplicate_pairs(tolerance)
+    groups = group_duplicates(pairs)
+    current_app.logger.info(
+        f"Duplicate face sweep: {len(face_index)} face(s), {len(pairs)} matching pair(s), {len(groups)} group(s)"
+    )
+    return pairs, groups
@@ -0,0 +1,11 @@
+from flask import current_app
+from services.review_queue import ReviewQueueService
+
+def maintain_review_queue():
+    """Clear expired review leases and reorder pending documents after risk level changes."""
+    released = ReviewQueueService.release_expired()
+    reprioritized = ReviewQueueService.reprioritize()
+    current_app.logger.info(
+        f"Review queue: {released} expired lease(s) cleared, {reprioritized} document(s) reprioritized"
+    )
+    return released, reprioritized
@@ -0,0 +1,18 @@
+from datetime import timedelta
+from flask import current_app
+from services.chunked_upload import ChunkedUploadService
+from services.upload_storage import UploadStorageService
+
+def collect_abandoned_uploads(older_than_hours=None):
+    """Expire chunked uploads left open too long and delete their partial files."""
+    older_than = timedelta(hours=older_than_hours) if older_than_hours else None
+    expired = ChunkedUploadService.collect_abandoned(older_than)
+    current_app.logger.info(f"Upload garbage collection: {expired} abandoned upload(s) expired")
+    return expired
+
+def collect_unreferenced_files(grace_hours=None):
+    """Delete stored files no document has referenced for the grace period."""
+    grace = timedelta(hours=grace_hours) if grace_hours else None
+    files, freed = UploadStorageService.collect_unreferenced(grace)
+    current_app.logger.info(f"Upload garbage collection: {files} unreferenced file(s) deleted, {freed} bytes freed")
+    return files, freed